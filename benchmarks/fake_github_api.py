@@ -0,0 +1,129 @@
+"""
+A local stand-in for the parts of the Github REST API used by GithubApiTagBackend
+    GET /repos/{owner}/{name}                           the repository (its "url" points back at this server)
+    GET /repos/{owner}/{name}/git/matching-refs/{ref}   the tag refs starting with a prefix, paginated with per_page/page
+                                                        and a Link rel="next" header. Sends an ETag and answers a matching
+                                                        If-None-Match with a 304
+Every response is delayed by the configured latency to stand in for the round trip, and the requests are counted.
+Usage:
+    with FakeGithubApi(tag_names, latency=0.05) as api:
+        GithubApiTagBackend(repository="bench/repo", base_url=api.url)
+"""
+
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+
+class FakeGithubApiHandler(BaseHTTPRequestHandler):
+
+    protocol_version = "HTTP/1.1"    # keep-alive, as api.github.com
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, body=None, headers=None):
+        data = json.dumps(body).encode() if body is not None else b""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        api = self.server.api
+        time.sleep(api.latency)
+        url = urlsplit(self.path)
+        # PyGitHub quotes the ref prefix (tags%2F), which Github decodes
+        parts = unquote(url.path).strip("/").split("/")
+        if len(parts) < 3 or parts[0] != "repos":
+            return self.send_json(404, {"message": "Not Found"})
+        repository = f"{parts[1]}/{parts[2]}"
+        repo_url = f"{api.url}/repos/{repository}"
+
+        if len(parts) == 3:
+            api.count("repo")
+            return self.send_json(200, {"full_name": repository, "name": parts[2], "url": repo_url}, api.rate_limit_headers())
+        if parts[3:5] != ["git", "matching-refs"]:
+            return self.send_json(404, {"message": "Not Found"})
+
+        prefix = "refs/" + "/".join(parts[5:])
+        query = parse_qs(url.query)
+        per_page = min(int(query.get("per_page", ["30"])[0]), api.max_per_page)
+        page = int(query.get("page", ["1"])[0])
+        refs = [ref for ref in api.refs if ref.startswith(prefix)]
+        page_refs = refs[(page - 1) * per_page:page * per_page]
+        body = [{"ref": ref, "url": f"{repo_url}/git/{ref}", "object": {"sha": api.sha, "type": "commit"}} for ref in page_refs]
+        etag = '"' + hashlib.sha1(json.dumps(body).encode()).hexdigest() + '"'
+        if self.headers.get("If-None-Match") == etag:
+            # conditional requests answered with a 304 don't count against the rate limit
+            api.count("not_modified")
+            return self.send_json(304, headers={"ETag": etag})
+
+        api.count("matching_refs")
+        headers = dict(api.rate_limit_headers(), ETag=etag)
+        if page * per_page < len(refs):
+            next_url = f"{api.url}{url.path}?per_page={per_page}&page={page + 1}"
+            headers["Link"] = f'<{next_url}>; rel="next"'
+        self.send_json(200, body, headers)
+
+
+class FakeGithubApi:
+
+    max_per_page = 100    # as the Github API
+    rate_limit = 5000
+
+    def __init__(self, tag_names=(), latency=0.0, host="127.0.0.1", port=0):
+        """
+        :param tag_names: The tag names in the repository, e.g, ["module1-0.0.1", ...]
+        :param latency: Seconds to wait before answering each request
+        :param port: Port to listen on. Defaults to any free port
+        """
+        self.refs = sorted(f"refs/tags/{tag_name}" for tag_name in tag_names)
+        self.latency = latency
+        self.sha = "0" * 40
+        self.server = ThreadingHTTPServer((host, port), FakeGithubApiHandler)
+        self.server.daemon_threads = True
+        self.server.api = self
+        self.url = f"http://{host}:{self.server.server_address[1]}"
+        self.thread = None
+        self.lock = threading.Lock()
+        self.counts = {}
+
+    def count(self, name):
+        with self.lock:
+            self.counts[name] = self.counts.get(name, 0) + 1
+
+    def get_counts(self):
+        """
+        :return: A dictionary of request type to the number of requests answered, with "total" (every request) and "rate_limited" (those that count against the rate limit)
+        """
+        with self.lock:
+            counts = dict(self.counts)
+        counts["total"] = sum(counts.values())
+        counts["rate_limited"] = counts["total"] - counts.get("not_modified", 0)
+        return counts
+
+    def rate_limit_headers(self):
+        remaining = max(self.rate_limit - self.get_counts()["rate_limited"], 0)
+        return {"X-RateLimit-Limit": str(self.rate_limit), "X-RateLimit-Remaining": str(remaining), "X-RateLimit-Reset": str(int(time.time()) + 3600)}
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
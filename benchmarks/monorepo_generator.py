@@ -0,0 +1,110 @@
+"""
+Generates a synthetic monorepo to benchmark against
+    modules/module0001/main.tf                  (optionally with module blocks using other modules)
+    modules/module0001/tests/<suite>/test.py    for each of the suites per module
+    refs/tags/module0001-0.0.1 ...              the tags per module, written with one git update-ref call
+and a head commit changing a number of files spread over the modules, so the base and head commits can be diffed.
+"""
+
+import logging
+import os
+import random
+import subprocess
+
+
+class MonorepoGenerator:
+
+    root = "modules"
+    suite_names = ["unit", "bdd", "integration", "e2e", "smoke", "performance"]    # names used for the first suites, then suite7, suite8, ...
+
+    def __init__(self, path, modules=100, suites=2, tags=5, changed_files=50, dependencies=0, seed=0):
+        """
+        :param path: Directory to create the repository in (must not already hold one)
+        :param modules: Number of modules
+        :param suites: Number of test suite directories per module
+        :param tags: Number of semver tags per module
+        :param changed_files: Number of files changed between the base and head commits
+        :param dependencies: Number of other modules each module uses through a module block
+        :param seed: Seed for the random choices, so the same shape always gives the same repository
+        """
+        self.path = path
+        self.modules = modules
+        self.suites = suites
+        self.tags = tags
+        self.changed_files = changed_files
+        self.dependencies = dependencies
+        self.random = random.Random(seed)
+        self.base = None
+        self.head = None
+        self.changed_paths = []
+        self.tag_names = []
+
+    def run_git(self, *args, input=None):
+        result = subprocess.run(["git", *args], cwd=self.path, input=input, capture_output=True, check=True)
+        return result.stdout.decode().strip()
+
+    def module_name(self, index):
+        return f"module{index:04d}"
+
+    def suite_name(self, index):
+        return self.suite_names[index] if index < len(self.suite_names) else f"suite{index + 1}"
+
+    def write_file(self, relative_path, content):
+        path = os.path.join(self.path, relative_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as fh:
+            fh.write(content)
+
+    def module_source(self, index):
+        """
+        The main.tf of a module, using a few of the modules before it
+        """
+        lines = [f'resource "null_resource" "{self.module_name(index)}" {{}}\n']
+        for dependency in sorted(self.random.sample(range(index), min(self.dependencies, index))):
+            lines.append(f'\nmodule "{self.module_name(dependency)}" {{\n  source = "../{self.module_name(dependency)}"\n}}\n')
+        return "".join(lines)
+
+    def generate(self):
+        """
+        Create the repository with its base commit, tags and head commit
+        :return: self, with base, head, changed_paths and tag_names set
+        """
+        os.makedirs(self.path, exist_ok=True)
+        self.run_git("init", "-q")
+        self.run_git("config", "user.email", "benchmark@example.com")
+        self.run_git("config", "user.name", "benchmark")
+        self.run_git("config", "commit.gpgsign", "false")
+
+        files = []
+        for index in range(self.modules):
+            module_path = f"{self.root}/{self.module_name(index)}"
+            self.write_file(f"{module_path}/main.tf", self.module_source(index))
+            files.append(f"{module_path}/main.tf")
+            for suite_index in range(self.suites):
+                test_path = f"{module_path}/tests/{self.suite_name(suite_index)}/test.py"
+                self.write_file(test_path, "")
+                files.append(test_path)
+        self.write_file("README.md", "Synthetic monorepo\n")
+        self.run_git("add", "-A")
+        self.run_git("commit", "-q", "-m", "chore: base")
+        self.base = self.run_git("rev-parse", "HEAD")
+
+        # Lightweight tags all at the base commit, created in one go rather than a git tag call each
+        updates = []
+        for index in range(self.modules):
+            for tag in range(self.tags):
+                tag_name = f"{self.module_name(index)}-0.{tag // 10}.{tag % 10 + 1}"
+                self.tag_names.append(tag_name)
+                updates.append(f"create refs/tags/{tag_name} {self.base}\n")
+        if updates:
+            self.run_git("update-ref", "--stdin", input="".join(updates).encode())
+
+        self.changed_paths = sorted(self.random.sample(files, min(self.changed_files, len(files))))
+        for path in self.changed_paths:
+            with open(os.path.join(self.path, path), "a") as fh:
+                fh.write("# changed\n")
+        self.run_git("add", "-A")
+        self.run_git("commit", "-q", "--allow-empty", "-m", "feat: change modules")
+        self.head = self.run_git("rev-parse", "HEAD")
+        logging.debug(f"MonorepoGenerator - {self.modules} module(s), {len(self.tag_names)} tag(s), {len(self.changed_paths)} changed file(s) in {self.path}")
+        return self
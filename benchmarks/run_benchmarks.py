@@ -0,0 +1,202 @@
+"""
+Benchmarks how the modules configuration scales, phase by phase, against a synthetic monorepo and a local fake Github API
+    python -m benchmarks.run_benchmarks --modules 1000 --suites 3 --tags 20 --changed-files 500 --latency 0.05
+Each phase reports its wall time, the Github API requests it made (and how many were 304s) and its peak traced memory.
+Memory is traced with tracemalloc, which slows Python code down, so use --no-memory for timings to compare with each other.
+Save a run with --json and pass it back with --baseline to fail (exit 1) when a phase got slower than the tolerance allows.
+"""
+
+import argparse
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from benchmarks.monorepo_generator import MonorepoGenerator
+from benchmarks.fake_github_api import FakeGithubApi
+from scripts.modules_config import ModulesConfig
+from scripts.tag_backends import GithubApiTagBackend, LocalGitTagBackend
+from scripts.tag_cache import TagCache
+
+
+class BenchmarkRunner:
+
+    repository = "bench/repo"
+    min_duration = 0.05    # seconds. Phases quicker than this aren't compared against the baseline, as they are mostly noise
+
+    def __init__(self, generator, api, trace_memory=True, tag_lookups=20):
+        """
+        :param generator: A generated MonorepoGenerator
+        :param api: A started FakeGithubApi serving the generator's tags
+        :param trace_memory: False to skip tracemalloc (peak memory isn't reported but the timings aren't slowed down)
+        :param tag_lookups: Number of changed modules looked up one at a time in the per module phase, as each is at least one API round trip
+        """
+        self.generator = generator
+        self.api = api
+        self.trace_memory = trace_memory
+        self.tag_lookups = tag_lookups
+        self.results = []
+
+    def measure(self, phase, func, *args, **kwargs):
+        """
+        Run one phase, recording its time, API requests and peak memory
+        :return: The phase's return value
+        """
+        counts = self.api.get_counts()
+        if self.trace_memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        try:
+            result = func(*args, **kwargs)
+        finally:
+            duration = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1] if self.trace_memory else None
+            if self.trace_memory:
+                tracemalloc.stop()
+        after = self.api.get_counts()
+        self.results.append({
+            "phase": phase,
+            "seconds": round(duration, 4),
+            "api_calls": after["total"] - counts["total"],
+            "not_modified": after.get("not_modified", 0) - counts.get("not_modified", 0),
+            "peak_kib": round(peak / 1024, 1) if peak is not None else None,
+        })
+        return result
+
+    def api_backend(self, cache_path=None):
+        return GithubApiTagBackend(repository=self.repository, base_url=self.api.url, cache=TagCache(cache_path) if cache_path else None)
+
+    def new_app(self, tag_backend=None):
+        return ModulesConfig(tag_backend=tag_backend)
+
+    def run(self):
+        """
+        Run every phase in the generated repository
+        :return: The list of phase results
+        """
+        generator = self.generator
+        files_string = " ".join(generator.changed_paths)
+
+        self.measure("build_modules_config (files)", self.new_app().build_modules_config, files_string, "MODULES_CONFIG", versions=False)
+        # warm: the suite manifest and dependency graph are now cached on disk
+        self.measure("build_modules_config (files, warm)", self.new_app().build_modules_config, files_string, "MODULES_CONFIG", versions=False)
+        app = self.new_app()
+        self.measure("build_modules_config (commits)", app.build_modules_config_from_commits, generator.base, generator.head, versions=False)
+        changed_modules = app.modules_config.get_modules()
+
+        module_paths = [f"{generator.root}/{generator.module_name(index)}/tests" for index in range(generator.modules)]
+        tests_app = self.new_app()
+        self.measure("get_tests_list (every module)", lambda: [tests_app.get_tests_list(path) for path in module_paths])
+
+        api_app = self.new_app(self.api_backend())
+        self.measure(f"get_modules_tag (api, {len(changed_modules[:self.tag_lookups])} modules)", lambda: [api_app.get_modules_tag(module) for module in changed_modules[:self.tag_lookups]])
+        self.measure("get_modules_tags (api)", self.new_app(self.api_backend()).get_modules_tags, changed_modules)
+        cache_path = os.path.join(".modules_cache", "benchmark_tags.json")
+        self.measure("get_modules_tags (api, cold cache)", self.new_app(self.api_backend(cache_path)).get_modules_tags, changed_modules)
+        self.measure("get_modules_tags (api, warm cache)", self.new_app(self.api_backend(cache_path)).get_modules_tags, changed_modules)
+        self.measure("get_modules_tags (local)", self.new_app(LocalGitTagBackend()).get_modules_tags, changed_modules)
+
+        versions_app = self.new_app(LocalGitTagBackend())
+        self.measure("build_modules_config (versions)", versions_app.build_modules_config_from_commits, generator.base, generator.head)
+        self.measure("build_tests_matrix_config", versions_app.build_tests_matrix_config)
+
+        # what each matrix job does: read its own module's configuration, from the MODULES_CONFIG json or from a snapshot
+        modules_config_json = json.dumps(versions_app.modules_config.to_list())
+        snapshot_json = json.dumps({"format": "snapshot", "path": versions_app.write_snapshot(os.path.join(".modules_cache", "benchmark.snap"))})
+        module = changed_modules[-1] if changed_modules else generator.module_name(0)
+        self.measure("get_module (json)", lambda: ModulesConfig(modules_config_json).get_module(module))
+        self.measure("get_module (snapshot)", lambda: ModulesConfig(snapshot_json).get_module(module))
+        return self.results
+
+
+def format_table(results):
+    lines = [f"{'phase':<40} {'seconds':>9} {'api calls':>10} {'304s':>6} {'peak KiB':>10}"]
+    for result in results:
+        peak = "-" if result["peak_kib"] is None else f"{result['peak_kib']:.1f}"
+        lines.append(f"{result['phase']:<40} {result['seconds']:>9.4f} {result['api_calls']:>10} {result['not_modified']:>6} {peak:>10}")
+    return "\n".join(lines)
+
+
+def compare_with_baseline(results, baseline, tolerance):
+    """
+    :return: A list of messages for the phases that are slower than the baseline by more than the tolerance
+    """
+    baseline_seconds = dict((result["phase"], result["seconds"]) for result in baseline["results"])
+    regressions = []
+    for result in results:
+        previous = baseline_seconds.get(result["phase"])
+        if previous is None or max(previous, result["seconds"]) < BenchmarkRunner.min_duration:
+            continue
+        if result["seconds"] > previous * (1 + tolerance):
+            regressions.append(f"{result['phase']}: {result['seconds']:.4f}s, baseline {previous:.4f}s")
+    return regressions
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.run_benchmarks")
+    parser.add_argument("--modules", type=int, default=200, help="number of modules")
+    parser.add_argument("--suites", type=int, default=2, help="test suites per module")
+    parser.add_argument("--tags", type=int, default=5, help="semver tags per module")
+    parser.add_argument("--changed-files", type=int, default=100, help="files changed between the base and head commits")
+    parser.add_argument("--dependencies", type=int, default=0, help="other modules each module uses through a module block")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds the fake Github API waits before each response")
+    parser.add_argument("--per-page", type=int, default=100, help="largest page size the fake Github API returns")
+    parser.add_argument("--tag-lookups", type=int, default=20, help="changed modules looked up one at a time in the get_modules_tag phase")
+    parser.add_argument("--no-memory", action="store_true", help="don't trace memory (tracemalloc slows the phases down)")
+    parser.add_argument("--json", help="also write the results to this file")
+    parser.add_argument("--baseline", help="results of an earlier run (--json) to compare the timings with")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="fraction a phase may be slower than the baseline before it counts as a regression")
+    parser.add_argument("--keep", action="store_true", help="keep the generated repository and print its path")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    # quiet unless asked for, so the logging doesn't dominate the timings. ModulesConfig leaves an existing setup alone
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s %(name)s %(levelname)s: %(message)s")
+    for env_var in ("MODULES_CONFIG", "GITHUB_OUTPUT", "MODULES_CONFIG_TAG_BACKEND", "MODULES_CONFIG_MATRIX_SHARDS"):
+        os.environ.pop(env_var, None)
+    # only ever sent to the fake API
+    os.environ.setdefault("GH_TOKEN", "benchmark")
+
+    cwd = os.getcwd()
+    temp_dir = tempfile.mkdtemp(prefix="modules_benchmark_")
+    try:
+        generator = MonorepoGenerator(
+            os.path.join(temp_dir, "repo"), modules=args.modules, suites=args.suites, tags=args.tags,
+            changed_files=args.changed_files, dependencies=args.dependencies,
+        )
+        start = time.perf_counter()
+        generator.generate()
+        print(f"generated {args.modules} module(s), {len(generator.tag_names)} tag(s), {len(generator.changed_paths)} changed file(s) in {time.perf_counter() - start:.1f}s")
+
+        FakeGithubApi.max_per_page = args.per_page
+        with FakeGithubApi(generator.tag_names, latency=args.latency) as api:
+            os.chdir(generator.path)
+            results = BenchmarkRunner(generator, api, trace_memory=not args.no_memory, tag_lookups=args.tag_lookups).run()
+    finally:
+        os.chdir(cwd)
+        if args.keep:
+            print(f"repository kept in {generator.path}")
+        else:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    print(format_table(results))
+    if args.json:
+        with open(args.json, "w") as fh:
+            json.dump({"arguments": vars(args), "results": results}, fh, indent=2)
+    if args.baseline:
+        with open(args.baseline) as fh:
+            regressions = compare_with_baseline(results, json.load(fh), args.tolerance)
+        for regression in regressions:
+            print(f"regression - {regression}")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,204 @@
+"""
+Single entry point for building the modules configuration and tests matrix
+    python -m scripts detect   --base <sha> --head <sha>     # changed modules and their tests (no versions)
+    python -m scripts versions --base <sha> --head <sha>     # as detect, plus the current and next versions of each module
+    python -m scripts matrix                                 # tests matrix from the MODULES_CONFIG environment variable (or --modules-config)
+    python -m scripts all      --base <sha> --head <sha>     # versions and the matrix in one pass, written to GITHUB_OUTPUT together
+    python -m scripts batch    --targets <file> [--report <file>]    # the configuration and matrix of many repositories at once (see batch_mode.py)
+    python -m scripts run      [--base <sha>] [--matrix <json|file>]  # run the tests matrix locally (see matrix_executor.py)
+    python -m scripts watch    [--base <sha>] [--interval <seconds>]  # keep the working tree's changed modules and matrix up to date (see watch_mode.py)
+    python -m scripts query    [state|modules|config|matrix]          # ask a running watcher
+    python -m scripts config                                 # the MODULES_CONFIG environment variable (or --modules-config) as a plain json list, e.g, for jq
+
+The changed files can be given instead of commits with --files "<space separated paths>" or --files-from <file|-> [-z].
+Outputs go to GITHUB_OUTPUT when running in Github Actions, otherwise they are printed.
+With --snapshot the configuration is also written to an indexed file the matrix jobs read single modules from (see config_snapshot.py).
+The time spent in each phase and the Github API calls made are written to a metrics json file and the job summary (see instrumentation.py).
+PyGitHub and semver are only imported by the subcommands that resolve versions.
+"""
+
+import argparse
+import json
+import sys
+from scripts.modules_config import ModulesConfig
+from scripts.batch_mode import BatchRunner
+from scripts.matrix_executor import MatrixExecutor
+from scripts.instrumentation import Metrics
+from scripts.watch_mode import ModulesWatcher, query
+
+
+app_commands = ("detect", "versions", "matrix", "all", "run", "config")    # the subcommands working on a ModulesConfig built from the arguments
+
+
+def add_changes_arguments(parser):
+    """
+    Arguments saying what changed: two commits or a list of changed files
+    """
+    parser.add_argument("--base", help="the base commit sha, e.g, github.event.before or HEAD^1 for a pull request")
+    parser.add_argument("--head", help="the head commit sha, e.g, github.event.after. Defaults to HEAD when --base is given")
+    parser.add_argument("-f", "--files", help="string of space separated file paths that have been updated")
+    parser.add_argument("--files-from", help="read the updated file paths from a file, or from stdin if '-'. One path per line unless -z is used")
+    parser.add_argument("-z", "--null", action="store_true", help="the paths read with --files-from are NUL separated, e.g, the output of git diff --name-only -z")
+    parser.add_argument("--snapshot", help="also write the configuration to this indexed snapshot file, for the matrix jobs to read single modules from (see config_snapshot.py)")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python -m scripts")
+    parser.add_argument("-v", "--verbose", action="store_true", help="also output the logging to the screen")
+    parser.add_argument("--log-level", help="logging level, e.g, DEBUG, INFO or WARNING. Defaults to MODULES_CONFIG_LOG_LEVEL, otherwise INFO")
+    parser.add_argument("--modules-config", help="a prebuilt modules configuration (json) to use instead of working one out")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    add_changes_arguments(subparsers.add_parser("detect", help="build the modules configuration without versions"))
+    add_changes_arguments(subparsers.add_parser("versions", help="build the modules configuration including the module versions"))
+    matrix_parser = subparsers.add_parser("matrix", help="build the tests matrix from an existing modules configuration")
+    matrix_parser.add_argument("--shards", type=int, help="pack the module tests into this many shards balanced by expected duration")
+    all_parser = subparsers.add_parser("all", help="build the modules configuration including versions and then the tests matrix")
+    add_changes_arguments(all_parser)
+    all_parser.add_argument("--shards", type=int, help="pack the module tests into this many shards balanced by expected duration")
+    batch_parser = subparsers.add_parser("batch", help="build the configuration and tests matrix of many repositories in one process")
+    batch_parser.add_argument("--targets", required=True, help="json file listing the repositories, see batch_mode.py")
+    batch_parser.add_argument("--report", help="write the combined report to this file rather than printing it")
+    batch_parser.add_argument("--concurrency", type=int, help="number of repositories worked on at once. Defaults to MODULES_CONFIG_BATCH_CONCURRENCY, otherwise 8")
+    batch_parser.add_argument("--no-versions", action="store_true", help="leave out the module versions (no tag lookups)")
+    run_parser = subparsers.add_parser("run", help="run the tests matrix locally, by default the one for the working tree changes")
+    run_parser.add_argument("--base", default="HEAD", help="the commit the working tree changes are taken against. Defaults to HEAD")
+    run_parser.add_argument("--matrix", help="a tests matrix to run instead (json, a file holding it, or '-' for stdin), e.g, the TESTS_MATRIX_OUTPUT of a CI run")
+    run_parser.add_argument("-j", "--jobs", type=int, help="number of suites run at once. Defaults to the number of CPUs")
+    run_parser.add_argument("--fail-fast", action="store_true", help="cancel the remaining suites once one fails")
+    run_parser.add_argument("--command", dest="test_command", help="command template a suite is run with, e.g, 'pytest -q {path}'. Defaults to MODULES_CONFIG_TEST_COMMAND, otherwise each test*.py file is run with Python")
+    run_parser.add_argument("--report", help="also write the aggregated result (json) to this file")
+    watch_parser = subparsers.add_parser("watch", help="keep the changed modules, their tests and the tests matrix of the working tree up to date")
+    watch_parser.add_argument("--base", default="HEAD", help="the commit the working tree changes are taken against. Defaults to HEAD")
+    watch_parser.add_argument("--interval", type=float, default=1.0, help="seconds between polls. Defaults to 1")
+    watch_parser.add_argument("--state-file", help=f"file the state is written to, an empty string for none. Defaults to {ModulesWatcher.default_state_path}")
+    watch_parser.add_argument("--socket", help=f"unix socket queries are answered on, an empty string for none. Defaults to {ModulesWatcher.default_socket_path}")
+    watch_parser.add_argument("--once", action="store_true", help="poll once, write the state and exit")
+    query_parser = subparsers.add_parser("query", help="ask a running watcher for its state, or read its state file")
+    query_parser.add_argument("what", nargs="?", default="state", choices=ModulesWatcher.queries, help="what to return. Defaults to state")
+    query_parser.add_argument("--state-file", help=f"the watcher's state file. Defaults to {ModulesWatcher.default_state_path}")
+    query_parser.add_argument("--socket", help=f"the watcher's unix socket. Defaults to {ModulesWatcher.default_socket_path}")
+    subparsers.add_parser("config", help="print an existing modules configuration in the plain list format, whichever output format it was passed in (see config_payload.py)")
+    return parser
+
+
+def build_modules_config(app, args, versions):
+    """
+    Build the modules configuration from whichever changes were supplied
+    """
+    if args.base:
+        return app.build_modules_config_from_commits(args.base, args.head, "MODULES_CONFIG", versions=versions)
+    if args.files_from:
+        return app.build_modules_config_from_stream(args.files_from, "MODULES_CONFIG", args.null, versions=versions)
+    if args.files is not None:
+        return app.build_modules_config(args.files, "MODULES_CONFIG", versions=versions)
+    raise SystemExit(f"{args.command}: supply --base (and --head), --files or --files-from")
+
+
+def run_batch(args):
+    """
+    Work on every repository listed in the targets file and write (or print) the combined report
+    :return: The exit code, 1 if any repository failed
+    """
+    runner = BatchRunner(BatchRunner.load_targets(args.targets), concurrency=args.concurrency, versions=not args.no_versions)
+    report = runner.run()
+    if args.report:
+        runner.write_report(report, args.report)
+        print(json.dumps(report["summary"]))
+    else:
+        print(json.dumps(report))
+    return 1 if report["summary"]["failed"] else 0
+
+
+def read_matrix(value):
+    """
+    :param value: The matrix json, a file holding it or '-' for stdin
+    """
+    if value == "-":
+        return json.load(sys.stdin)
+    if value.lstrip().startswith("{"):
+        return json.loads(value)
+    with open(value) as fh:
+        return json.load(fh)
+
+
+def run_matrix(app, args):
+    """
+    Run the tests matrix locally and print the aggregated result
+    :return: The exit code, 1 if a suite failed or was cancelled. Suites with no tests to run are reported as skipped, not as a failure
+    """
+    executor = MatrixExecutor(app, max_workers=args.jobs, fail_fast=args.fail_fast, command=args.test_command)
+    matrix = read_matrix(args.matrix) if args.matrix else executor.build_matrix(args.base)
+    if not matrix:
+        print("No module tests to run")
+        return 0
+    result = executor.run(matrix)
+    if args.report:
+        with open(args.report, "w") as fh:
+            json.dump(result, fh, indent=2)
+    print(json.dumps({"result": result["result"], "counts": result["counts"], "duration": result["duration"]}))
+    return 0 if result["result"] in ("success", "skipped") else 1
+
+
+def run_watch(args):
+    """
+    Watch the working tree until interrupted (or for a single poll with --once)
+    """
+    def app_factory():
+        # the metrics of a long running watcher aren't written out
+        return ModulesConfig(args.modules_config or [], log_level=args.log_level, metrics=Metrics(path=""))
+    watcher = ModulesWatcher(app_factory, base=args.base, interval=args.interval, state_path=args.state_file,
+                             socket_path="" if args.once else args.socket)
+    if args.once:
+        watcher.poll()
+        print(json.dumps(watcher.answer("state")))
+    else:
+        watcher.run()
+    return 0
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    # batch, watch and query build their own ModulesConfig (or none at all)
+    app = ModulesConfig(args.modules_config or [], log_level=args.log_level) if args.command in app_commands else None
+    if app is None:
+        ModulesConfig.setup_logging(args.log_level)
+    if args.verbose:
+        ModulesConfig.output_logging(args.log_level)
+    if args.command == "batch":
+        return run_batch(args)
+    if args.command == "run":
+        return run_matrix(app, args)
+    if args.command == "watch":
+        return run_watch(args)
+    if args.command == "query":
+        try:
+            print(json.dumps(query(args.what, socket_path=args.socket, state_path=args.state_file)))
+        except (OSError, ValueError) as e:
+            raise SystemExit(f"query: {e}")
+        return 0
+    if args.command == "config":
+        print(json.dumps(app.get_modules_config().to_list()))
+        return 0
+
+    if args.command == "all":
+        # pipeline mode: both outputs are written to GITHUB_OUTPUT in one go once everything has been worked out
+        app.buffer_outputs()
+    outputs = []
+    if args.command in ("detect", "versions", "all"):
+        outputs.append(build_modules_config(app, args, versions=args.command != "detect"))
+        if args.snapshot:
+            app.write_snapshot(args.snapshot)
+    if args.command in ("matrix", "all"):
+        outputs.append(app.build_tests_matrix_config(args.shards))
+    if args.command == "all":
+        app.write_outputs()
+    app.write_metrics()
+    # Nothing is returned when the outputs were written to GITHUB_OUTPUT
+    for output in outputs:
+        if output is not None:
+            print(output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
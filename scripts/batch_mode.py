@@ -0,0 +1,150 @@
+"""
+Builds the modules configuration and tests matrix for many repositories from one process
+The targets are read from a json file, e.g,
+    [
+        {"repository": "org/networking", "path": "checkouts/networking", "base": "<sha>", "head": "<sha>"},
+        {"repository": "org/platform", "path": "checkouts/platform", "files": "modules/vpc/main.tf",
+         "base_url": "https://github.example.com/api/v3"}
+    ]
+    repository  owner/name, used for the Github API tag lookups
+    path        the local checkout of the repository
+    base, head  the commits to compare. Or "files" (a string of space separated paths) to give the changed files instead
+    base_url    optional Github Enterprise API url. Defaults to api.github.com
+    tag_backend optional "local", "api" or "auto" (the default, see tag_backends.select_tag_backend)
+The targets are worked on concurrently. Every repository on the same host shares one Github client, so its keep-alive
+connections (and TLS sessions) are set up once per host rather than once per repository. One combined report is written.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from scripts.modules_config import ModulesConfig
+from scripts.tag_backends import GithubApiTagBackend, select_tag_backend
+from scripts.instrumentation import Metrics
+from scripts.file_utils import write_json_atomic
+
+
+class GithubClientPool:
+    """
+    One Github client per API host, created on first use and shared by every repository on that host
+    """
+
+    def __init__(self, pool_size=None):
+        """
+        :param pool_size: Optional size of each client's HTTP connection pool. Should match the number of repositories worked on at once
+        """
+        self.pool_size = pool_size
+        self.clients = {}    # base_url (None for api.github.com) -> Github client
+        self.lock = threading.Lock()
+
+    def get_client(self, base_url=None):
+        with self.lock:
+            if base_url not in self.clients:
+                logging.debug("GithubClientPool - new client for %s", base_url or "api.github.com")
+                self.clients[base_url] = GithubApiTagBackend.build_github_client(base_url, self.pool_size)
+            return self.clients[base_url]
+
+
+class BatchRunner:
+
+    concurrency_env_var = "MODULES_CONFIG_BATCH_CONCURRENCY"    # number of repositories worked on at once
+    default_concurrency = 8
+
+    def __init__(self, targets, concurrency=None, versions=True, client_pool=None):
+        """
+        :param targets: A list of target dictionaries (see above)
+        :param concurrency: Optional number of repositories worked on at once. Defaults to MODULES_CONFIG_BATCH_CONCURRENCY, otherwise 8
+        :param versions: False to leave out the module versions (no tag lookups)
+        :param client_pool: Optional GithubClientPool to share with other batches
+        """
+        self.targets = targets
+        self.concurrency = concurrency or int(os.environ.get(self.concurrency_env_var) or 0) or self.default_concurrency
+        self.versions = versions
+        self.client_pool = client_pool or GithubClientPool(pool_size=self.concurrency)
+
+    @classmethod
+    def load_targets(cls, path):
+        """
+        :param path: A json file holding the list of targets
+        :return: The list of targets
+        """
+        with open(path) as fh:
+            targets = json.load(fh)
+        for target in targets:
+            if not target.get("repository") or not target.get("path"):
+                raise ValueError(f"Every batch target needs a repository and a path: {target}")
+            if not (target.get("base") and target.get("head")) and target.get("files") is None:
+                raise ValueError(f"Batch target {target['repository']} needs base and head commits or files")
+        return targets
+
+    def get_tag_backend(self, target):
+        """
+        Pick the tag backend of a target (see select_tag_backend), with API lookups going through the host's shared client
+        """
+        backend = select_tag_backend(repo_path=target["path"], mode=target.get("tag_backend"), repository=target["repository"], base_url=target.get("base_url"))
+        if isinstance(backend, GithubApiTagBackend):
+            backend.github_client = self.client_pool.get_client(target.get("base_url"))
+        return backend
+
+    def run_target(self, target):
+        """
+        Build the modules configuration and tests matrix of one repository
+        :return: The report of the target
+        """
+        report = {"repository": target["repository"], "host": target.get("base_url") or "api.github.com"}
+        start = time.perf_counter()
+        try:
+            if not os.path.isdir(target["path"]):
+                raise FileNotFoundError(f"No checkout found at {target['path']}")
+            app = ModulesConfig(
+                tag_backend=self.get_tag_backend(target) if self.versions else None,
+                metrics=Metrics(path=""),
+                repo_path=target["path"],
+            )
+            # the outputs are collected for the combined report rather than written to GITHUB_OUTPUT
+            app.buffer_outputs()
+            if target.get("base") and target.get("head"):
+                app.build_modules_config_from_commits(target["base"], target["head"], versions=self.versions)
+            else:
+                app.build_modules_config(target["files"], "MODULES_CONFIG", versions=self.versions)
+            app.build_tests_matrix_config()
+            outputs = dict(app.output_buffer)
+            app.output_buffer = None
+
+            report["modules"] = app.get_modules_config().to_list()
+            report["matrix"] = json.loads(outputs["TESTS_MATRIX_OUTPUT"]) if "TESTS_MATRIX_OUTPUT" in outputs else None
+            report["metrics"] = app.metrics.to_dict()
+            report["api"] = app.tag_backend.get_api_stats() if app.tag_backend is not None else None
+        except Exception as e:
+            # one repository failing doesn't stop the others
+            logging.error("BatchRunner - %s failed: %s", target["repository"], e)
+            report["error"] = str(e)
+        report["seconds"] = round(time.perf_counter() - start, 4)
+        return report
+
+    def run(self):
+        """
+        Work on every target concurrently
+        :return: The combined report, {"targets": [...], "summary": {...}}
+        """
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            reports = list(executor.map(self.run_target, self.targets))
+        failed = [report["repository"] for report in reports if "error" in report]
+        summary = {
+            "repositories": len(reports),
+            "failed": failed,
+            "modules": sum(len(report.get("modules", [])) for report in reports),
+            "matrix_jobs": sum(len((report.get("matrix") or {}).get("include", [])) for report in reports),
+            "api_calls": sum((report.get("api") or {}).get("calls", 0) for report in reports),
+            "hosts": len(self.client_pool.clients),
+            "seconds": round(time.perf_counter() - start, 4),
+        }
+        logging.info("BatchRunner - %s", summary)
+        return {"targets": reports, "summary": summary}
+
+    def write_report(self, report, path):
+        write_json_atomic(path, report, indent=2)
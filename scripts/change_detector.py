@@ -0,0 +1,183 @@
+"""
+Works out which modules changed between two commits without going through a list of changed files
+    python3 -m scripts.change_detector <base_sha> [<head_sha>] [-o OUTPUT_VAR]
+The head defaults to HEAD, as does an empty head (e.g, github.event.after on a pull request event).
+
+The tree objects of each module root are compared with git diff-tree (non recursive), so only the entries directly under
+the root are looked at. A module whose tree hash differs has changed and is never descended into. Only group directories
+of nested modules (e.g, modules/networking) are descended into.
+"""
+
+import argparse
+import json
+import logging
+import os
+import subprocess
+from scripts.module_classifier import ModuleClassifier
+
+
+class ChangeDetector:
+
+    tree_mode = "040000"
+    default_head = "HEAD"
+
+    def __init__(self, classifier=None, repo_path=None):
+        """
+        :param classifier: ModuleClassifier used to tell modules and group directories apart. Defaults to one using the "modules" root
+        :param repo_path: Path to the repository. Defaults to the current directory
+        """
+        self.classifier = classifier or ModuleClassifier(repo_path=repo_path)
+        self.repo_path = repo_path
+        self.empty_tree = None
+
+    def get_head(self, head):
+        """
+        :return: The head commit to use. An empty or missing head is HEAD, rather than the empty path of a <head>:<root> revision
+        """
+        return head or self.default_head
+
+    def run_git(self, *args, input=None):
+        """
+        Run a git command in the repository and return its raw stdout
+        """
+        result = subprocess.run(["git", *args], cwd=self.repo_path, input=input, capture_output=True, check=True)
+        return result.stdout
+
+    def get_empty_tree(self):
+        """
+        The hash of an empty tree, used in place of a root that doesn't exist in one of the commits (works for sha1 and sha256 repositories)
+        """
+        if self.empty_tree is None:
+            self.empty_tree = self.run_git("hash-object", "-t", "tree", "--stdin", input=b"").decode().strip()
+        return self.empty_tree
+
+    def resolve_trees(self, revisions):
+        """
+        Resolve many <commit>:<path> revisions to tree hashes with a single git cat-file call
+        :param revisions: A list of revisions such as abc123:modules
+        :return: A dictionary of revision to tree hash. Revisions that don't exist (or aren't trees) map to the empty tree
+        """
+        output = self.run_git("cat-file", "--batch-check", input="".join(f"{revision}\n" for revision in revisions).encode())
+        trees = {}
+        for revision, line in zip(revisions, output.decode().splitlines()):
+            parts = line.split()
+            trees[revision] = parts[0] if len(parts) == 3 and parts[1] == "tree" else self.get_empty_tree()
+        return trees
+
+    def list_tree(self, commit, paths, recursive=False, object_type=None):
+        """
+        List the entries under some paths of a commit with a single git ls-tree call
+        :param paths: A list of paths. A directory path ending in / lists the directory's entries, otherwise the entry itself
+        :param recursive: True to list the entries of every sub directory too
+        :param object_type: Optional type of entry to keep, "blob" or "tree"
+        :return: A dictionary of path to object hash
+        """
+        args = ["ls-tree", "-z", *(["-r"] if recursive else []), *(["-d"] if recursive and object_type == "tree" else []), commit, "--", *paths]
+        output = self.run_git(*args).decode("utf-8", "surrogateescape")
+        entries = {}
+        # each entry is "<mode> <type> <hash>\t<path>", NUL terminated
+        for entry in output.split("\0"):
+            info, _, path = entry.partition("\t")
+            if path:
+                _mode, entry_type, object_hash = info.split(" ")
+                if object_type is None or entry_type == object_type:
+                    entries[path] = object_hash
+        return entries
+
+    def list_trees(self, commit, paths):
+        """
+        List every directory under some paths of a commit with a single git ls-tree call
+        :param paths: A list of directory paths, e.g, the module roots
+        :return: A dictionary of directory path (the paths themselves included) to tree hash
+        """
+        return self.list_tree(commit, paths, recursive=True, object_type="tree")
+
+    def diff_trees(self, base_tree, head_tree):
+        """
+        Compare the direct entries of two trees (non recursive)
+        :return: A list of (name, is_tree) tuples for each entry that differs
+        """
+        output = self.run_git("diff-tree", "-z", base_tree, head_tree).decode("utf-8", "surrogateescape")
+        fields = output.split("\0")
+        entries = []
+        # Raw output is ":<old mode> <new mode> <old sha> <new sha> <status>" followed by the path, each NUL terminated
+        for info, name in zip(fields[0::2], fields[1::2]):
+            old_mode, new_mode = info.lstrip(":").split(" ")[:2]
+            entries.append((name, self.tree_mode in (old_mode, new_mode)))
+        return entries
+
+    def iter_changed_files(self, base, head):
+        """
+        Yield every file that changed between two commits (git diff-tree -r), for when the individual paths are needed
+        :param base: The base commit. May be the all zero sha Github uses for a new branch, which compares against an empty tree
+        :param head: The head commit. Defaults to HEAD if empty
+        """
+        head = self.get_head(head)
+        revisions = [f"{base}^{{tree}}", f"{head}^{{tree}}"]
+        trees = self.resolve_trees(revisions)
+        output = self.run_git("diff-tree", "-r", "-z", "--name-only", "--no-renames", trees[revisions[0]], trees[revisions[1]])
+        for path in output.split(b"\0"):
+            if path:
+                yield path.decode("utf-8", "surrogateescape")
+
+    def iter_working_tree_files(self, base="HEAD", paths=None):
+        """
+        Yield every file in the working tree that differs from a commit, staged or not, and every untracked (not ignored) file
+        :param base: The commit to compare the working tree with
+        :param paths: Optional list of directories to limit the comparison to, e.g, the module directories that were modified
+        """
+        paths = list(paths or [])
+        output = self.run_git("diff", "-z", "--name-only", "--no-renames", base, "--", *paths)
+        output += self.run_git("ls-files", "-z", "--others", "--exclude-standard", "--", *paths)
+        for path in output.split(b"\0"):
+            if path:
+                yield path.decode("utf-8", "surrogateescape")
+
+    def get_changed_modules(self, base, head):
+        """
+        Get the modules that changed between two commits
+        :param base: The base commit. May be the all zero sha Github uses for a new branch, in which case every module counts as changed
+        :param head: The head commit. Defaults to HEAD if empty
+        :return: A list of module names
+        """
+        head = self.get_head(head)
+        revisions = [f"{commit}:{root}" for root in self.classifier.roots for commit in (base, head)]
+        trees = self.resolve_trees(revisions)
+
+        changed_modules = []
+        directories = [(root, trees[f"{base}:{root}"], trees[f"{head}:{root}"]) for root in self.classifier.roots]
+        while directories:
+            directory, base_tree, head_tree = directories.pop(0)
+            if base_tree == head_tree:
+                continue
+            group_directories = []
+            for name, is_tree in self.diff_trees(base_tree, head_tree):
+                if not is_tree:
+                    # A file directly in a root or group directory isn't part of a module
+                    continue
+                path = f"{directory}/{name}"
+                module = self.classifier.classify(f"{path}/")
+                if module is not None:
+                    changed_modules.append(module)
+                else:
+                    group_directories.append(path)
+            if group_directories:
+                group_trees = self.resolve_trees([f"{commit}:{path}" for path in group_directories for commit in (base, head)])
+                directories.extend((path, group_trees[f"{base}:{path}"], group_trees[f"{head}:{path}"]) for path in group_directories)
+        logging.debug("ChangeDetector - changed modules between %s and %s: %s", base, head, changed_modules)
+        return changed_modules
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("base", help="the base commit sha")
+    parser.add_argument("head", nargs="?", default=ChangeDetector.default_head, help="the head commit sha. Defaults to HEAD, also when empty")
+    parser.add_argument("-o", "--output", nargs='?', default="PYTHON_OUTPUT", help="name of the GITHUB_OUTPUT variable to write the json list of changed modules to")
+    args = parser.parse_args()
+
+    changed_modules = json.dumps(ChangeDetector().get_changed_modules(args.base, args.head))
+    if "GITHUB_OUTPUT" in os.environ:
+        with open(os.environ["GITHUB_OUTPUT"], "a") as fh:
+            print(f"{args.output}={changed_modules}", file=fh)
+    else:
+        print(changed_modules)
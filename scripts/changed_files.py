@@ -0,0 +1,78 @@
+"""
+Streaming readers for the list of changed files
+Paths are yielded one at a time from a generator pipeline so memory use stays flat no matter how many files changed.
+Supports the legacy space separated string, newline separated input and NUL delimited input (git diff -z / git diff-tree -z),
+which is the only format that is safe for paths containing spaces or newlines.
+"""
+
+import re
+import sys
+
+chunk_size = 64 * 1024
+
+
+def iter_files_string(files_string):
+    """
+    Lazily split the legacy space separated string of file paths
+    :param files_string: e.g, "modules/module1/main.tf modules/module2/main.tf"
+    """
+    for match in re.finditer(r"\S+", files_string):
+        yield match.group(0)
+
+
+def iter_stream(stream, null_delimited=False):
+    """
+    Yield each path from a binary stream, reading it in fixed size chunks
+    :param stream: A binary file object, e.g, sys.stdin.buffer or an open file
+    :param null_delimited: True if the paths are NUL separated (git -z output), otherwise one path per line
+    """
+    delimiter = b"\0" if null_delimited else b"\n"
+    remainder = b""
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        records = (remainder + chunk).split(delimiter)
+        # The last record may be cut off part way through, so keep it for the next chunk
+        remainder = records.pop()
+        for record in records:
+            path = decode_path(record, null_delimited)
+            if path:
+                yield path
+    path = decode_path(remainder, null_delimited)
+    if path:
+        yield path
+
+
+def decode_path(record, null_delimited):
+    """
+    Turn a raw record into a path. Undecodable bytes are kept (surrogateescape) rather than failing the run
+    Line based input may come from Windows tools so a trailing carriage return is removed
+    """
+    path = record.decode("utf-8", "surrogateescape")
+    return path if null_delimited else path.rstrip("\r")
+
+
+def iter_source(source, null_delimited=False):
+    """
+    Yield each path from stdin ("-") or a file
+    :param source: "-" for stdin or the path of a file holding the changed files
+    :param null_delimited: True if the paths are NUL separated
+    """
+    if source == "-":
+        yield from iter_stream(sys.stdin.buffer, null_delimited)
+    else:
+        with open(source, "rb") as fh:
+            yield from iter_stream(fh, null_delimited)
+
+
+def iter_changed_files(files):
+    """
+    Normalise the supported inputs into a generator of paths
+    :param files: A space separated string (legacy), a binary stream or any iterable of paths
+    """
+    if isinstance(files, str):
+        return iter_files_string(files)
+    if hasattr(files, "read"):
+        return iter_stream(files)
+    return iter(files)
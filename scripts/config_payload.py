@@ -0,0 +1,162 @@
+"""
+Keeps the MODULES_CONFIG output within a size budget
+Github job outputs are limited in size (1MB per job), so a configuration for hundreds of modules can't always be passed inline.
+In order of preference the output is:
+    plain       the existing list format, [{"module": "module1", "versions": {...}, "tests": [...]}, ...]
+    compact     {"format": "compact", "keys": [...], "values": [...], "modules": [[...], ...]}
+                each module is a row of its values in the order of "keys", null where the module doesn't have the key. Strings are
+                stored in the row as they are. Any other value is stored once in "values" and referenced by its index, so repeated
+                lists and dictionaries (e.g, the versions of every untagged module or the same tests list) are only stored once
+    spill       {"format": "spill", "path": "modules_config.jsonl", "modules": <count>}
+                the full configuration is written to a file (one module per line) that later jobs download as an artifact
+A reference to a snapshot file, {"format": "snapshot", "path": "modules_config.snap"}, is read the same way as a spill file
+but a module is found through the snapshot's index rather than by scanning (see config_snapshot.py).
+"""
+
+import json
+import logging
+import os
+from scripts.config_snapshot import ConfigSnapshot
+from scripts.file_utils import open_atomic
+
+
+class ConfigPayload:
+
+    budget = 512 * 1024    # bytes allowed for the output, leaving room for the tests matrix in Github's 1MB per job limit
+    budget_env_var = "MODULES_CONFIG_OUTPUT_BUDGET"
+    spill_path = "modules_config.jsonl"    # relative to the workspace, so it is found at the same path once downloaded in a later job
+    separators = (",", ":")
+
+    def __init__(self, budget=None, spill_path=None):
+        """
+        :param budget: Optional size limit in bytes. Defaults to MODULES_CONFIG_OUTPUT_BUDGET, otherwise budget
+        :param spill_path: Optional path of the file a configuration over budget is written to
+        """
+        if budget is None:
+            budget = int(os.environ.get(self.budget_env_var) or 0) or None
+        if budget is not None:
+            self.budget = budget
+        if spill_path is not None:
+            self.spill_path = spill_path
+        self.snapshots = {}    # path -> ConfigSnapshot, kept open (mapped) for repeated lookups
+
+    def encode_compact(self, modules):
+        """
+        Encode a list of module dictionaries with the keys and repeated values stored once
+        """
+        keys = []
+        for module in modules:
+            for key in module:
+                if key not in keys:
+                    keys.append(key)
+        values = []
+        value_indexes = {}
+        rows = []
+        for module in modules:
+            row = []
+            for key in keys:
+                if key not in module:
+                    row.append(None)
+                    continue
+                value = module[key]
+                if not isinstance(value, str):
+                    # every other value (lists, dictionaries, numbers, booleans and null) is stored once and referenced by its index,
+                    # so an index can't be mistaken for a number
+                    value_key = json.dumps(value, sort_keys=True, separators=self.separators)
+                    if value_key not in value_indexes:
+                        value_indexes[value_key] = len(values)
+                        values.append(value)
+                    value = value_indexes[value_key]
+                row.append(value)
+            # trailing keys the module doesn't have are left off the row
+            while row and row[-1] is None:
+                row.pop()
+            rows.append(row)
+        return {"format": "compact", "keys": keys, "values": values, "modules": rows}
+
+    def decode_compact(self, payload):
+        keys = payload["keys"]
+        values = payload["values"]
+        modules = []
+        for row in payload["modules"]:
+            module = {}
+            for key, value in zip(keys, row):
+                if value is None:
+                    continue
+                # strings are stored as they are, anything else is the index of a shared value
+                module[key] = value if isinstance(value, str) else values[value]
+            modules.append(module)
+        return modules
+
+    def is_spilled(self, payload):
+        """
+        :return: True if the payload is a reference to a file holding the configuration (a spill file or a snapshot)
+        """
+        return isinstance(payload, dict) and payload.get("format") in ("spill", "snapshot")
+
+    def get_snapshot(self, reference):
+        if reference["path"] not in self.snapshots:
+            self.snapshots[reference["path"]] = ConfigSnapshot(reference["path"])
+        return self.snapshots[reference["path"]]
+
+    def decode(self, payload):
+        """
+        Turn a parsed MODULES_CONFIG value back into the list format
+        :return: The list of module dictionaries, or the spill reference (see is_spilled) which is loaded on demand
+        """
+        if isinstance(payload, dict) and payload.get("format") == "compact":
+            return self.decode_compact(payload)
+        return payload
+
+    def fit(self, modules):
+        """
+        Pick the smallest form of the configuration that is needed to stay within the budget
+        :param modules: The list of module dictionaries
+        :return: A tuple of the payload to output and its json
+        """
+        serialised = json.dumps(modules)
+        if len(serialised.encode("utf-8")) <= self.budget:
+            return modules, serialised
+        compact = self.encode_compact(modules)
+        serialised_compact = json.dumps(compact, separators=self.separators)
+        if len(serialised_compact.encode("utf-8")) <= self.budget:
+            logging.info(f"ConfigPayload - configuration is {len(serialised)} bytes, using the compact encoding ({len(serialised_compact)} bytes)")
+            return compact, serialised_compact
+        reference = self.spill(modules)
+        logging.info(f"ConfigPayload - configuration is {len(serialised)} bytes, over the {self.budget} byte budget. Written to {self.spill_path}")
+        return reference, json.dumps(reference)
+
+    def spill(self, modules):
+        """
+        Write the full configuration to the spill file, one module per line
+        :return: The reference to output in place of the configuration
+        """
+        with open_atomic(self.spill_path, encoding="utf-8") as fh:
+            for module in modules:
+                fh.write(json.dumps(module, separators=self.separators))
+                fh.write("\n")
+        return {"format": "spill", "path": self.spill_path, "modules": len(modules)}
+
+    def load_spilled(self, reference):
+        """
+        :return: Every module dictionary in a spill file or snapshot
+        """
+        if reference["format"] == "snapshot":
+            return self.get_snapshot(reference).load()
+        with open(reference["path"], encoding="utf-8") as fh:
+            return [json.loads(line) for line in fh if line.strip()]
+
+    def find_spilled(self, reference, module_name):
+        """
+        Read a single module's entry from a spill file or snapshot without parsing the others
+        Every line of a spill file starts with the module name (it is the first key), so only the matching line is parsed
+        :return: The module dictionary or None
+        """
+        if reference["format"] == "snapshot":
+            return self.get_snapshot(reference).get_module(module_name)
+        prefix = json.dumps({"module": module_name}, separators=self.separators)[:-1]
+        with open(reference["path"], encoding="utf-8") as fh:
+            for line in fh:
+                if line.startswith(prefix) and line[len(prefix)] in ",}":
+                    return json.loads(line)
+        return None
@@ -0,0 +1,181 @@
+"""
+Compact, indexed snapshot of a modules configuration, so a job can read one module without loading the others
+    python3 -m scripts.config_snapshot [--path modules_config.snap] get <module> [property]
+    python3 -m scripts.config_snapshot [--path modules_config.snap] list
+
+The configuration job writes the snapshot once (python -m scripts all --snapshot modules_config.snap) and uploads it as an
+artifact. Each matrix job downloads it and points MODULES_CONFIG_SNAPSHOT at it, and ModulesConfig then memory maps the file
+rather than parsing the MODULES_CONFIG json. A lookup is a binary search of the index followed by parsing that one record,
+so the time and memory a job spends on the configuration stay the same however many modules it holds.
+
+Layout (integers are little endian):
+    header      magic (8 bytes) and the number of modules (uint32)
+    index       one entry per module, sorted by the utf-8 bytes of its name:
+                name offset (uint32), name length (uint32), record offset (uint64), record length (uint32)
+    names       the module names, utf-8
+    records     each module dictionary as compact json, in the order of the configuration
+Offsets are from the start of the file.
+"""
+
+import argparse
+import bisect
+import json
+import mmap
+import os
+import struct
+from scripts.file_utils import open_atomic
+
+
+class SnapshotNames:
+    """
+    The sorted module names of a snapshot as a sequence, for bisect. Each name is read from the mapped file when compared
+    """
+
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+
+    def __len__(self):
+        return self.snapshot.count
+
+    def __getitem__(self, position):
+        if not 0 <= position < self.snapshot.count:
+            raise IndexError(position)
+        name_offset, name_length, _record_offset, _record_length = self.snapshot.get_entry(position)
+        return self.snapshot.data[name_offset:name_offset + name_length]
+
+
+class ConfigSnapshot:
+
+    snapshot_env_var = "MODULES_CONFIG_SNAPSHOT"    # path of a snapshot to read the modules configuration from
+    default_path = "modules_config.snap"    # relative to the workspace, so it is found at the same path once downloaded in a later job
+    magic = b"MODCFG01"
+    header = struct.Struct("<8sI")
+    entry = struct.Struct("<IIQI")
+    separators = (",", ":")
+
+    def __init__(self, path=None):
+        """
+        :param path: Optional snapshot file. Defaults to MODULES_CONFIG_SNAPSHOT, otherwise modules_config.snap
+        """
+        self.path = path or os.environ.get(self.snapshot_env_var) or self.default_path
+        self.data = None     # the mapped file, opened on first use
+        self.count = 0
+
+    def write(self, modules):
+        """
+        Write a snapshot of a configuration
+        :param modules: The list of module dictionaries
+        :return: The number of bytes written
+        """
+        names = [module["module"].encode("utf-8") for module in modules]
+        records = [json.dumps(module, separators=self.separators).encode("utf-8") for module in modules]
+        order = sorted(range(len(modules)), key=lambda position: names[position])
+
+        names_offset = self.header.size + self.entry.size * len(modules)
+        name_offsets = []
+        for name in names:
+            name_offsets.append(names_offset)
+            names_offset += len(name)
+        record_offsets = []
+        record_offset = names_offset
+        for record in records:
+            record_offsets.append(record_offset)
+            record_offset += len(record)
+
+        with open_atomic(self.path, "wb") as fh:
+            fh.write(self.header.pack(self.magic, len(modules)))
+            for position in order:
+                fh.write(self.entry.pack(name_offsets[position], len(names[position]), record_offsets[position], len(records[position])))
+            fh.writelines(names)
+            fh.writelines(records)
+        self.close()
+        return record_offset
+
+    def open(self):
+        """
+        Map the snapshot file (once)
+        """
+        if self.data is None:
+            with open(self.path, "rb") as fh:
+                # an empty file can't be mapped, and isn't a snapshot either
+                data = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(fh.fileno()).st_size else b""
+            if len(data) < self.header.size or data[:len(self.magic)] != self.magic:
+                raise ValueError(f"{self.path} isn't a modules configuration snapshot")
+            self.count = self.header.unpack_from(data)[1]
+            self.data = data
+        return self.data
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+        self.data = None
+        self.count = 0
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def get_entry(self, position):
+        """
+        :return: The index entry at a position, (name offset, name length, record offset, record length)
+        """
+        return self.entry.unpack_from(self.data, self.header.size + self.entry.size * position)
+
+    def read_record(self, position):
+        _name_offset, _name_length, record_offset, record_length = self.get_entry(position)
+        return json.loads(self.data[record_offset:record_offset + record_length])
+
+    def get_module(self, module_name):
+        """
+        Read a single module's record
+        :return: The module dictionary or None if the module isn't in the snapshot
+        """
+        self.open()
+        name = module_name.encode("utf-8")
+        names = SnapshotNames(self)
+        position = bisect.bisect_left(names, name)
+        if position < self.count and names[position] == name:
+            return self.read_record(position)
+        return None
+
+    def get_module_property(self, module_name, property_name):
+        """
+        :return: The property value or None if the module or property isn't set
+        """
+        return (self.get_module(module_name) or {}).get(property_name)
+
+    def get_module_names(self):
+        """
+        :return: The module names, sorted
+        """
+        self.open()
+        return [name.decode("utf-8") for name in SnapshotNames(self)]
+
+    def load(self):
+        """
+        :return: Every module dictionary, in the order of the configuration
+        """
+        self.open()
+        positions = sorted(range(self.count), key=lambda position: self.get_entry(position)[2])
+        return [self.read_record(position) for position in positions]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--path", default=None, help="snapshot file, defaults to MODULES_CONFIG_SNAPSHOT, otherwise modules_config.snap")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    get_parser = subparsers.add_parser("get", help="print a module's configuration, or one property of it, as json")
+    get_parser.add_argument("module")
+    get_parser.add_argument("property", nargs="?")
+    subparsers.add_parser("list", help="print the module names as json")
+    args = parser.parse_args()
+
+    with ConfigSnapshot(args.path) as snapshot:
+        if args.command == "get":
+            value = snapshot.get_module_property(args.module, args.property) if args.property else snapshot.get_module(args.module)
+            print(json.dumps(value))
+        else:
+            print(json.dumps(snapshot.get_module_names()))
@@ -0,0 +1,164 @@
+"""
+Modules configuration store
+The configuration is held as a dictionary of module name to a compact record, so getting or updating a single module
+doesn't scan (or re-parse) the whole list. It is serialised to, and loaded from, the list format used for MODULES_CONFIG:
+    [{"module": "module1", "triggered_by": [...], "versions": {...}, "tests": ["unit", "bdd"]}, ...]
+"""
+
+import json
+import logging
+import os
+
+
+class ModuleRecord:
+
+    __slots__ = ("module", "triggered_by", "versions", "tests", "extra")
+    fields = ("module", "triggered_by", "versions", "tests")    # in the order they are serialised, unset (None) fields are left out
+
+    def __init__(self, module, triggered_by=None, versions=None, tests=None, extra=None):
+        self.module = module
+        self.triggered_by = triggered_by
+        self.versions = versions
+        self.tests = tests
+        self.extra = extra    # any other keys, kept so they survive a load and save
+
+    @classmethod
+    def from_dict(cls, module_config):
+        record = cls(module_config["module"])
+        record.update(module_config)
+        return record
+
+    def update(self, module_config):
+        """
+        Set the fields present in a (partial) module dictionary. A field set to None is removed
+        """
+        for key, value in module_config.items():
+            if key == "module":
+                continue
+            if key in self.fields:
+                setattr(self, key, value)
+            elif value is None:
+                if self.extra:
+                    self.extra.pop(key, None)
+            else:
+                if self.extra is None:
+                    self.extra = {}
+                self.extra[key] = value
+
+    def get(self, property_name, default=None):
+        if property_name in self.fields:
+            value = getattr(self, property_name)
+        else:
+            value = (self.extra or {}).get(property_name)
+        return default if value is None else value
+
+    def to_dict(self):
+        module_config = {"module": self.module}
+        for field in self.fields[1:]:
+            value = getattr(self, field)
+            if value is not None:
+                module_config[field] = value
+        if self.extra:
+            module_config.update(self.extra)
+        return module_config
+
+
+class ModulesConfigStore:
+
+    def __init__(self, modules=None):
+        """
+        :param modules: Optional list of module dictionaries to start with
+        """
+        self.records = {}    # module name -> ModuleRecord, in the order the modules were added
+        if modules:
+            self.merge(modules)
+
+    def __len__(self):
+        return len(self.records)
+
+    def __contains__(self, module):
+        return module in self.records
+
+    def __iter__(self):
+        """
+        Iterate over the ModuleRecord objects
+        """
+        return iter(self.records.values())
+
+    def get(self, module):
+        """
+        :return: The ModuleRecord of a module or None
+        """
+        return self.records.get(module)
+
+    def get_module(self, module):
+        """
+        :return: The dictionary of a module's configuration or None
+        """
+        record = self.records.get(module)
+        return record.to_dict() if record else None
+
+    def get_module_property(self, module, property_name, default=None):
+        """
+        :return: A single property of a module, e.g, "tests", or the default if the module or property isn't set
+        """
+        record = self.records.get(module)
+        return record.get(property_name, default) if record else default
+
+    def get_modules(self):
+        """
+        :return: The list of module names
+        """
+        return list(self.records)
+
+    def set_module(self, module_config):
+        """
+        Add a module or update the fields present in the supplied dictionary
+        :param module_config: A dictionary with at least the "module" key
+        :return: The ModuleRecord
+        """
+        record = self.records.get(module_config["module"])
+        if record is None:
+            record = self.records[module_config["module"]] = ModuleRecord.from_dict(module_config)
+        else:
+            record.update(module_config)
+        return record
+
+    def set_module_property(self, module, property_name, value):
+        """
+        Set a single property of a module, adding the module if it isn't already in the store
+        """
+        return self.set_module({"module": module, property_name: value})
+
+    def remove_module(self, module):
+        self.records.pop(module, None)
+
+    def merge(self, delta):
+        """
+        Merge changes into the store
+        :param delta: A list of (partial) module dictionaries, or a dictionary of module name to (partial) module dictionary
+        """
+        if isinstance(delta, dict):
+            delta = [dict(module_config, module=module) for module, module_config in delta.items()]
+        for module_config in delta:
+            self.set_module(module_config)
+
+    def merge_env(self, env_var="MODULES_CONFIG", decode=None):
+        """
+        Merge a delta held as json in an environment variable, e.g, the MODULES_CONFIG output of an earlier job
+        :param decode: Optional function turning the parsed json into a list of module dictionaries (e.g, ConfigPayload.decode)
+        :return: True if there was anything to merge
+        """
+        value = os.environ.get(env_var)
+        if not value:
+            return False
+        delta = json.loads(value)
+        self.merge(decode(delta) if decode else delta)
+        logging.debug(f"ModulesConfigStore - merged {env_var} into the configuration")
+        return True
+
+    def to_list(self):
+        """
+        :return: The configuration in the MODULES_CONFIG list format
+        """
+        return [record.to_dict() for record in self.records.values()]
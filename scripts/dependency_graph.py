@@ -0,0 +1,215 @@
+"""
+Terraform module dependency graph
+Each module's .tf files are parsed for module blocks with a local source, e.g,
+    module "network" {
+      source = "../module2"
+    }
+The forward dependencies are cached on disk, so only the modules whose .tf files changed are parsed again. An entry is
+checked against the name, mtime and size of each of the module's .tf files first. Only when those changed (e.g, a cache
+restored into a fresh checkout in CI, where every mtime is new) is git asked for the blob hashes of the committed .tf files,
+so a checkout of the same files still matches. A module with uncommitted changes has no blob hashes and is parsed again.
+The reverse dependency index is then used to find every module that is affected (directly or transitively) by a change.
+"""
+
+import json
+import logging
+import os
+import re
+import subprocess
+from scripts.module_classifier import ModuleClassifier
+from scripts.change_detector import ChangeDetector
+from scripts.module_fingerprint import ModuleFingerprinter
+from scripts.file_utils import write_json_atomic
+
+
+class DependencyGraph:
+
+    default_cache_path = os.path.join(".modules_cache", "dependencies.json")
+    cache_format_version = 2
+    pathspec_limit = 32    # more modules than this are looked up from git through their roots rather than one pathspec each
+    module_block_pattern = re.compile(r'^\s*module\s+"[^"]*"\s*\{', re.MULTILINE)
+    source_pattern = re.compile(r'^\s*source\s*=\s*"([^"]+)"', re.MULTILINE)
+    comment_pattern = re.compile(r'(#|//)[^\n]*|/\*.*?\*/', re.DOTALL)
+
+    def __init__(self, classifier=None, cache_path=None, repo_path=None):
+        """
+        :param classifier: ModuleClassifier used to find the module directories and map sources back to module names
+        :param cache_path: File to store the parsed dependencies in. Set to an empty string to disable the cache
+        :param repo_path: Path to the repository root. Defaults to the current directory
+        """
+        self.classifier = classifier or ModuleClassifier(repo_path=repo_path)
+        self.cache_path = self.default_cache_path if cache_path is None else cache_path
+        self.repo_path = repo_path
+        self.entries = None           # module -> {"mtime": [[file, mtime, size], ...], "blobs": [[file, blob hash], ...] or None, "depends_on": [...]}
+        self.dependents = None        # reverse index: module -> set of modules that use it
+        self.changed = False
+
+    def load(self):
+        """
+        Read the cached dependencies (once)
+        """
+        if self.entries is None:
+            self.entries = {}
+            if self.cache_path and os.path.isfile(self.cache_path):
+                try:
+                    with open(self.cache_path) as fh:
+                        data = json.load(fh)
+                    if data.get("version") == self.cache_format_version:
+                        self.entries = data.get("modules", {})
+                except (OSError, ValueError) as e:
+                    logging.debug(f"DependencyGraph - unable to read {self.cache_path}, parsing every module: {e}")
+        return self.entries
+
+    def get_tf_files(self, module_directory):
+        """
+        :return: A sorted list of [file name, mtime, size] for the .tf files directly in the module directory
+        """
+        try:
+            with os.scandir(module_directory) as entries:
+                return sorted([entry.name, entry.stat().st_mtime_ns, entry.stat().st_size] for entry in entries if entry.is_file() and entry.name.endswith(".tf"))
+        except OSError:
+            return []
+
+    def get_blob_keys(self, modules):
+        """
+        Look up the committed .tf files of many modules with one git status and one git ls-tree call
+        :return: A dictionary of module to a sorted list of [file name, blob hash] for the .tf files directly in its directory.
+            Modules with uncommitted changes are left out, as are all of them if git isn't usable
+        """
+        paths = dict((module, self.classifier.get_module_path(module)) for module in modules)
+        # git status and ls-tree match every file against every pathspec, so many modules are looked up through their roots
+        few = len(paths) <= self.pathspec_limit
+        pathspecs = [f"{path}/" for path in paths.values()] if few else self.classifier.roots
+        try:
+            dirty_paths = ModuleFingerprinter(self.classifier, repo_path=self.repo_path).get_dirty_paths(list(paths.values()), pathspecs)
+            files = ChangeDetector(self.classifier, self.repo_path).list_tree("HEAD", pathspecs, recursive=not few, object_type="blob")
+        except (OSError, subprocess.CalledProcessError) as e:
+            logging.debug(f"DependencyGraph - git unavailable, the cache is only validated by mtimes: {e}")
+            return {}
+        tf_files = {}    # directory -> [[file name, blob hash], ...]
+        for path, blob in files.items():
+            if path.endswith(".tf"):
+                directory, _, name = path.rpartition("/")
+                tf_files.setdefault(directory, []).append([name, blob])
+        return dict((module, sorted(tf_files.get(path, []))) for module, path in paths.items() if path not in dirty_paths)
+
+    def parse_sources(self, text):
+        """
+        Find the source of every module block in the text of a .tf file
+        """
+        text = self.comment_pattern.sub("", text)
+        sources = []
+        for block in self.module_block_pattern.finditer(text):
+            # Walk forward to the matching closing brace so only this block's source is used
+            depth = 1
+            position = block.end()
+            while depth and position < len(text):
+                if text[position] == "{":
+                    depth += 1
+                elif text[position] == "}":
+                    depth -= 1
+                position += 1
+            source = self.source_pattern.search(text, block.end(), position)
+            if source:
+                sources.append(source.group(1))
+        return sources
+
+    def parse_module(self, module, module_directory, tf_files):
+        """
+        Parse a module's .tf files and map each local module source back to a module name
+        Registry and git sources are ignored as they are not part of this repository
+        """
+        depends_on = set()
+        for file_name, _mtime, _size in tf_files:
+            try:
+                with open(os.path.join(module_directory, file_name), encoding="utf-8", errors="replace") as fh:
+                    sources = self.parse_sources(fh.read())
+            except OSError:
+                continue
+            for source in sources:
+                if not source.startswith(("./", "../")):
+                    continue
+                source_path = os.path.normpath(os.path.join(self.classifier.get_module_path(module), source)).replace(os.path.sep, "/")
+                dependency = self.classifier.classify(f"{source_path}/")
+                if dependency is not None and dependency != module:
+                    depends_on.add(dependency)
+        return sorted(depends_on)
+
+    def build(self):
+        """
+        Bring the forward dependencies up to date, only re-parsing modules whose .tf files changed, and rebuild the reverse index
+        """
+        if self.dependents is not None:
+            return self.dependents
+        entries = self.load()
+        self.classifier.compile()
+        repo_path = self.repo_path or os.getcwd()
+
+        module_tf_files = dict(
+            (module, self.get_tf_files(os.path.join(repo_path, module_path))) for module, module_path in self.classifier.modules.items()
+        )
+        missed = [module for module, tf_files in module_tf_files.items() if (entries.get(module) or {}).get("mtime") != tf_files]
+        blob_keys = self.get_blob_keys(missed) if missed else {}
+
+        parsed = 0
+        for module in missed:
+            tf_files = module_tf_files[module]
+            blobs = blob_keys.get(module)
+            entry = entries.get(module)
+            if entry is not None and blobs is not None and entry["blobs"] == blobs:
+                # e.g, a fresh checkout of the same files, where every mtime is new. Its mtimes are kept so the next run needs no git
+                entry["mtime"] = tf_files
+            else:
+                module_directory = os.path.join(repo_path, self.classifier.modules[module])
+                entries[module] = {"mtime": tf_files, "blobs": blobs, "depends_on": self.parse_module(module, module_directory, tf_files)}
+                parsed += 1
+            self.changed = True
+        for module in [module for module in entries if module not in self.classifier.modules]:
+            # module removed from the repository
+            del entries[module]
+            self.changed = True
+        logging.debug(f"DependencyGraph - parsed {parsed} of {len(entries)} module(s)")
+
+        self.dependents = {}
+        for module, entry in entries.items():
+            for dependency in entry["depends_on"]:
+                self.dependents.setdefault(dependency, set()).add(module)
+        return self.dependents
+
+    def get_dependencies(self, module):
+        """
+        :return: The list of modules a module uses directly
+        """
+        self.build()
+        entry = self.entries.get(module)
+        return entry["depends_on"] if entry else []
+
+    def get_affected(self, changed_modules):
+        """
+        Find every module that depends, directly or transitively, on one of the changed modules
+        :param changed_modules: A list of changed module names
+        :return: A dictionary of affected module name to the sorted list of modules it was reached from. The changed modules themselves are not included
+        """
+        dependents = self.build()
+        changed = set(changed_modules)
+        affected = {}
+        queue = list(changed_modules)
+        while queue:
+            module = queue.pop(0)
+            for dependent in sorted(dependents.get(module, ())):
+                if dependent in changed:
+                    continue
+                if dependent not in affected:
+                    affected[dependent] = set()
+                    queue.append(dependent)
+                affected[dependent].add(module)
+        return {module: sorted(triggered_by) for module, triggered_by in affected.items()}
+
+    def save(self):
+        """
+        Write the parsed dependencies back to disk if anything changed
+        """
+        if not self.cache_path or not self.changed:
+            return
+        write_json_atomic(self.cache_path, {"version": self.cache_format_version, "modules": self.entries}, separators=(",", ":"))
+        self.changed = False
@@ -0,0 +1,50 @@
+"""
+File helpers shared by the modules configuration scripts
+"""
+
+import json
+import os
+from contextlib import contextmanager
+
+
+def get_repo_file(repo_path, path):
+    """
+    :param repo_path: The root of the repository, or None for the current directory
+    :param path: A file path, relative to the repository unless absolute. An empty path (a disabled cache) is left as it is
+    :return: The path to use from the current directory
+    """
+    if not path or not repo_path or os.path.isabs(path):
+        return path
+    return os.path.join(repo_path, path)
+
+
+@contextmanager
+def open_atomic(path, mode="w", **open_kwargs):
+    """
+    Open a temporary file next to path for writing, and move it over path once written
+    A failed or interrupted write never leaves a truncated file behind for the next run (or a concurrent reader) to load
+    :param path: The file to write. Its directory is created if needed
+    :param mode: "w" or "wb"
+    :return: The open temporary file
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    temp_path = f"{path}.tmp"
+    try:
+        with open(temp_path, mode, **open_kwargs) as fh:
+            yield fh
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def write_json_atomic(path, data, **dump_kwargs):
+    """
+    Write data to a json file through open_atomic
+    :param dump_kwargs: Passed on to json.dump, e.g, separators or indent
+    """
+    with open_atomic(path) as fh:
+        json.dump(data, fh, **dump_kwargs)
@@ -0,0 +1,135 @@
+"""
+Timing spans and counters for a run, reported as a metrics json file and a Markdown table in the Github job summary
+    metrics = Metrics()
+    with metrics.span("classification"):
+        classify_many(metrics.timed_iter("diff_ingestion", paths))
+    metrics.count("api_calls", 3)
+A span's time leaves out the time of any span (or timed iterator) inside it, so the spans of a run add up to its total
+time without counting anything twice. Spans are meant to be used from a single thread, counters from any thread.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from scripts.file_utils import write_json_atomic
+
+
+class Metrics:
+
+    metrics_env_var = "MODULES_CONFIG_METRICS"    # path of the metrics json file. Set to an empty string to not write one
+    default_path = os.path.join(".modules_cache", "metrics.json")
+    summary_env_var = "GITHUB_STEP_SUMMARY"       # set by Github Actions, Markdown appended to it is shown on the run's summary page
+
+    def __init__(self, path=None):
+        """
+        :param path: Optional metrics json file. Defaults to MODULES_CONFIG_METRICS, otherwise .modules_cache/metrics.json
+        """
+        if path is None:
+            path = os.environ.get(self.metrics_env_var, self.default_path)
+        self.path = path
+        self.started = time.perf_counter()
+        self.spans = {}      # name -> {"seconds": total, "count": times entered}, in the order first entered
+        self.counters = {}   # name -> value
+        self.gauges = {}     # name -> last value set, e.g, the remaining rate limit
+        self.stack = []      # time taken by the nested spans of each active span
+        self.lock = threading.Lock()
+
+    def add_span_time(self, name, seconds, count=1):
+        span = self.spans.setdefault(name, {"seconds": 0.0, "count": 0})
+        span["seconds"] += seconds
+        span["count"] += count
+        if self.stack:
+            # taken out of the enclosing span's own time
+            self.stack[-1] += seconds
+
+    @contextmanager
+    def span(self, name):
+        """
+        Time a block of code
+        """
+        self.stack.append(0.0)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            nested = self.stack.pop()
+            self.add_span_time(name, elapsed - nested)
+            if self.stack:
+                # the enclosing span leaves out all of this span's time, its nested spans included
+                self.stack[-1] += nested
+
+    def timed_iter(self, name, iterable, counter=None):
+        """
+        Time how long an iterable takes to produce its items (e.g, reading the changed files) without reading it all up front
+        :param counter: Optional counter to add the number of items to
+        """
+        iterator = iter(iterable)
+        items = 0
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    break
+                finally:
+                    self.add_span_time(name, time.perf_counter() - start, count=0)
+                items += 1
+                yield item
+        finally:
+            self.spans.setdefault(name, {"seconds": 0.0, "count": 0})["count"] += 1
+            if counter:
+                self.count(counter, items)
+
+    def count(self, name, value=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def set_gauge(self, name, value):
+        with self.lock:
+            self.gauges[name] = value
+
+    def to_dict(self):
+        total = time.perf_counter() - self.started
+        return {
+            "total_seconds": round(total, 4),
+            "spans": dict((name, {"seconds": round(span["seconds"], 4), "count": span["count"]}) for name, span in self.spans.items()),
+            "counters": dict(self.counters),
+            "gauges": dict(self.gauges),
+        }
+
+    def to_markdown(self, title="Modules configuration"):
+        """
+        :return: The metrics as Markdown tables, the spans with their share of the total time
+        """
+        metrics = self.to_dict()
+        total = metrics["total_seconds"] or 1
+        lines = [f"### {title}", "", "| Phase | Seconds | Share | Calls |", "| --- | ---: | ---: | ---: |"]
+        for name, span in metrics["spans"].items():
+            lines.append(f"| {name} | {span['seconds']:.3f} | {span['seconds'] / total:.0%} | {span['count']} |")
+        other = metrics["total_seconds"] - sum(span["seconds"] for span in metrics["spans"].values())
+        lines.append(f"| other | {other:.3f} | {other / total:.0%} | |")
+        lines.append(f"| **total** | **{metrics['total_seconds']:.3f}** | | |")
+        values = dict(metrics["counters"], **metrics["gauges"])
+        if values:
+            lines.extend(["", "| Counter | Value |", "| --- | ---: |"])
+            lines.extend(f"| {name} | {value} |" for name, value in values.items())
+        return "\n".join(lines) + "\n"
+
+    def write(self):
+        """
+        Write the metrics json file and, in Github Actions, add the Markdown tables to the job summary
+        :return: The metrics dictionary
+        """
+        metrics = self.to_dict()
+        if self.path:
+            write_json_atomic(self.path, metrics, indent=2)
+        if os.environ.get(self.summary_env_var):
+            with open(os.environ[self.summary_env_var], "a") as fh:
+                fh.write(self.to_markdown())
+        logging.info("Metrics - %s", json.dumps(metrics))
+        return metrics
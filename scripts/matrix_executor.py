@@ -0,0 +1,209 @@
+"""
+Runs a tests matrix locally, so the suites CI would run can be checked before pushing
+    python -m scripts run                               # the matrix for the working tree changes against HEAD
+    python -m scripts run --base origin/main --fail-fast
+    python -m scripts run --matrix matrix.json          # a matrix built by build_tests_matrix_config (plain or sharded)
+Each matrix entry runs modules/<module>/tests/<test>. By default every test*.py file in the suite directory is run with
+the current Python, from the repository root. Another runner can be used with --command (or MODULES_CONFIG_TEST_COMMAND),
+a template with {path}, {module} and {test} placeholders, e.g, "pytest -q {path}".
+The entries run in parallel, as many at once as there are CPUs. Their output is streamed line by line, prefixed with the
+entry it came from. The run is summarised the way Github reports a matrix job: a result of success, failure, cancelled or
+skipped (a suite with no tests to run) for each entry and for the run as a whole. Durations are recorded in the timings
+store and passes in the result cache, as a CI run does (see timing_store.py and result_cache.py). Skipped suites are not.
+"""
+
+import json
+import logging
+import os
+import shlex
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from scripts.change_detector import ChangeDetector
+
+
+class MatrixExecutor:
+
+    command_env_var = "MODULES_CONFIG_TEST_COMMAND"
+    test_file_prefix = "test"
+    test_file_suffix = ".py"
+
+    def __init__(self, app, max_workers=None, fail_fast=False, command=None, output=None):
+        """
+        :param app: The ModulesConfig of the repository. Its classifier finds the module directories, and its timing store and
+                    result cache record the results
+        :param max_workers: Optional number of entries run at once. Defaults to the number of CPUs
+        :param fail_fast: True to cancel the remaining entries once one fails, as strategy.fail-fast does
+        :param command: Optional command template to run a suite with. Defaults to MODULES_CONFIG_TEST_COMMAND, otherwise each test*.py file is run with Python
+        :param output: Optional text stream for the job output. Defaults to stdout
+        """
+        self.app = app
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.fail_fast = fail_fast
+        self.command = command or os.environ.get(self.command_env_var)
+        self.output = output or sys.stdout
+        self.output_lock = threading.Lock()
+        self.cancelled = threading.Event()
+        self.processes = set()    # running processes, terminated when the run is cancelled
+        self.processes_lock = threading.Lock()
+
+    def get_repo_path(self):
+        return self.app.repo_path or os.getcwd()
+
+    def build_matrix(self, base="HEAD"):
+        """
+        Build the tests matrix for the working tree changes, as the CI workflow would for a push of them
+        :param base: The commit to compare the working tree with
+        :return: The matrix ({"include": [...]}), or None if no tests need to run
+        """
+        paths = ChangeDetector(self.app.classifier, repo_path=self.app.repo_path).iter_working_tree_files(base)
+        # the outputs are collected rather than written to GITHUB_OUTPUT
+        self.app.buffer_outputs()
+        self.app.build_modules_config(paths, "MODULES_CONFIG", versions=False)
+        self.app.build_tests_matrix_config()
+        outputs = dict(self.app.output_buffer)
+        self.app.output_buffer = None
+        return json.loads(outputs["TESTS_MATRIX_OUTPUT"]) if "TESTS_MATRIX_OUTPUT" in outputs else None
+
+    def get_jobs(self, matrix):
+        """
+        :param matrix: A tests matrix, either one entry per module/test pair or sharded (each include holding a "jobs" list)
+        :return: A list of {"module", "test"} dictionaries
+        """
+        jobs = []
+        for include in (matrix or {}).get("include", []):
+            jobs.extend(include["jobs"] if "jobs" in include else [include])
+        return [{"module": job["module"], "test": job["test"]} for job in jobs]
+
+    def get_commands(self, module, test):
+        """
+        :return: The list of commands (argument lists) that run a module's suite
+        """
+        suite_path = os.path.join(self.app.classifier.get_module_path(module), "tests", test)
+        if self.command:
+            return [shlex.split(self.command.format(path=suite_path, module=module, test=test))]
+        directory = os.path.join(self.get_repo_path(), suite_path)
+        test_files = sorted(
+            name for name in os.listdir(directory)
+            if name.startswith(self.test_file_prefix) and name.endswith(self.test_file_suffix)
+        ) if os.path.isdir(directory) else []
+        return [[sys.executable, os.path.join(suite_path, name)] for name in test_files]
+
+    def write_line(self, prefix, line):
+        with self.output_lock:
+            self.output.write(f"[{prefix}] {line}")
+            if not line.endswith("\n"):
+                self.output.write("\n")
+            self.output.flush()
+
+    def run_command(self, prefix, command):
+        """
+        Run one command, streaming its output
+        :return: The exit code
+        """
+        process = subprocess.Popen(
+            command, cwd=self.get_repo_path(), stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+            text=True, errors="replace", bufsize=1,
+        )
+        with self.processes_lock:
+            self.processes.add(process)
+        try:
+            for line in process.stdout:
+                self.write_line(prefix, line)
+            return process.wait()
+        finally:
+            with self.processes_lock:
+                self.processes.discard(process)
+
+    def run_job(self, job):
+        """
+        Run a matrix entry
+        :return: The job dictionary with its result, exit code and duration
+        """
+        prefix = f"{job['module']} - {job['test']}"
+        if self.cancelled.is_set():
+            return dict(job, result="cancelled", returncode=None, duration=0.0)
+        start = time.perf_counter()
+        returncode = None    # stays None if the suite has nothing to run
+        try:
+            for command in self.get_commands(job["module"], job["test"]):
+                self.write_line(prefix, f"$ {shlex.join(command)}")
+                returncode = self.run_command(prefix, command)
+                if returncode != 0 or self.cancelled.is_set():
+                    break
+        except OSError as e:
+            self.write_line(prefix, f"unable to run the suite: {e}")
+            returncode = 127
+        duration = time.perf_counter() - start
+        if returncode is None:
+            # no test files: nothing was tested, so it mustn't count (or be recorded) as a pass
+            self.write_line(prefix, "no tests found to run")
+            result = "skipped"
+        elif self.cancelled.is_set() and returncode != 0:
+            result = "cancelled"
+        else:
+            result = "success" if returncode == 0 else "failure"
+        self.write_line(prefix, f"{result} in {duration:.1f}s")
+        return dict(job, result=result, returncode=returncode, duration=round(duration, 3))
+
+    def cancel(self):
+        """
+        Cancel the run: entries not started yet are skipped and the running ones terminated
+        """
+        self.cancelled.set()
+        with self.processes_lock:
+            for process in self.processes:
+                process.terminate()
+
+    def record(self, results, fingerprints):
+        """
+        Record the durations of the finished entries and the suites that passed, as the CI jobs do
+        """
+        for job in results:
+            if job["result"] in ("cancelled", "skipped"):
+                continue
+            passed = job["result"] == "success"
+            self.app.timing_store.record(job["module"], job["test"], job["duration"], passed)
+            if passed:
+                self.app.result_cache.record(fingerprints.get(job["module"]), job["module"], job["test"])
+
+    def run(self, matrix):
+        """
+        Run every entry of a tests matrix
+        :param matrix: The tests matrix, see get_jobs
+        :return: The aggregated result, {"result": "success|failure|cancelled|skipped", "jobs": [...], "duration": seconds}
+        """
+        jobs = self.get_jobs(matrix)
+        start = time.perf_counter()
+        # taken before the suites run, so files they write can't change the fingerprint recorded with the passes
+        fingerprints = self.app.fingerprinter.get_fingerprints(sorted(set(job["module"] for job in jobs))) if jobs and self.app.result_cache.path else {}
+
+        results = []
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = [executor.submit(self.run_job, job) for job in jobs]
+            for future in as_completed(futures):
+                job = future.result()
+                results.append(job)
+                if job["result"] == "failure" and self.fail_fast and not self.cancelled.is_set():
+                    logging.info("MatrixExecutor - %s %s failed, cancelling the remaining jobs", job["module"], job["test"])
+                    self.cancel()
+        # in matrix order rather than the order they finished in
+        order = dict(((job["module"], job["test"]), index) for index, job in enumerate(jobs))
+        results.sort(key=lambda job: order[(job["module"], job["test"])])
+        self.record(results, fingerprints)
+
+        if any(job["result"] == "failure" for job in results):
+            result = "failure"
+        elif any(job["result"] == "cancelled" for job in results):
+            result = "cancelled"
+        elif any(job["result"] == "success" for job in results):
+            result = "success"
+        else:
+            # not one suite had anything to run
+            result = "skipped"
+        counts = {}
+        for job in results:
+            counts[job["result"]] = counts.get(job["result"], 0) + 1
+        return {"result": result, "counts": counts, "jobs": results, "duration": round(time.perf_counter() - start, 3)}
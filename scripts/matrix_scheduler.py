@@ -0,0 +1,73 @@
+"""
+Packs module/test pairs into a limited number of matrix shards, balanced by expected duration
+Github fails a workflow whose matrix has more than 256 jobs, and every small suite run as its own job pays a full runner start up.
+Pairs are assigned longest first to the least loaded shard (LPT scheduling), which keeps the shards close to the same length.
+"""
+
+import heapq
+
+
+class MatrixScheduler:
+
+    max_jobs = 256                                  # Github's limit on the number of jobs a matrix can generate
+    default_durations = {"unit": 60, "bdd": 300}    # expected seconds per suite type when there's nothing better to go on
+    default_duration = 120
+
+    def __init__(self, duration_estimator=None):
+        """
+        :param duration_estimator: Optional function of (module, test) returning the expected duration in seconds (or None if unknown)
+        """
+        self.duration_estimator = duration_estimator
+
+    def estimate(self, module, test):
+        """
+        :return: The expected duration in seconds of a module's test suite
+        """
+        if self.duration_estimator is not None:
+            duration = self.duration_estimator(module, test)
+            if duration is not None:
+                return duration
+        return self.default_durations.get(test, self.default_duration)
+
+    def order(self, entries):
+        """
+        Sort matrix entries longest first so the slowest suites get a runner first (the sort is stable for equal estimates)
+        """
+        return sorted(entries, key=lambda entry: -self.estimate(entry["module"], entry["test"]))
+
+    def critical_path(self, includes):
+        """
+        Estimate the wall clock time of the matrix, assuming every job gets a runner straight away
+        :param includes: The matrix includes, either {"module", "test"} entries or shards
+        :return: The expected duration in seconds of the longest job
+        """
+        return max(
+            (include["expected_duration"] if "shard" in include else self.estimate(include["module"], include["test"]) for include in includes),
+            default=0,
+        )
+
+    def shard(self, entries, shards):
+        """
+        Bin-pack matrix entries into shards
+        :param entries: A list of {"module", "test"} dictionaries
+        :param shards: The number of shards wanted. Capped at the matrix job limit and the number of entries
+        :return: A list of {"shard", "expected_duration", "jobs"} dictionaries, one per non empty shard
+        """
+        shards = max(1, min(shards, self.max_jobs, len(entries)))
+        timed_entries = sorted(
+            ((self.estimate(entry["module"], entry["test"]), index, entry) for index, entry in enumerate(entries)),
+            key=lambda timed_entry: (-timed_entry[0], timed_entry[1]),
+        )
+        # heap of (total expected duration, shard number) so the least loaded shard is always on top
+        loads = [(0, shard_number) for shard_number in range(shards)]
+        jobs = [[] for _ in range(shards)]
+        for duration, _index, entry in timed_entries:
+            load, shard_number = heapq.heappop(loads)
+            jobs[shard_number].append(entry)
+            heapq.heappush(loads, (load + duration, shard_number))
+
+        totals = dict((shard_number, load) for load, shard_number in loads)
+        return [
+            {"shard": shard_number + 1, "expected_duration": totals[shard_number], "jobs": shard_jobs}
+            for shard_number, shard_jobs in enumerate(jobs) if shard_jobs
+        ]
@@ -0,0 +1,154 @@
+"""
+Maps changed file paths to the module that owns them
+The module roots (e.g, modules/) are scanned once and every module directory is compiled into a path trie, so a path is
+classified by walking its components (time proportional to the path length, not to the number of modules).
+Supports several roots and nested module directories such as modules/networking/vpc.
+"""
+
+import logging
+import os
+
+
+class TrieNode:
+    """
+    A directory in the path trie
+    """
+
+    __slots__ = ("children", "module", "path")
+
+    def __init__(self, path):
+        self.children = {}     # directory name -> TrieNode
+        self.module = None     # module name if this directory is a module
+        self.path = path       # directory path relative to the repository root
+
+
+class ModuleClassifier:
+
+    default_roots = ["modules"]
+    roots_env_var = "MODULES_CONFIG_ROOTS"    # comma separated list of module root directories
+    module_marker_suffixes = (".tf",)          # a directory holding one of these files is a module. Directories without one are treated as groups of modules, unless nothing under a root's directory holds one
+
+    def __init__(self, roots=None, repo_path=None):
+        """
+        :param roots: A list of module root directories relative to the repository root. Defaults to MODULES_CONFIG_ROOTS or ["modules"]
+        :param repo_path: Path to the repository root. Defaults to the current directory when the trie is compiled
+        """
+        if roots is None:
+            roots = [root for root in os.environ.get(self.roots_env_var, "").split(",") if root] or self.default_roots
+        self.roots = [root.strip("/") for root in roots]
+        self.root_paths = set(self.roots)
+        self.repo_path = repo_path
+        self.trie = None
+        self.modules = {}            # module name -> module directory relative to the repository root
+        self.directory_cache = {}    # directory of a classified path -> module name (or None), as many changed files share a directory
+
+    def compile(self):
+        """
+        Build the path trie by scanning each module root once
+        Module directories are not descended into, only group directories (those without module files) are
+        """
+        if self.trie is not None:
+            return self.trie
+        repo_path = self.repo_path or os.getcwd()
+        self.trie = TrieNode("")
+        for root in self.roots:
+            node = self.trie
+            for part in root.split("/"):
+                node = node.children.setdefault(part, TrieNode(f"{node.path}/{part}".lstrip("/")))
+            self.scan_directory(os.path.join(repo_path, root), node, "")
+        logging.debug(f"ModuleClassifier - compiled {len(self.modules)} module(s) under {self.roots}")
+        return self.trie
+
+    def scan_directory(self, directory, node, name_prefix):
+        """
+        Add the sub directories of a root or group directory to the trie
+        A directory directly under a root with no module file in or under it (e.g, a module whose .tf files are all in sub
+        directories, or that has just lost its last one) isn't a group, so it is taken as a module, as the baseline's
+        directory depth rule did
+        :return: True if any module was found under the directory
+        """
+        try:
+            entries = [entry for entry in os.scandir(directory) if entry.is_dir()]
+        except OSError:
+            return False
+        found = False
+        for entry in entries:
+            child = node.children.setdefault(entry.name, TrieNode(f"{node.path}/{entry.name}"))
+            module_name = f"{name_prefix}{entry.name}"
+            if self.is_module_directory(entry.path):
+                is_module = True
+            elif self.scan_directory(entry.path, child, f"{module_name}/"):
+                found = True
+                continue
+            else:
+                is_module = not name_prefix and not entry.name.startswith(".")
+            if is_module:
+                child.module = module_name
+                self.modules[module_name] = child.path
+                found = True
+        return found
+
+    def is_module_directory(self, directory):
+        """
+        :return: True if the directory directly holds a module file (e.g, main.tf)
+        """
+        try:
+            return any(entry.is_file() and entry.name.endswith(self.module_marker_suffixes) for entry in os.scandir(directory))
+        except OSError:
+            return False
+
+    def classify(self, path):
+        """
+        Find the module that owns a path
+        Paths in a directory that isn't on disk (e.g, a deleted module) are assigned to that directory
+        :param path: A file path relative to the repository root, e.g, modules/module1/tests/unit/test.py
+        :return: The module name or None if the path isn't part of a module
+        """
+        directory, _, _ = path.replace(os.path.sep, "/").rpartition("/")
+        if directory in self.directory_cache:
+            return self.directory_cache[directory]
+
+        node = self.compile()
+        module = None
+        root_depth = None
+        parts = directory.split("/") if directory else []
+        for depth, part in enumerate(parts):
+            child = node.children.get(part)
+            if child is None:
+                # Directory not on disk (e.g, a deleted module) under a root or group, so treat it as the module
+                if root_depth is not None:
+                    module = "/".join(parts[root_depth + 1:depth + 1])
+                break
+            node = child
+            if node.module is not None:
+                module = node.module
+                break
+            if root_depth is None and node.path in self.root_paths:
+                root_depth = depth
+        if module is None and root_depth is not None and len(parts) > root_depth + 1:
+            # in a group directory, but not in any of its modules. Logged once per directory as the result is cached
+            logging.warning(f"ModuleClassifier - {path} isn't in a module directory (no {', '.join(self.module_marker_suffixes)} file found), its changes are ignored")
+        self.directory_cache[directory] = module
+        return module
+
+    def classify_many(self, paths):
+        """
+        Map many paths to their modules, removing duplicates
+        :param paths: An iterable of file paths
+        :return: A list of module names in the order they were first seen
+        """
+        seen = set()
+        modules = []
+        for path in paths:
+            module = self.classify(path)
+            if module is not None and module not in seen:
+                seen.add(module)
+                modules.append(module)
+        return modules
+
+    def get_module_path(self, module):
+        """
+        :return: The module directory relative to the repository root, e.g, modules/networking/vpc
+        """
+        self.compile()
+        return self.modules.get(module, f"{self.roots[0]}/{module}")
@@ -0,0 +1,166 @@
+"""
+Content fingerprints of module directories
+A module's fingerprint is the Merkle hash of its directory: the git tree hash of HEAD:<module path> when the module has no
+uncommitted changes, otherwise the same tree hash computed from the files on disk (hashed in parallel). Both give the same
+value for the same content, so a revert, rebase or re-push of an identical module tree gets the same fingerprint.
+Modules that use other modules (Terraform module blocks) fold the fingerprints of their dependencies into their own.
+"""
+
+import hashlib
+import logging
+import os
+import stat
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from scripts.module_classifier import ModuleClassifier
+from scripts.change_detector import ChangeDetector
+
+
+class ModuleFingerprinter:
+
+    ignored_names = {".git", ".terraform", "__pycache__", ".pytest_cache"}    # generated content that is never committed
+    max_workers = 8
+
+    def __init__(self, classifier=None, repo_path=None, dependencies=None, max_workers=None):
+        """
+        :param classifier: ModuleClassifier used to find the module directories
+        :param repo_path: Path to the repository root. Defaults to the current directory
+        :param dependencies: Optional function of a module name returning the modules it uses
+        :param max_workers: Optional number of threads to hash files with
+        """
+        self.classifier = classifier or ModuleClassifier(repo_path=repo_path)
+        self.repo_path = repo_path
+        self.dependencies = dependencies
+        if max_workers is not None:
+            self.max_workers = max_workers
+        self.tree_hashes = {}      # module -> hash of the module directory alone
+        self.fingerprints = {}     # module -> hash of the module directory and its dependencies
+
+    def get_dirty_paths(self, paths, pathspecs=None):
+        """
+        :param pathspecs: Optional paths to limit git status to in place of the paths themselves, e.g, the module roots, as
+            git matches every file against every pathspec, which gets slow for hundreds of them
+        :return: The set of paths (of those given) that have uncommitted or untracked changes
+        """
+        output = subprocess.run(
+            ["git", "status", "--porcelain", "-z", "--no-renames", "--untracked-files=all", "--", *(paths if pathspecs is None else pathspecs)],
+            cwd=self.repo_path, capture_output=True, check=True,
+        ).stdout.decode("utf-8", "surrogateescape")
+        changed_files = [entry[3:] for entry in output.split("\0") if len(entry) > 3]
+        return set(path for path in paths if any(changed_file.startswith(f"{path}/") for changed_file in changed_files))
+
+    def get_git_tree_hashes(self, modules):
+        """
+        Look up the committed tree hash of each clean module with one git status and one git cat-file call
+        :return: A dictionary of module to tree hash. Modules with local changes, or all of them if git isn't usable, are left out
+        """
+        paths = dict((module, self.classifier.get_module_path(module)) for module in modules)
+        try:
+            dirty_paths = self.get_dirty_paths(list(paths.values()))
+            clean_modules = [module for module, path in paths.items() if path not in dirty_paths]
+            if not clean_modules:
+                return {}
+            trees = ChangeDetector(self.classifier, self.repo_path).resolve_trees([f"HEAD:{paths[module]}" for module in clean_modules])
+        except (OSError, subprocess.CalledProcessError) as e:
+            logging.debug(f"ModuleFingerprinter - git unavailable, hashing files instead: {e}")
+            return {}
+        return dict((module, trees[f"HEAD:{paths[module]}"]) for module in clean_modules)
+
+    def hash_file(self, path, mode):
+        """
+        Hash a file the way git hashes a blob. Symlinks hash their target
+        """
+        if stat.S_ISLNK(mode):
+            content = os.readlink(path).encode("utf-8", "surrogateescape")
+        else:
+            with open(path, "rb") as fh:
+                content = fh.read()
+        return hashlib.sha1(b"blob %d\0" % len(content) + content).digest()
+
+    def get_file_tree_hashes(self, modules):
+        """
+        Compute the tree hash of each module from the files on disk, hashing the files in parallel
+        :return: A dictionary of module to tree hash
+        """
+        repo_path = self.repo_path or os.getcwd()
+        files = []         # (directory, name, git mode, full path, stat mode)
+        directories = {}   # directory -> list of sub directory names
+        module_directories = {}
+        for module in modules:
+            module_directory = os.path.join(repo_path, self.classifier.get_module_path(module))
+            module_directories[module] = module_directory
+            for directory, dir_names, file_names in os.walk(module_directory):
+                dir_names[:] = [name for name in dir_names if name not in self.ignored_names and not os.path.islink(os.path.join(directory, name))]
+                directories[directory] = list(dir_names)
+                for name in file_names:
+                    path = os.path.join(directory, name)
+                    mode = os.lstat(path).st_mode
+                    git_mode = b"120000" if stat.S_ISLNK(mode) else b"100755" if mode & stat.S_IXUSR else b"100644"
+                    files.append((directory, name, git_mode, path, mode))
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            file_hashes = list(executor.map(lambda file: self.hash_file(file[3], file[4]), files))
+
+        entries = {}    # directory -> list of (sort key, entry bytes)
+        for (directory, name, git_mode, _path, _mode), file_hash in zip(files, file_hashes):
+            encoded_name = name.encode("utf-8", "surrogateescape")
+            entries.setdefault(directory, []).append((encoded_name, git_mode + b" " + encoded_name + b"\0" + file_hash))
+
+        tree_hashes = {}
+        # Deepest directories first so each sub tree is hashed before its parent. Empty directories aren't stored by git
+        for directory in sorted(directories, key=lambda directory: directory.count(os.sep), reverse=True):
+            for name in directories[directory]:
+                sub_tree = tree_hashes.get(os.path.join(directory, name))
+                if sub_tree is not None:
+                    encoded_name = name.encode("utf-8", "surrogateescape")
+                    # git sorts a tree entry as if its name ended with a slash
+                    entries.setdefault(directory, []).append((encoded_name + b"/", b"40000 " + encoded_name + b"\0" + sub_tree))
+            directory_entries = entries.get(directory)
+            if directory_entries:
+                content = b"".join(entry for _key, entry in sorted(directory_entries))
+                tree_hashes[directory] = hashlib.sha1(b"tree %d\0" % len(content) + content).digest()
+        return dict((module, tree_hashes[directory].hex() if directory in tree_hashes else None) for module, directory in module_directories.items())
+
+    def get_fingerprints(self, modules):
+        """
+        Get the fingerprint of each module
+        :param modules: A list of module names
+        :return: A dictionary of module to fingerprint (None if the module directory is empty or missing)
+        """
+        self.classifier.compile()
+        wanted = [module for module in modules if module not in self.fingerprints]
+        if self.dependencies is not None:
+            # dependencies are fingerprinted too, as their content is part of the module's fingerprint
+            queue = list(wanted)
+            while queue:
+                for dependency in self.dependencies(queue.pop()):
+                    if dependency not in wanted and dependency not in self.fingerprints:
+                        wanted.append(dependency)
+                        queue.append(dependency)
+        missing = [module for module in wanted if module not in self.tree_hashes and module in self.classifier.modules]
+        if missing:
+            git_hashes = self.get_git_tree_hashes(missing)
+            self.tree_hashes.update(git_hashes)
+            unhashed = [module for module in missing if module not in git_hashes]
+            if unhashed:
+                self.tree_hashes.update(self.get_file_tree_hashes(unhashed))
+            logging.debug(f"ModuleFingerprinter - {len(git_hashes)} module(s) fingerprinted from git, {len(unhashed)} from the files on disk")
+        return dict((module, self.get_fingerprint(module)) for module in modules)
+
+    def get_fingerprint(self, module, visiting=()):
+        if module in self.fingerprints:
+            return self.fingerprints[module]
+        tree_hash = self.tree_hashes.get(module)
+        dependencies = sorted(self.dependencies(module)) if self.dependencies is not None and tree_hash is not None else []
+        if not dependencies:
+            fingerprint = tree_hash
+        else:
+            combined = hashlib.sha1(tree_hash.encode())
+            for dependency in dependencies:
+                # a dependency cycle can't be followed any further, so the module's name stands in for it
+                dependency_fingerprint = dependency if dependency in visiting else self.get_fingerprint(dependency, visiting + (module,))
+                combined.update(f"\n{dependency}:{dependency_fingerprint}".encode())
+            fingerprint = combined.hexdigest()
+        if not visiting:
+            self.fingerprints[module] = fingerprint
+        return fingerprint
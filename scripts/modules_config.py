@@ -3,212 +3,615 @@ import logging
 import os
 import sys
 import json
-# Make sure requirements.txt has entries for the PyGitHub and semver modules
-from github import Github, GithubException, Auth
-import semver
+import subprocess
+import uuid
+from functools import cached_property
+# Make sure requirements.txt has entries for the PyGitHub and semver modules. Both are imported lazily (see tag_backends.py and tag_index.py)
+# so the paths that don't resolve versions (e.g, python -m scripts matrix) don't pay for loading them
+from scripts.tag_backends import select_tag_backend, backend_env_var, cache_env_var
+from scripts.tag_index import TagIndex
+from scripts.file_utils import get_repo_file
+from scripts.module_classifier import ModuleClassifier
+from scripts import changed_files
+from scripts.change_detector import ChangeDetector
+from scripts.suite_discovery import SuiteIndex
+from scripts.dependency_graph import DependencyGraph
+from scripts.matrix_scheduler import MatrixScheduler
+from scripts.timing_store import TimingStore
+from scripts.module_fingerprint import ModuleFingerprinter
+from scripts.result_cache import ResultCache
+from scripts.config_payload import ConfigPayload
+from scripts.config_snapshot import ConfigSnapshot
+from scripts.config_store import ModulesConfigStore
+from scripts.version_engine import VersionEngine
+from scripts.path_rules import PathRules
+from scripts.instrumentation import Metrics
 
 class ModulesConfig:
 
     logfile_name = "modules_config.log"
+    log_level_env_var = "MODULES_CONFIG_LOG_LEVEL"    # level of the file (and screen) logging, e.g, DEBUG, INFO or WARNING
+    default_log_level = "INFO"
     args = None
     modules_config_env_var = "MODULES_CONFIG"
-    modules_config = []    # List to use to generate and store module configuration dictionaries or to hold a preopolated modules configuration
-    tests_list = ["unit", "bdd"] # here for now. Can make it a dynamic module loader later
+    modules_config = None    # ModulesConfigStore (set per instance) to generate and store module configurations or to hold a prepopulated modules configuration
+    tests_list = ["unit", "bdd"] # suites listed first (in this order). Any other suite directories are discovered dynamically and follow alphabetically
+    matrix_shards_env_var = "MODULES_CONFIG_MATRIX_SHARDS"    # if set above 0, the tests matrix is packed into this many shards balanced by expected duration
+    timings_env_var = "MODULES_CONFIG_TIMINGS"    # path of the recorded test suite durations
+    result_cache_env_var = "MODULES_CONFIG_RESULT_CACHE"    # path of the record of suites that passed per module fingerprint. Set to an empty string to always run every suite
+    include_dependents = True    # also configure modules that use a changed module (directly or transitively) through a Terraform module block
+    tag_backend_env_var = backend_env_var    # "local", "api" or "auto" (default). Auto reads the local git refs and falls back to the Github API
+    tag_cache_env_var = cache_env_var        # path of the on-disk cache of Github API tag lookups. Set to an empty string to disable the cache
+    tag_concurrency_env_var = "MODULES_CONFIG_TAG_CONCURRENCY"    # if set above 0, tags are looked up per module with this many lookups in flight instead of one batched listing
 
 
-    def __init__(self, modules_config=[]):
+    def __init__(self, modules_config=[], tag_backend=None, tag_concurrency=None, classifier=None, log_level=None, metrics=None, repo_path=None):
         """
         Constructor for the ModulesConfig class
         If supplied with a prebuilt modules_config in json then convert it to a python object and use that
+        :param tag_backend: Optional backend object used to look up module tags (see tag_backends.py). Chosen automatically if not supplied
+        :param tag_concurrency: Optional number of concurrent per module tag lookups. For when a single batched listing isn't possible (e.g, some Github Enterprise versions)
+        :param classifier: Optional ModuleClassifier used to map changed files to modules. Defaults to one using the "modules" root (or MODULES_CONFIG_ROOTS)
+        :param log_level: Optional logging level name or number. Defaults to MODULES_CONFIG_LOG_LEVEL, otherwise INFO
+        :param metrics: Optional Metrics to record the timings and counters of the run in (see instrumentation.py)
+        :param repo_path: Optional path of the repository to work on, with its caches kept under it. Defaults to the current directory
+                          Lets several repositories be worked on at once from one process (see batch_mode.py)
         """
-        # Sets up normal file logging (DEBUG) and add additional logging formatting
-        # TODO: Pass in log level required (currently hardcoded to DEBUG)
-        logging.basicConfig(filename=self.logfile_name,level=logging.DEBUG, format='%(asctime)s %(name)s %(levelname)s: %(message)s')
+        self.repo_path = repo_path
+        self.modules_config = ModulesConfigStore()    # module name -> module configuration record
+        self.classifier = classifier or ModuleClassifier(repo_path=repo_path)
+        self.tag_backend = tag_backend
+        self.tag_concurrency = tag_concurrency if tag_concurrency is not None else int(os.environ.get(self.tag_concurrency_env_var) or 0)
+        self.tag_index = None    # semver ordered index of the module tags, built when the versions are resolved
+        self.output_buffer = None    # list of (output_var, json) held back in pipeline mode until write_outputs is called
+        self.modules_config_reference = None    # set instead of modules_config when the configuration is held in a spill file or snapshot, see config_payload.py
+        if metrics is not None:
+            self.metrics = metrics
+        self.log_level = self.setup_logging(log_level)
         logging.info('ModulesConfig initialising...')
 
         # If we have passed in a modules_config then use that. Mainly intended for overriding the default/calculated modules_config for testing purposes.
         if modules_config:
             logging.debug("ModulesConfig - modules_config supplied")
-            self.modules_config = json.loads(modules_config)
+            self.load_modules_config_json(modules_config)
+        elif os.environ.get(ConfigSnapshot.snapshot_env_var) and os.path.isfile(self.get_repo_file(os.environ[ConfigSnapshot.snapshot_env_var])):
+            # A snapshot downloaded by a matrix job is preferred to MODULES_CONFIG, as single modules are read from it without parsing the rest
+            logging.debug("ModulesConfig - modules_config snapshot found in environment")
+            self.modules_config_reference = {"format": "snapshot", "path": self.get_repo_file(os.environ[ConfigSnapshot.snapshot_env_var])}
         else:
             # Check to see if we have a modules_config already set in the environment. If so use that, otherwise build a new one
             if self.modules_config_env_var in os.environ and os.environ[self.modules_config_env_var] != "":
                 # First read the environment to see if we already have a modules_config set
                 logging.debug("ModulesConfig - populated modules_config found in environment")
-                self.modules_config = json.loads(os.environ[self.modules_config_env_var])
+                self.load_modules_config_json(os.environ[self.modules_config_env_var])
             else:
                 # Nothing found so genreate a new modules_config by parsing the changed files
                 logging.debug("ModulesConfig - no populated modules_config found in environment. A new configuration will be built")
 
 
-    def output_logging(self):
+    # The subsystems below are built on first use, so a run only sets up (and reads the caches of) the ones it needs,
+    # e.g, python -m scripts matrix never reads the suite manifest, rule files or commit history
+
+    @cached_property
+    def path_rules(self):
+        """
+        What each changed path does to its module (trigger, bump only or ignore)
+        """
+        return PathRules(self.classifier, cache_path=self.get_repo_file(PathRules.default_cache_path), repo_path=self.repo_path)
+
+    @cached_property
+    def suite_index(self):
+        """
+        Cached module -> test suites manifest
+        """
+        return SuiteIndex(self.classifier, cache_path=self.get_repo_file(SuiteIndex.default_cache_path), repo_path=self.repo_path, preferred_order=self.tests_list)
+
+    @cached_property
+    def dependency_graph(self):
+        """
+        Cached Terraform module dependencies
+        """
+        return DependencyGraph(self.classifier, cache_path=self.get_repo_file(DependencyGraph.default_cache_path), repo_path=self.repo_path)
+
+    @cached_property
+    def timing_store(self):
         """
-        Add an additional (INFO) logger (to the file logger) to also output information to the screen. Intended for terminal, AWS Lambda functions or similar.
+        Recorded durations of previous test runs
+        """
+        return TimingStore(self.get_repo_file(os.environ.get(self.timings_env_var) or TimingStore.default_path))
+
+    @cached_property
+    def matrix_scheduler(self):
+        return MatrixScheduler(self.timing_store.estimate)
+
+    @cached_property
+    def version_engine(self):
+        """
+        Next versions from the commit messages since each module's last tag
+        """
+        return VersionEngine(self.classifier, repo_path=self.repo_path)
+
+    @cached_property
+    def fingerprinter(self):
+        return ModuleFingerprinter(self.classifier, repo_path=self.repo_path, dependencies=self.dependency_graph.get_dependencies)
+
+    @cached_property
+    def result_cache(self):
+        """
+        Suites that already passed for a module fingerprint
+        """
+        return ResultCache(self.get_repo_file(os.environ.get(self.result_cache_env_var, ResultCache.default_path)))
+
+    @cached_property
+    def payload(self):
+        """
+        Keeps the MODULES_CONFIG output within Github's output size limit
+        """
+        return ConfigPayload(spill_path=self.get_repo_file(ConfigPayload.spill_path))
+
+    @cached_property
+    def metrics(self):
+        """
+        Where the time and Github API calls of the run went. Replaced by the metrics passed to the constructor, if any
+        """
+        return Metrics(self.get_repo_file(os.environ.get(Metrics.metrics_env_var, Metrics.default_path)))
+
+
+    def load_modules_config_json(self, modules_config_json):
+        """
+        Use a modules_config in any of the output formats (plain, compact or a reference to a spill file or snapshot, see config_payload.py)
+        A spilled configuration isn't read until it is needed, and single modules are then read from it on their own (see get_module)
+        """
+        modules_config = self.payload.decode(json.loads(modules_config_json))
+        if self.payload.is_spilled(modules_config):
+            logging.debug(f"ModulesConfig - modules_config held in {modules_config['path']}")
+            self.modules_config_reference = modules_config
+            self.modules_config = ModulesConfigStore()
+        else:
+            self.modules_config = ModulesConfigStore(modules_config)
+
+
+    def merge_modules_config(self, modules_config_json=None):
+        """
+        Merge a delta into the configuration, e.g, the versions or tests of a few modules updated by a later job
+        :param modules_config_json: A (partial) configuration in any of the output formats. Defaults to the MODULES_CONFIG environment variable
+        :return: The merged configuration in the list format
+        """
+        store = self.get_modules_config()
+        if modules_config_json is None:
+            store.merge_env(self.modules_config_env_var, self.payload.decode)
+        else:
+            store.merge(self.payload.decode(json.loads(modules_config_json)))
+        return store.to_list()
+
+
+    def has_modules_config(self):
+        return bool(self.modules_config) or self.modules_config_reference is not None
+
+
+    def get_modules_config(self):
+        """
+        :return: The ModulesConfigStore holding every module, reading it from the spill file or snapshot first if needed
+        """
+        if self.modules_config_reference is not None:
+            self.modules_config = ModulesConfigStore(self.payload.load_spilled(self.modules_config_reference))
+            self.modules_config_reference = None
+        return self.modules_config
+
+
+    def get_module(self, module_name):
+        """
+        Get the configuration of a single module
+        :return: The module dictionary or None if the module isn't in the configuration
+        """
+        if self.modules_config_reference is not None:
+            return self.payload.find_spilled(self.modules_config_reference, module_name)
+        return self.modules_config.get_module(module_name)
+
+
+    def get_module_property(self, module_name, property_name):
+        """
+        Get a single property of a module, e.g, "tests" or "versions"
+        :return: The property value or None if the module or property isn't set
+        """
+        if self.modules_config_reference is not None:
+            return (self.get_module(module_name) or {}).get(property_name)
+        return self.modules_config.get_module_property(module_name, property_name)
+
+
+    def get_repo_file(self, path):
+        """
+        :param path: A file path, relative to the repository unless absolute. An empty path (a disabled cache) is left as it is
+        :return: The path to use from the current directory
+        """
+        return get_repo_file(self.repo_path, path)
+
+
+    @classmethod
+    def get_log_level(cls, log_level=None):
+        """
+        :param log_level: A logging level name (e.g, "DEBUG") or number. Defaults to MODULES_CONFIG_LOG_LEVEL, otherwise INFO
+        :return: The logging level number
+        """
+        log_level = log_level or os.environ.get(cls.log_level_env_var) or cls.default_log_level
+        if isinstance(log_level, int):
+            return log_level
+        level = logging.getLevelName(str(log_level).upper())
+        if not isinstance(level, int):
+            raise ValueError(f"Unknown log level {log_level}, use one of DEBUG, INFO, WARNING, ERROR or CRITICAL")
+        return level
+
+
+    @classmethod
+    def setup_logging(cls, log_level=None):
+        """
+        Sets up normal file logging and add additional logging formatting. Left alone if the logging has already been set up
+        Called by the constructor, or directly by commands that don't need a ModulesConfig
+        :param log_level: Optional logging level name or number. Defaults to MODULES_CONFIG_LOG_LEVEL, otherwise INFO
+        :return: The logging level number
+        """
+        level = cls.get_log_level(log_level)
+        logging.basicConfig(filename=cls.logfile_name, level=level, format='%(asctime)s %(name)s %(levelname)s: %(message)s')
+        return level
+
+
+    @classmethod
+    def output_logging(cls, log_level=None):
+        """
+        Add an additional logger (to the file logger) to also output information to the screen. Intended for terminal, AWS Lambda functions or similar.
+        :param log_level: Optional level of the screen logging. Defaults to MODULES_CONFIG_LOG_LEVEL, otherwise INFO
         :return:
         """
         root_logger = logging.getLogger()
         output_logger = logging.StreamHandler(sys.stdout)
-        # TODO: Pass in log level required (currently hardcoded to DEBUG)
-        output_logger.setLevel(logging.DEBUG)
+        output_logger.setLevel(cls.get_log_level(log_level))
         formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
         output_logger.setFormatter(formatter)
         root_logger.addHandler(output_logger)
 
 
-    def build_modules_config(self, files_string, output_var):
+    def build_modules_config_from_stream(self, source="-", output_var="MODULES_CONFIG", null_delimited=False, versions=True):
+        """
+        Build the modules config from a stream of changed file paths rather than one large string
+        Avoids argv/output size limits on big diffs and supports paths containing spaces
+        :param source: "-" to read from stdin or the path of a file, e.g, the output of git diff --name-only -z
+        :param output_var: The GITHUB_OUTPUT variable name to use
+        :param null_delimited: True if the paths are NUL separated (git -z output), otherwise one path per line
+        :param versions: False to leave out the module versions (no tag lookups)
+        """
+        return self.build_modules_config(changed_files.iter_source(source, null_delimited), output_var, versions)
+
+
+    def build_modules_config(self, files_string, output_var, versions=True):
         """
         Build the modules config based on the files_string provided.
+        files_string can be the space separated string of file paths or any iterable of paths (processed lazily, see changed_files.py)
         Detects the modules that have changed and creates a JSON object with the module name and any tests that are present in the module directory
         This is then stored as an environment variable and can be used to determine which tests to run in the CI/CD pipeline.
-        TODO: Run a way to determine the next semver version number to use for each changed module
-              Look at python pbased ones such as semantic_versioning_release or similar
-              Could also git reference the last release tag and compare the changed files to that
+        Unless versions is False, each module's current version comes from its last <module>-<semver> tag and its next version
+        from the commit messages since that tag (see get_next_versions)
         """
         # If we haven't been supplied with an existing modules_config (either passed on or in the environment) then we need to build one
-        if not self.modules_config:
+        if not self.has_modules_config():
             # If we don't already have a modules_config set then build one
             logging.info('ModulesConfig - building new configuration...')
-            
+            self.switch_directory_if_local()
+
+            # go through each filepath (streamed, never held in memory as a whole) and get the (deduplicated) module name that owns it
+            # applying any path rules (see path_rules.py), e.g, to ignore README changes
+            with self.metrics.span("classification"):
+                changed_paths = self.metrics.timed_iter("diff_ingestion", changed_files.iter_changed_files(files_string), counter="changed_files")
+                modules_list, bump_only = self.path_rules.classify_many(changed_paths)
+            return self.build_modules_config_for_modules(modules_list, output_var, versions, bump_only=bump_only)
+
+
+    def build_modules_config_from_commits(self, base, head, output_var="MODULES_CONFIG", versions=True):
+        """
+        Build the modules config from two commits, working out the changed modules in process (see change_detector.py)
+        Replaces the git diff | grep | cut | uniq | jq chain so a single step goes from the commit shas to the config and matrix
+        :param base: The base commit sha, e.g, github.event.before or HEAD^1 for a pull request
+        :param head: The head commit sha, e.g, github.event.after or HEAD. Defaults to HEAD if empty (github.event.after isn't set on every event)
+        :param output_var: The GITHUB_OUTPUT variable name to use
+        :param versions: False to leave out the module versions (no tag lookups)
+        """
+        if not self.has_modules_config():
+            logging.info('ModulesConfig - building new configuration from commits...')
+            self.switch_directory_if_local()
+
+            change_detector = ChangeDetector(self.classifier, repo_path=self.repo_path)
+            head = change_detector.get_head(head)
+            if self.path_rules.has_rules():
+                # Comparing module trees can't tell which files changed, which the path rules need
+                with self.metrics.span("classification"):
+                    changed_paths = self.metrics.timed_iter("diff_ingestion", change_detector.iter_changed_files(base, head), counter="changed_files")
+                    modules_list, bump_only = self.path_rules.classify_many(changed_paths)
+            else:
+                # the module trees are compared directly, so the diff and classification are one step
+                with self.metrics.span("diff_ingestion"):
+                    modules_list, bump_only = change_detector.get_changed_modules(base, head), set()
+            return self.build_modules_config_for_modules(modules_list, output_var, versions, head, bump_only)
+
+
+    def switch_directory_if_local(self):
+        """
+        TODO: hack for locally testing code for now - remove when happy
+        """
+        logging.debug(os.getcwd())
+        # Only needed when run from the scripts directory, i.e, none of the module roots are found in the current directory
+        if self.repo_path is None and "GITHUB_OUTPUT" not in os.environ and not any(os.path.isdir(root) for root in self.classifier.roots):
+            # TEMP TODO: Remove as just for local testing
+            os.chdir("..")
+            logging.debug('ModulesConfig - running locally and not in Github so switching the directory to test things...')
             logging.debug(os.getcwd())
-            # TODO: hack for locally testing code for now - remove when happy
-            if "GITHUB_OUTPUT" not in os.environ:
-                # TEMP TODO: Remove as just for local testing
-                os.chdir("..")
-                logging.debug('ModulesConfig - running locally and not in Github so switching the directory to test things...')
-                logging.debug(os.getcwd())
-
-
-            files_list = files_string.split()
-            logging.debug(f"ModulesConfig - files_list: {files_list}")
-            # go through each filepath and get the module name
-            modules_list = []
-            #modules_tojson = []
-            for file in files_list:
-                path_parts = file.split(os.path.sep)
-                if path_parts[0] == "modules" and path_parts[1] not in modules_list:
-                    # keep a track of the modules we have already processed
-                    modules_list.append(path_parts[1])
-                    # add the module name to a dictionary object
-                    module_info = {
-                        "module": path_parts[1],
-                    }
-                    logging.debug(f"ModulesConfig - module_info: {module_info}")
-
-                    # check for tags and work out the next version number
-                    next_versions = self.get_modules_tag(path_parts[1])
-                    logging.debug(f"ModulesConfig - next versions: {next_versions}")
-                    # TODO: Need to parse the PR message to determine which next version to use (major, minor or patch)
-                    module_info['versions'] = next_versions
-
-                    # check for tests folders. If present add a 'tests' key to the dictionary with a list of tests to run
-                    tests_path = os.path.join(os.getcwd(), path_parts[0], path_parts[1], "tests")
-                    logging.debug(f"ModulesConfig - tests_path: {tests_path}")
-                    if os.path.isdir(tests_path):
-                        module_info['tests'] = self.get_tests_list(os.path.join(tests_path))
-                        logging.debug(f"ModulesConfig - tests: {module_info['tests']}")
-
-                    self.modules_config.append(module_info)
-
-            #print(json.dumps(modules_tojson, indent=2))
-            # If running in Github Actions then output the modules_config to GITHUB_OUTPUT
-            # If not then just return the json data
-            return self.output_json(self.modules_config, self.modules_config_env_var)
+
+
+    def build_modules_config_for_modules(self, modules_list, output_var="MODULES_CONFIG", versions=True, head="HEAD", bump_only=None):
+        """
+        Build the configuration for a list of changed modules: their versions and any tests present in the module directory
+        :param modules_list: A list of changed module names
+        :param output_var: The GITHUB_OUTPUT variable name to use
+        :param versions: False to leave out the module versions, so no tags are looked up (and neither semver nor PyGitHub is loaded)
+        :param head: The commit the next versions are worked out for
+        :param bump_only: Optional set of the modules (of modules_list) that only had bump only changes. They get no tests and don't affect their dependents
+        """
+        bump_only = bump_only or set()
+        logging.debug("ModulesConfig - modules_list: %s", modules_list)
+        self.metrics.count("changed_modules", len(modules_list))
+
+        # add the modules affected through Terraform module dependencies on a changed module
+        dependents = {}
+        triggering_modules = [module_name for module_name in modules_list if module_name not in bump_only]
+        if self.include_dependents and triggering_modules:
+            with self.metrics.span("dependencies"):
+                dependents = self.dependency_graph.get_affected(triggering_modules)
+                self.dependency_graph.save()
+            self.metrics.count("dependent_modules", len(dependents))
+            logging.debug("ModulesConfig - affected dependent modules: %s", dependents)
+            # a bump only module that depends on a triggering module still needs its tests run
+            bump_only = bump_only - set(dependents)
+            changed_modules = set(modules_list)
+            modules_list = list(modules_list) + [module_name for module_name in dependents if module_name not in changed_modules]
+
+        # check for tags and work out the next version numbers for all changed modules in one pass
+        with self.metrics.span("tag_resolution"):
+            modules_versions = self.get_modules_tags(modules_list) if versions else {}
+        # and the actual next version of each from the commit messages, with one walk of the history shared by all of them
+        with self.metrics.span("versioning"):
+            modules_next_versions = self.get_next_versions(modules_list, head) if versions else {}
+
+        with self.metrics.span("test_discovery"):
+            self.suite_index.prepare([module_name for module_name in modules_list if module_name not in bump_only])
+        for module_name in modules_list:
+            # add the module name to a dictionary object
+            module_info = {
+                "module": module_name,
+            }
+            if module_name in dependents:
+                # not changed itself but depends on a module that has
+                module_info['triggered_by'] = dependents[module_name]
+            logging.debug("ModulesConfig - module_info: %s", module_info)
+
+            if versions:
+                next_versions = modules_versions[module_name]
+                if module_name in modules_next_versions:
+                    next_versions["next"] = modules_next_versions[module_name]
+                logging.debug("ModulesConfig - next versions: %s", next_versions)
+                module_info['versions'] = next_versions
+
+            # check for tests folders (unless the module only had bump only changes). If present add a 'tests' key to the dictionary with a list of tests to run
+            with self.metrics.span("test_discovery"):
+                suites = self.suite_index.get_suites(module_name) if module_name not in bump_only else None
+            if suites is not None:
+                module_info['tests'] = suites
+                logging.debug("ModulesConfig - tests: %s", module_info['tests'])
+
+            self.modules_config.set_module(module_info)
+        with self.metrics.span("test_discovery"):
+            self.suite_index.save()
+
+        #print(json.dumps(modules_tojson, indent=2))
+        # If running in Github Actions then output the modules_config to GITHUB_OUTPUT
+        # If not then just return the json data
+        # Compacted or spilled to a file if it is too big for a Github output
+        with self.metrics.span("output"):
+            return self.output_json(self.modules_config.to_list(), self.modules_config_env_var, budget=True)
 
 
     def get_tests_list(self, module_tests_path):
         """
         Get the list of tests present in the specified module directory
-        :param module_path:
-        :return:
+        Every suite directory is detected with a single scan rather than checking for each known test type
+        :param module_tests_path: The module's tests directory
+        :return: A list of suite names
         """
-        detected_tests = []
-        # cycle through the known tests list and check if they exist in the module tests directory
-        for test_name in self.tests_list:
-            test_path = os.path.join(module_tests_path, test_name)
-            if os.path.isdir(test_path):
-                detected_tests.append(test_name)
-        return detected_tests
+        return self.suite_index.scan_module(os.path.dirname(os.path.normpath(module_tests_path))) or []
     
 
+    def get_tag_backend(self):
+        """
+        Get the backend used to look up module tags, choosing one on first use (see select_tag_backend)
+        :return: A tag backend object
+        """
+        if self.tag_backend is None:
+            self.tag_backend = select_tag_backend(repo_path=self.repo_path, pool_size=self.tag_concurrency or None)
+            logging.debug(f"ModulesConfig - using the {self.tag_backend.name} tag backend")
+        return self.tag_backend
+
+
     def get_modules_tag(self, reference):
         """
         Get the latest module tag
         :param reference: The module name to check for tags
         :return: A dictionary object either empty or with the current version and the next major, minor and patch versions
         """
-        # Public Web Github
-        #g = Github(auth=auth)
-        # Set in the GHA Workflow
-        auth = Auth.Token(os.environ['GH_TOKEN'])
-        g = Github(auth=auth)
-        # g = Github(os.environ['GH_TOKEN'])
-        repo = g.get_repo("T1ckL35/DetectChanges")
+        tag_index = TagIndex.from_tags({reference: self.get_tag_backend().get_module_tags(reference)})
+        self.get_tag_backend().save()
+        return self.build_versions(self.get_current_version(tag_index, reference))
 
-        # Github Enterprise with custom hostname
-        # g = Github(base_url="https://{hostname}/api/v3", auth=auth)
 
-        # Default is to define a new 0.0.0 tag if no module tags are detected. When calculated the next patch tag will be 0.0.1
-        current_semver_tag = "0.0.0"
+    def get_modules_tags(self, references):
+        """
+        Get the latest tag for many modules at once
+        Rather than one lookup per module, the tag backend lists every tag once and groups them by module prefix
+        In concurrent mode (tag_concurrency above 0) there is one lookup per module instead, run through a bounded thread pool
+        :param references: A list of module names to check for tags
+        :return: A dictionary of module name to versions object (see build_versions). Modules without tags start from 0.0.0
+        """
+        if not references:
+            return {}
+        # Each tag is parsed once into a semver ordered index. Kept on the instance for any further version queries
+        if self.tag_concurrency > 0:
+            found_tags = self.get_tag_backend().get_tags_concurrently(references, self.tag_concurrency)
+        else:
+            found_tags = self.get_tag_backend().get_tags(references)
+        self.tag_index = TagIndex.from_tags(found_tags)
+        self.get_tag_backend().save()
+        logging.debug("ModulesConfig - tag cache stats: %s", self.get_cache_stats())
+
+        modules_versions = {}
+        for reference in references:
+            modules_versions[reference] = self.build_versions(self.get_current_version(self.tag_index, reference))
+        return modules_versions
+
 
+    def get_next_versions(self, references, head="HEAD"):
+        """
+        Work out the next version of many modules from the Conventional Commit messages since each module's current tag (see version_engine.py)
+        Uses the tag index built by get_modules_tags
+        :param references: A list of module names
+        :param head: The commit to version
+        :return: A dictionary of module name to the next version string. Empty if the git history isn't available
+        """
+        if not references or self.tag_index is None:
+            return {}
+        current_versions = dict((reference, self.get_current_version(self.tag_index, reference)) for reference in references)
+        tags = dict((reference, f"{reference}-{self.tag_index.current(reference)}" if self.tag_index.current(reference) else None) for reference in references)
         try:
-            logging.debug(f"Checking GitHub Tag with reference tags/{reference}*...")
-            tag = repo.get_git_ref(f"tags/{reference}")
-            if tag._rawData:
-                logging.debug(f"GitHub Tag with reference tags/{reference}* exists...")
-
-                # grabs all found prefix named tags, gets the semver tag from the ref name and sorts them
-                current_semver_tag = sorted(list((object['ref'].removeprefix(f"refs/tags/{reference}-") for object in tag._rawData)))[-1]
-                logging.debug(f"Current found semver tag is: {current_semver_tag}")
-
-            # PyGitHub returns GitRef(ref=None) if for example searching for tag v13 and v13 does not exist, but v13.0.0 exists
-            # It returns a 404 if for example searching for tag v13.0.0 and v13.0.0 does not exist
-
-        except GithubException as e:
-            if e.status == 404:
-                # PyGitHub returns a 404 if for example searching for tag v13.0.0 and v13.0.0 does not exist
-                # Drops through and defines a new 0.0.1 tag if no tags are found
-                logging.debug(f"Unable to find GitHub Tag with reference tags/{reference}* - 404 error. Creating a first tag...")
-            else:
-                logging.debug(f"Retrieving GitHub Tag has failed with the following status code: {e.status}")
-                raise Exception(
-                    f"Retrieving GitHub Tag has failed with the following status code: {e.status}"
-                )
-        return self.build_versions(current_semver_tag)
+            bump_levels = self.version_engine.get_bump_levels(tags, head)
+        except (OSError, subprocess.CalledProcessError) as e:
+            logging.warning(f"ModulesConfig - unable to read the git history, next versions not worked out: {e}")
+            return {}
+        logging.debug(f"ModulesConfig - bump levels: {bump_levels}")
+        return dict((reference, str(self.version_engine.bump(current_versions[reference], bump_levels[reference]))) for reference in references)
+
+
+    def get_cache_stats(self):
+        """
+        Get the tag cache hit/miss counts for this run, showing how many Github API round trips were answered from the cache
+        :return: A dictionary with "hits" and "misses" counts (both 0 if the tag backend doesn't use a cache)
+        """
+        return self.get_tag_backend().get_cache_stats() or {"hits": 0, "misses": 0}
+
+
+    def get_current_version(self, tag_index, reference):
+        """
+        Pick the current version of a module from the tag index
+        :param tag_index: A TagIndex holding the module's tags
+        :param reference: The module name
+        :return: The latest stable semver.Version, the latest prerelease if there are no stable tags, or 0.0.0 if the module has no tags
+        """
+        import semver
+
+        current_version = tag_index.current(reference)
+        if current_version is None:
+            # Default is to define a new 0.0.0 tag if no module tags are detected. When calculated the next patch tag will be 0.0.1
+            current_version = semver.Version(0, 0, 0)
+        logging.debug("Current found semver tag for %s is: %s", reference, current_version)
+        return current_version
     
     
     def build_versions(self, current_version="0.0.1"):
         """
         Build the versions object based on the current version supplied
-        :param current_version: The current version to use as a base. Defaults to 0.0.1 if no tag has been supplied.
+        :param current_version: The current version to use as a base, either a semver string or semver.Version. Defaults to 0.0.1 if no tag has been supplied.
         :return: A dictionary object with the current, major, minor and patch versions
         """
+        import semver
+
+        if not isinstance(current_version, semver.Version):
+            current_version = semver.Version.parse(current_version)
         return {
-            "current": current_version,
-            "major": semver.bump_major(current_version),
-            "minor": semver.bump_minor(current_version),
-            "patch": semver.bump_patch(current_version)
+            "current": str(current_version),
+            "major": str(current_version.bump_major()),
+            "minor": str(current_version.bump_minor()),
+            "patch": str(current_version.bump_patch())
         }
 
     
-    def build_tests_matrix_config(self):
+    def build_tests_matrix_config(self, shards=None):
         """
         Uses the existing config to build a matrix strategy json object to run changed module tests
         By default pushes to GITHUB_OUTPUT > TESTS_MATRIX_OUTPUT as a variable to use
+        Module suites that already passed for the module's current fingerprint (see module_fingerprint.py) are left out.
+        Entries are ordered longest first using the recorded timings, so the slowest suites are picked up by a runner first.
+        In shard mode the module/test pairs are packed into a number of shards balanced by expected duration, each include holding a "jobs" list.
+        Shard mode is also used whenever there are more pairs than Github's 256 job matrix limit
+        :param shards: Optional number of shards. Defaults to MODULES_CONFIG_MATRIX_SHARDS, otherwise one job per module/test pair
+        """
+        modules_config = self.get_modules_config()
+        with self.metrics.span("fingerprints"):
+            fingerprints = self.get_fingerprints([module.module for module in modules_config if module.tests is not None])
+        with self.metrics.span("matrix_building"):
+            strategy_config = self.build_matrix_includes(modules_config, fingerprints, shards)
+        if strategy_config:
+            self.metrics.count("matrix_jobs", len(strategy_config))
+            wrapped_matrix_strategy = self.wrap_matrix_strategy_type("include", strategy_config)
+            # Push the output to the default GITHUB_OUTPUT variable.
+            with self.metrics.span("output"):
+                return self.output_json(wrapped_matrix_strategy, "TESTS_MATRIX_OUTPUT")
+            # The subsequent tests matrix job needs to detect if this variable has been set in GITHUB_OUTPUT.
+
+
+    def build_matrix_includes(self, modules_config, fingerprints, shards=None):
+        """
+        Build the list of matrix includes, see build_tests_matrix_config
+        :param modules_config: The ModulesConfigStore
+        :param fingerprints: A dictionary of module to fingerprint, used to leave out the suites that already passed
+        :param shards: Optional number of shards
+        :return: The list of includes (empty if there are no tests to run)
         """
         strategy_config = []
-        for module in self.modules_config:
+        for module in modules_config:
             # Check if the module has tests
-            if "tests" in module:
+            if module.tests is not None:
+                # Leave out suites that already passed for identical module content (e.g, after a revert or re-push)
+                tests = [test for test in module.tests if not self.result_cache.has_passed(fingerprints.get(module.module), module.module, test)]
+                if len(tests) < len(module.tests):
+                    logging.info("ModulesConfig - %s already passed %s for fingerprint %s", module.module, sorted(set(module.tests) - set(tests)), fingerprints[module.module])
                 # Generate the strategy_config for the tests
                 strategy_config.extend(
-                    self.generate_matrix_strategy_config(module["module"], module["tests"])
+                    self.generate_matrix_strategy_config(module.module, tests)
                 )
-        # Wrap the strategy_config in a dictionary
+        # Order the includes, or pack them into shards
         if strategy_config:
-            wrapped_matrix_strategy = self.wrap_matrix_strategy_type("include", strategy_config)
-            # Push the output to the default GITHUB_OUTPUT variable.
-            return self.output_json(wrapped_matrix_strategy, "TESTS_MATRIX_OUTPUT")
-            # The subsequent tests matrix job needs to detect if this variable has been set in GITHUB_OUTPUT.
+            if shards is None:
+                shards = int(os.environ.get(self.matrix_shards_env_var) or 0)
+            if shards or len(strategy_config) > self.matrix_scheduler.max_jobs:
+                strategy_config = self.matrix_scheduler.shard(strategy_config, shards or self.matrix_scheduler.max_jobs)
+                logging.debug(f"ModulesConfig - tests matrix packed into {len(strategy_config)} shard(s)")
+            else:
+                strategy_config = self.matrix_scheduler.order(strategy_config)
+            logging.info("ModulesConfig - estimated critical path of the tests matrix: %.0fs", self.estimate_critical_path(strategy_config))
+        return strategy_config
+
+
+    def get_fingerprints(self, modules):
+        """
+        Get the content fingerprint of each module, unless the result cache is disabled
+        :return: A dictionary of module to fingerprint
+        """
+        if not self.result_cache.path or not modules:
+            return {}
+        return self.fingerprinter.get_fingerprints(modules)
+
+
+    def estimate_critical_path(self, strategy_config):
+        """
+        Estimate how long the tests matrix will take before starting it: the expected duration of its longest job
+        :param strategy_config: The list of matrix includes
+        :return: The expected duration in seconds
+        """
+        return self.matrix_scheduler.critical_path(strategy_config)
 
 
     def generate_matrix_strategy_config(self, item, list, param1="module", param2="test"):
@@ -234,22 +637,94 @@ class ModulesConfig:
         }
     
 
-    def output_json(self, final_output, output_var="PYTHON_OUTPUT"):
+    def output_json(self, final_output, output_var="PYTHON_OUTPUT", budget=False):
         """
         Detects whether we are running in a Github Actions environment or not. If yes then it sets the relevant github variable. If not then it outputs the values - useful if calling this code as a python module.
         Note, setting GITHUB_OUTPUT will not reflect the value in the currently running step but will be available in all subsequent jobs/steps as required
+        In pipeline mode (see buffer_outputs) the output is held back and written together with the others by write_outputs
+        :param budget: True to keep a modules configuration within the output size budget, by compacting it or spilling it to a file (see config_payload.py)
         """
-        if "GITHUB_OUTPUT" in os.environ:
+        # Serialised once and reused for the output, the return value and the log
+        if budget:
+            final_output, serialised_output = self.payload.fit(final_output)
+        else:
+            serialised_output = json.dumps(final_output)
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            logging.debug(f"ModulesConfig - {output_var}: {json.dumps(final_output, indent=2)}")
+        if self.output_buffer is not None:
+            self.output_buffer.append((output_var, serialised_output))
+            if "GITHUB_OUTPUT" not in os.environ:
+                return serialised_output
+        elif "GITHUB_OUTPUT" in os.environ:
             # Write to GITHUB_OUTPUT as a variable named from the output_var variable value passed into this function
             with open(os.getenv("GITHUB_OUTPUT"), "a") as fh:
                 # example: matrix strategy config output: 'PYTHON_OUTPUT={"include":[{"module":"module1","test":"unit"},{"module":"module1","test":"bdd"},{"module":"module2","test":"unit"}]}'
                 # note, if output_var is not supplied then the the default GITHUB_OUTPUT variable will be named PYTHON_OUTPUT
                 #       if using multiple python scripts then this variable needs to change otherwise running this again will overwrite the GITHUB_OUTPUT variable!
-                print(f"{output_var}={str(json.dumps(final_output))}", file=fh)
+                print(f"{output_var}={serialised_output}", file=fh)
         else:
             # called by a python script/module so returning the dictionary object
-            logging.info(json.dumps(final_output, indent=2))
-            return json.dumps(final_output)
+            return serialised_output
+
+
+    def write_snapshot(self, path=None):
+        """
+        Write the configuration to an indexed snapshot file for the matrix jobs to read single modules from (see config_snapshot.py)
+        :param path: Optional snapshot file. Defaults to MODULES_CONFIG_SNAPSHOT, otherwise modules_config.snap
+        :return: The path written
+        """
+        snapshot = ConfigSnapshot(self.get_repo_file(path or os.environ.get(ConfigSnapshot.snapshot_env_var) or ConfigSnapshot.default_path))
+        with self.metrics.span("output"):
+            size = snapshot.write(self.get_modules_config().to_list())
+        logging.info("ModulesConfig - %d module(s) written to the snapshot %s (%d bytes)", len(self.modules_config), snapshot.path, size)
+        return snapshot.path
+
+
+    def write_metrics(self):
+        """
+        Write the timings and counters of the run to the metrics json file and the Github job summary (see instrumentation.py)
+        Includes the Github API requests made and the remaining rate limit if a tag backend was used
+        :return: The metrics dictionary
+        """
+        if self.tag_backend is not None:
+            for name, value in (self.tag_backend.get_cache_stats() or {}).items():
+                self.metrics.set_gauge(f"tag_cache_{name}", value)
+            for name, value in (self.tag_backend.get_api_stats() or {}).items():
+                if value is not None:
+                    self.metrics.set_gauge(f"api_{name}", value)
+        return self.metrics.write()
+
+
+    def buffer_outputs(self):
+        """
+        Start pipeline mode: outputs are collected rather than written one at a time, until write_outputs is called
+        """
+        self.output_buffer = []
+
+
+    def write_outputs(self):
+        """
+        Write every collected output to GITHUB_OUTPUT with a single write, so a step that dies part way through leaves no partial outputs
+        Each value uses the multiline (heredoc) format, name<<delimiter ... delimiter, with a random delimiter that can't appear in the value
+        :return: A dictionary of output_var to the json written
+        """
+        outputs = dict(self.output_buffer or [])
+        self.output_buffer = None
+        if outputs and "GITHUB_OUTPUT" in os.environ:
+            lines = []
+            for output_var, serialised_output in outputs.items():
+                delimiter = f"ghadelimiter_{uuid.uuid4()}"
+                lines.append(f"{output_var}<<{delimiter}\n{serialised_output}\n{delimiter}\n")
+            data = "".join(lines).encode("utf-8")
+            fd = os.open(os.environ["GITHUB_OUTPUT"], os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                written = 0
+                while written < len(data):
+                    written += os.write(fd, data[written:])
+            finally:
+                os.close(fd)
+            logging.debug(f"ModulesConfig - wrote {list(outputs)} ({len(data)} bytes) to GITHUB_OUTPUT")
+        return outputs
     
 
 if __name__ == "__main__":
@@ -1,6 +1,6 @@
 """
 Todo...
-    python3 .github/scripts/module_helper.py
+    python3 -m scripts.modules_helper
 """
 
 import argparse
@@ -8,6 +8,8 @@ import logging
 import os
 import sys
 import json
+from scripts.module_classifier import ModuleClassifier
+from scripts.config_store import ModulesConfigStore
 
 class PackageModule:
 
@@ -19,6 +21,7 @@ class PackageModule:
         # Sets up normal file logging (DEBUG) and add additional logging formatting
         logging.basicConfig(filename=self.logfile_name,level=logging.DEBUG, format='%(asctime)s %(name)s %(levelname)s: %(message)s')
         logging.info('PackageModule initialising...')
+        self.modules_config = ModulesConfigStore()    # module name -> module configuration record
 
     def output_logging(self):
         """
@@ -36,25 +39,18 @@ class PackageModule:
         logging.info('PackageModule running...')
         #print(os.getcwd())
         files_list = files_string.split()
-        # go through each filepath and get the module name
-        modules_list = []
-        modules_tojson = []
-        for file in files_list:
-            path_parts = file.split(os.path.sep)
-            if path_parts[0] == "modules" and path_parts[1] not in modules_list:
-                # add the module name to a dictionary object
-                module_info = {
-                    "module_name": path_parts[1],
-                }
-                # check for tests folders. If present add a 'tests' key to the dictionary with a list of tests to run
-                tests_path = os.path.join(path_parts[0], path_parts[1], "tests")
-                if os.path.isdir(tests_path):
-                    module_info['tests'] = self.get_tests_list(os.path.join(tests_path))
-
-                modules_tojson.append(module_info)
-
-        #print(json.dumps(modules_tojson, indent=2))
-        return self.output_json(self, modules_tojson, output_var)
+        # go through each filepath and get the (deduplicated) module name that owns it
+        classifier = ModuleClassifier()
+        modules_list = classifier.classify_many(files_list)
+        self.set_modules_list(modules_list)
+        for module_name in modules_list:
+            # check for tests folders. If present add a 'tests' key to the module with a list of tests to run
+            tests_path = os.path.join(classifier.get_module_path(module_name), "tests")
+            if os.path.isdir(tests_path):
+                self.set_module_tests_list(module_name, self.get_tests_list(os.path.join(tests_path)))
+
+        #print(json.dumps(self.get_config(), indent=2))
+        return self.output_json(self.get_config(), output_var)
 
     def get_tests_list(self, module_tests_path):
         """
@@ -70,91 +66,102 @@ class PackageModule:
                 detected_tests.append(test_name)
         return detected_tests
     
-def get_config(self):
-    """
-    Outputs the full modules configuration
-    Expected to be a json list of objects
-    TODO: Thinking it should be in the format:
-    [
-        {
-            "module": {
-                "name": "module1",
-                "version_next": "0.0.3"    # TODO: Consider passing in and bumping Major and Minor version from the PR commmit mesage
+    def get_config(self):
+        """
+        Outputs the full modules configuration
+        A json list of objects in the same format as the MODULES_CONFIG output of modules_config.py:
+        [
+            {
+                "module": "module1",
+                "versions": {
+                    "next": "0.0.3"    # TODO: Consider passing in and bumping Major and Minor version from the PR commmit mesage
+                },
                 "tests": [
                     "unit",
                     "compliance"
-                ] 
+                ]
             }
-        }
-    ]
-    """
-    pass
-
-def set_modules_list(self, modules_list=[]):
-    """
-    Adds/updates one or many module skeletons to the dictionary. Expected to be initially used when detecting which modules have code updates applied
-    For example ["module1","module2"]
-    Only adds skeleton dictionary item(s) in the format {"module": { "name": "modulename"}}
-    """
-    return
-
-def set_module_version_next(self, module, version_next):
-    """
-    Adds/updates the next calculated module version
-    This could be from the GitVersion check or from a PR message bumping to a new Major/Minor version
-    For example: "module1", "0.0.3" 
-    """
-    return
-
-def set_module_tests_list(self, module, tests_list=[]):
-    """
-    Adds/updates a list of tests based on checking the module codebase for tests within a tests folder
-    For example: ["unit, "compliance"]
-    """
-    return
-
-def set_module(self, module_config):
-    """
-    Adds/Updates the specified module configuration
-    For example: see the example structure of a module in the get_config() function
-    """
-    return
-
-def get_modules(self, output="json"):
-    """
-    Gets a list of module names in the specified format. Expected to be used for Github matrix jobs
-    For example: ["module1", "module2"]
-    """
-    return 
-
-def get_module(self, module):
-    """
-    Gets the configuration for the specified module (if it exists)
-    For example: see the example structure of a module in the get_config() function
-    """
-    return
-
-def get_module_property(self, module, property_name):
-    """
-    Gets the specified modules property
-    For example:
-        module1, version_next returns: "0.0.3"
-        module1, tests returns: ["unit", "compliance"]
-    """
-    return
-
-def output_json(self, modules_config, output_var="PYTHON_OUTPUT"):
-    if "GITHUB_OUTPUT" in os.environ:
-        # Write to GITHUB_OUTPUT as a variable named from the -o argument passed into this script
-        with open(os.environ["GITHUB_OUTPUT"], "a") as fh:
-            # example output: 'MY_VAR=[{module_name: module1, tests: [unit, bdd]},{module_name: module2}]'
-            # note, if -o or --output is not supplied to the script the the default GITHUB_OUTPUT variable will be named PYTHON_OUTPUT
-            #       if using multiple python scripts then this needs to change otherwise the next script will overwrite the output of the one before!
-            print(f"{output_var}={str(json.dumps(modules_config))}", file=fh)
-    else:
-        # called by a python script/module so returning the dictionary object
-        return modules_config
-    return
+        ]
+        """
+        return self.modules_config.to_list()
+
+    def set_modules_list(self, modules_list=[]):
+        """
+        Adds/updates one or many module skeletons to the dictionary. Expected to be initially used when detecting which modules have code updates applied
+        For example ["module1","module2"]
+        Only adds skeleton item(s) in the format {"module": "modulename"}. Modules already present are left as they are
+        """
+        for module in modules_list:
+            if module not in self.modules_config:
+                self.modules_config.set_module({"module": module})
+
+    def set_module_version_next(self, module, version_next):
+        """
+        Adds/updates the next calculated module version
+        This could be from the GitVersion check or from a PR message bumping to a new Major/Minor version
+        For example: "module1", "0.0.3" 
+        """
+        versions = dict(self.modules_config.get_module_property(module, "versions", {}))
+        versions["next"] = version_next
+        self.modules_config.set_module_property(module, "versions", versions)
+
+    def set_module_tests_list(self, module, tests_list=[]):
+        """
+        Adds/updates a list of tests based on checking the module codebase for tests within a tests folder
+        For example: ["unit, "compliance"]
+        """
+        self.modules_config.set_module_property(module, "tests", list(tests_list))
+
+    def set_module(self, module_config):
+        """
+        Adds/Updates the specified module configuration
+        For example: see the example structure of a module in the get_config() function
+        """
+        self.modules_config.set_module(module_config)
+
+    def get_modules(self, output="json"):
+        """
+        Gets a list of module names in the specified format. Expected to be used for Github matrix jobs
+        For example: ["module1", "module2"]
+        :param output: "json" for a json string, otherwise the python list
+        """
+        modules = self.modules_config.get_modules()
+        return json.dumps(modules) if output == "json" else modules
+
+    def get_module(self, module):
+        """
+        Gets the configuration for the specified module (if it exists)
+        For example: see the example structure of a module in the get_config() function
+        """
+        return self.modules_config.get_module(module)
+
+    def get_module_property(self, module, property_name):
+        """
+        Gets the specified modules property
+        For example:
+            module1, versions returns: {"next": "0.0.3"}
+            module1, tests returns: ["unit", "compliance"]
+        """
+        return self.modules_config.get_module_property(module, property_name)
+
+    def merge_modules_config(self, env_var="MODULES_CONFIG"):
+        """
+        Merges the (partial) modules configuration held in an environment variable, e.g, the output of an earlier job
+        """
+        return self.modules_config.merge_env(env_var)
+
+    def output_json(self, modules_config, output_var="PYTHON_OUTPUT"):
+        if "GITHUB_OUTPUT" in os.environ:
+            # Write to GITHUB_OUTPUT as a variable named from the -o argument passed into this script
+            with open(os.environ["GITHUB_OUTPUT"], "a") as fh:
+                # example output: 'MY_VAR=[{module: module1, tests: [unit, bdd]},{module: module2}]'
+                # note, if -o or --output is not supplied to the script the the default GITHUB_OUTPUT variable will be named PYTHON_OUTPUT
+                #       if using multiple python scripts then this needs to change otherwise the next script will overwrite the output of the one before!
+                print(f"{output_var}={str(json.dumps(modules_config))}", file=fh)
+        else:
+            # called by a python script/module so returning the dictionary object
+            return modules_config
+        return
 
 # def update_module_parameter(self, modules_config_json, module_name, module_param_name, module_param_value, output_var):
 #     """
@@ -0,0 +1,203 @@
+"""
+Declarative rules for what a changed path does to its module
+Rules are read from .modules_rules.json in the repository root (global, paths relative to the repository root) and from
+.module_rules.json in a module directory (paths relative to that module), e.g,
+    {
+        "rules": [
+            {"paths": ["*.md", ".terraform-docs.yml"], "action": "ignore"},
+            {"paths": ["docs/**"], "exclude": ["docs/examples/**"], "action": "bump_only"}
+        ]
+    }
+Actions:
+    trigger     the module is configured with its tests and a version bump (the default for a path no rule matches)
+    bump_only   the module gets a version bump but its tests aren't run ("skip_tests" is an alias)
+    ignore      the path doesn't count as a change to the module at all
+Globs follow gitignore style: * and ? don't cross a /, ** does, and a glob without a / matches at any depth.
+The first matching rule wins, module rules being checked before the global ones. Every rule is compiled into one
+combined regular expression, so a path is checked with a single match call rather than a Python loop over the rules.
+The regular expression engine still tries the alternatives one after another, so the cost of a match grows with the
+number of rules. The translated expression is cached on disk keyed by the path and git blob hash of each rule file, so a
+cache restored into a fresh checkout (e.g, in CI) still matches. Nothing is cached when there are no rule files.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+from scripts.module_classifier import ModuleClassifier
+from scripts.file_utils import write_json_atomic
+
+
+class PathRules:
+
+    default_rules_path = ".modules_rules.json"
+    rules_env_var = "MODULES_CONFIG_RULES"    # path of the global rules file
+    module_rules_file = ".module_rules.json"
+    default_cache_path = os.path.join(".modules_cache", "rules.json")
+    cache_format_version = 2
+    actions = ("trigger", "bump_only", "ignore")
+    action_aliases = {"skip_tests": "bump_only"}
+
+    def __init__(self, classifier=None, rules_path=None, cache_path=None, repo_path=None):
+        """
+        :param classifier: ModuleClassifier used to find the module directories holding module rules
+        :param rules_path: Optional global rules file. Defaults to MODULES_CONFIG_RULES, otherwise .modules_rules.json
+        :param cache_path: File to store the compiled rules in. Set to an empty string to disable the cache
+        :param repo_path: Path to the repository root. Defaults to the current directory
+        """
+        self.classifier = classifier or ModuleClassifier(repo_path=repo_path)
+        self.rules_path = rules_path or os.environ.get(self.rules_env_var) or self.default_rules_path
+        self.cache_path = self.default_cache_path if cache_path is None else cache_path
+        self.repo_path = repo_path
+        self.matcher = None
+        self.rule_actions = None    # action of each rule, in the order of the named groups of the matcher
+
+    def translate_glob(self, glob):
+        """
+        Translate a glob to a regular expression (without anchors)
+        """
+        # a glob with a / other than a trailing one (a leading / included) is anchored, otherwise it matches at any depth
+        pattern = "" if "/" in glob.rstrip("/") else "(?:.*/)?"
+        glob = glob.lstrip("/")
+        if glob.endswith("/"):
+            # a directory matches everything under it
+            glob = f"{glob}**"
+        position = 0
+        while position < len(glob):
+            character = glob[position]
+            if glob.startswith("**/", position):
+                pattern += "(?:.*/)?"
+                position += 3
+                continue
+            if glob.startswith("**", position):
+                pattern += ".*"
+                position += 2
+                continue
+            if character == "*":
+                pattern += "[^/]*"
+            elif character == "?":
+                pattern += "[^/]"
+            elif character == "[" and "]" in glob[position + 2:]:
+                end = glob.index("]", position + 2)
+                pattern += "[" + glob[position + 1:end].replace("!", "^", 1).replace("\\", "\\\\") + "]"
+                position = end
+            else:
+                pattern += re.escape(character)
+            position += 1
+        return pattern
+
+    def get_rule_files(self):
+        """
+        :return: A list of (rules file, path prefix) for the module rules (in module order) and then the global rules
+        """
+        repo_path = self.repo_path or os.getcwd()
+        self.classifier.compile()
+        rule_files = [
+            (os.path.join(repo_path, module_path, self.module_rules_file), f"{module_path}/")
+            for _module, module_path in sorted(self.classifier.modules.items())
+        ]
+        rule_files.append((os.path.join(repo_path, self.rules_path), ""))
+        return [(path, prefix) for path, prefix in rule_files if os.path.isfile(path)]
+
+    def get_blob_hash(self, path):
+        """
+        :return: The hash git gives the file's content as a blob, or None if it can't be read
+        """
+        try:
+            with open(path, "rb") as fh:
+                content = fh.read()
+        except OSError:
+            return None
+        return hashlib.sha1(b"blob %d\0" % len(content) + content).hexdigest()
+
+    def parse(self, rule_files):
+        """
+        Parse the rule files into one combined pattern
+        :return: A tuple of the pattern source and the list of rule actions
+        """
+        alternatives = []
+        actions = []
+        for path, prefix in rule_files:
+            try:
+                with open(path) as fh:
+                    rules = json.load(fh).get("rules", [])
+            except (OSError, ValueError) as e:
+                logging.warning(f"PathRules - ignoring {path} as it can't be read: {e}")
+                continue
+            for rule in rules:
+                action = self.action_aliases.get(rule.get("action", "trigger"), rule.get("action", "trigger"))
+                if action not in self.actions or not rule.get("paths"):
+                    logging.warning(f"PathRules - ignoring rule {rule} in {path}: needs paths and one of the actions {self.actions}")
+                    continue
+                prefix_pattern = re.escape(prefix)
+                includes = "|".join(prefix_pattern + self.translate_glob(glob) for glob in rule["paths"])
+                excludes = "|".join(prefix_pattern + self.translate_glob(glob) for glob in rule.get("exclude", []))
+                pattern = f"(?:{includes})" if not excludes else f"(?!(?:{excludes})$)(?:{includes})"
+                alternatives.append(f"(?P<r{len(actions)}>{pattern})")
+                actions.append(action)
+        return "|".join(alternatives), actions
+
+    def load(self):
+        """
+        Compile the rules (once), using the cached translation when no rule file changed
+        """
+        if self.matcher is not None:
+            return self.matcher
+        rule_files = self.get_rule_files()
+        repo_path = self.repo_path or os.getcwd()
+        key = [[os.path.relpath(path, repo_path).replace(os.path.sep, "/"), self.get_blob_hash(path)] for path, _prefix in rule_files]
+
+        cached = None
+        if rule_files and self.cache_path and os.path.isfile(self.cache_path):
+            try:
+                with open(self.cache_path) as fh:
+                    cached = json.load(fh)
+            except (OSError, ValueError) as e:
+                logging.debug(f"PathRules - unable to read {self.cache_path}: {e}")
+        if cached and cached.get("version") == self.cache_format_version and cached.get("key") == key:
+            pattern, self.rule_actions = cached["pattern"], cached["actions"]
+        else:
+            pattern, self.rule_actions = self.parse(rule_files)
+            if rule_files:
+                self.save(key, pattern)
+        self.matcher = re.compile(f"^(?:{pattern})$", re.DOTALL) if pattern else False
+        logging.debug(f"PathRules - {len(self.rule_actions)} rule(s) from {len(rule_files)} file(s)")
+        return self.matcher
+
+    def save(self, key, pattern):
+        if not self.cache_path:
+            return
+        write_json_atomic(self.cache_path, {"version": self.cache_format_version, "key": key, "pattern": pattern, "actions": self.rule_actions})
+
+    def has_rules(self):
+        return bool(self.load())
+
+    def match(self, path):
+        """
+        Get the action for a changed path
+        :param path: A file path relative to the repository root
+        :return: "trigger", "bump_only" or "ignore"
+        """
+        matcher = self.load()
+        if matcher:
+            match = matcher.match(path.replace(os.path.sep, "/"))
+            if match:
+                return self.rule_actions[int(match.lastgroup[1:])]
+        return "trigger"
+
+    def classify_many(self, paths):
+        """
+        Map many paths to their modules, applying the rules
+        :param paths: An iterable of file paths
+        :return: A tuple of the list of module names (in the order they were first triggered) and the set of those that are bump only
+        """
+        tests = {}    # module -> True if any path triggers its tests
+        for path in paths:
+            action = self.match(path)
+            if action == "ignore":
+                continue
+            module = self.classifier.classify(path)
+            if module is not None:
+                tests[module] = tests.get(module, False) or action == "trigger"
+        return list(tests), set(module for module, run_tests in tests.items() if not run_tests)
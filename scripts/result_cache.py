@@ -0,0 +1,102 @@
+"""
+Append-only record of the module test suites that passed for a module fingerprint (see module_fingerprint.py)
+    python3 -m scripts.result_cache record <module> <suite> [--status passed|failed] [--path PATH]
+
+Each pass is one tab separated line: fingerprint, module, suite and the unix time. Like the timings log, files written by
+separate matrix jobs can simply be concatenated. A module/suite whose fingerprint already passed doesn't need to run again.
+"""
+
+import argparse
+import logging
+import os
+import time
+from scripts.module_fingerprint import ModuleFingerprinter
+from scripts.dependency_graph import DependencyGraph
+from scripts.file_utils import open_atomic
+
+
+class ResultCache:
+
+    default_path = os.path.join(".modules_cache", "results.log")
+    max_entries = 5000     # most recent passes kept when the file is compacted
+    max_lines = 10000      # compact the file once it holds more lines than this
+
+    def __init__(self, path=None):
+        """
+        :param path: File holding the passes. Set to an empty string to keep them in memory only
+        """
+        self.path = self.default_path if path is None else path
+        self.passed = None    # (fingerprint, module, suite) -> unix time it last passed
+        self.lines = 0
+
+    def load(self):
+        """
+        Read the results file (once)
+        """
+        if self.passed is None:
+            self.passed = {}
+            if self.path and os.path.isfile(self.path):
+                with open(self.path, encoding="utf-8", errors="replace") as fh:
+                    for line in fh:
+                        self.lines += 1
+                        fields = line.rstrip("\n").split("\t")
+                        try:
+                            fingerprint, module, suite, timestamp = fields
+                            self.passed[(fingerprint, module, suite)] = max(int(timestamp), self.passed.get((fingerprint, module, suite), 0))
+                        except ValueError:
+                            logging.debug(f"ResultCache - skipping malformed line {self.lines} of {self.path}")
+        return self.passed
+
+    def has_passed(self, fingerprint, module, suite):
+        """
+        :return: True if the module's suite has passed for this fingerprint before
+        """
+        return fingerprint is not None and (fingerprint, module, suite) in self.load()
+
+    def record(self, fingerprint, module, suite, timestamp=None):
+        """
+        Record that a module's suite passed for a fingerprint
+        """
+        if fingerprint is None:
+            return
+        self.load()
+        timestamp = int(time.time()) if timestamp is None else timestamp
+        self.passed[(fingerprint, module, suite)] = timestamp
+        if not self.path:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as fh:
+            fh.write(f"{fingerprint}\t{module}\t{suite}\t{timestamp}\n")
+        self.lines += 1
+        if self.lines > self.max_lines:
+            self.compact()
+
+    def compact(self):
+        """
+        Rewrite the file with only the most recent max_entries passes
+        """
+        entries = sorted(self.passed.items(), key=lambda item: item[1])[-self.max_entries:]
+        self.passed = dict(entries)
+        with open_atomic(self.path, encoding="utf-8") as fh:
+            for (fingerprint, module, suite), timestamp in entries:
+                fh.write(f"{fingerprint}\t{module}\t{suite}\t{timestamp}\n")
+        self.lines = len(entries)
+        logging.debug(f"ResultCache - compacted {self.path} to {self.lines} line(s)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--path", default=None, help="results file, defaults to .modules_cache/results.log")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    record_parser = subparsers.add_parser("record", help="record a module suite result against the module's current fingerprint")
+    record_parser.add_argument("module")
+    record_parser.add_argument("suite")
+    record_parser.add_argument("--status", default="passed", help="passed, or anything else for a failure (e.g, the Github job.status). Failures aren't recorded")
+    args = parser.parse_args()
+
+    if args.status in ("passed", "success"):
+        dependency_graph = DependencyGraph(cache_path="")
+        fingerprinter = ModuleFingerprinter(dependency_graph.classifier, dependencies=dependency_graph.get_dependencies)
+        ResultCache(args.path).record(fingerprinter.get_fingerprints([args.module])[args.module], args.module, args.suite)
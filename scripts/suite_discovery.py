@@ -0,0 +1,176 @@
+"""
+Discovers the test suites of each module (the directories under <module>/tests, e.g, unit, bdd)
+Suite types are found dynamically rather than from a fixed list. Directories holding shared test code or data (fixtures,
+helpers, ...) and those starting with "_" or "." aren't suites.
+The module -> suites manifest is cached on disk. An entry is checked against the mtimes of the module and tests directories
+first, which costs two stats. Only when those changed (e.g, a cache restored into a fresh checkout in CI, where every mtime
+is new) is git asked for the tree hash of the tests directory, so a checkout of the same tests still matches. A tests
+directory with uncommitted changes has no tree hash and is scanned again, so suites added locally are found without
+committing them.
+"""
+
+import json
+import logging
+import os
+import subprocess
+from scripts.module_classifier import ModuleClassifier
+from scripts.change_detector import ChangeDetector
+from scripts.module_fingerprint import ModuleFingerprinter
+from scripts.file_utils import write_json_atomic
+
+
+class SuiteIndex:
+
+    default_cache_path = os.path.join(".modules_cache", "suites.json")
+    cache_format_version = 3
+    pathspec_limit = 32    # more modules than this are looked up from git through their roots rather than one pathspec each
+    preferred_order = ["unit", "bdd"]    # suites listed first (in this order) when present, any others follow alphabetically
+    tests_directory = "tests"
+    non_suite_directories = {"fixtures", "helpers", "data", "testdata", "utils", "common", "shared", "support", "lib"}    # shared test code or data, not suites
+
+    def __init__(self, classifier=None, cache_path=None, repo_path=None, preferred_order=None):
+        """
+        :param classifier: ModuleClassifier used to find the module directories
+        :param preferred_order: Optional list of suites to list first, overriding preferred_order
+        :param cache_path: File to store the manifest in. Set to an empty string to disable the cache
+        :param repo_path: Path to the repository root. Defaults to the current directory
+        """
+        self.classifier = classifier or ModuleClassifier(repo_path=repo_path)
+        self.cache_path = self.default_cache_path if cache_path is None else cache_path
+        self.repo_path = repo_path
+        if preferred_order is not None:
+            self.preferred_order = preferred_order
+        self.manifest = None    # module -> {"mtime": mtime key (see get_mtime_key), "tree": tests tree hash ("-" if none) or None, "suites": [...] or None}
+        self.mtime_keys = {}    # module -> mtime key, taken by prepare
+        self.tree_keys = {}     # module -> tests tree hash, looked up from git by prepare for the modules whose mtimes changed
+        self.changed = False
+
+    def get_module_directory(self, module):
+        return os.path.join(self.repo_path or os.getcwd(), self.classifier.get_module_path(module))
+
+    def get_tests_path(self, module):
+        return f"{self.classifier.get_module_path(module)}/{self.tests_directory}"
+
+    def prepare(self, modules):
+        """
+        Validate the cached suites of many modules at once. A module whose directory mtimes still match its cache entry needs
+        nothing more. The others (e.g, every module of a fresh checkout) are looked up from git with one git status and one git
+        ls-tree call: the committed tree hash of the tests directory, for those without uncommitted changes there
+        :param modules: A list of module names
+        """
+        # looked up again on every call, as a long running process (see watch_mode.py) sees commits and local changes come and go
+        manifest = self.load()
+        self.mtime_keys = dict((module, self.get_mtime_key(self.get_module_directory(module))) for module in modules)
+        self.tree_keys = {}
+        missed = [module for module, key in self.mtime_keys.items() if (manifest.get(module) or {}).get("mtime") != key]
+        if missed:
+            self.tree_keys = self.get_tree_keys(missed)
+
+    def get_tree_keys(self, modules):
+        """
+        :return: A dictionary of module to the committed tree hash of its tests directory, or "-" if it has none. Modules with
+            uncommitted changes there are left out, as are all of them if git isn't usable
+        """
+        paths = dict((module, self.get_tests_path(module)) for module in modules)
+        # git status and ls-tree match every file against every pathspec, so many modules are looked up through their roots
+        pathspecs = list(paths.values()) if len(paths) <= self.pathspec_limit else self.classifier.roots
+        try:
+            dirty_paths = ModuleFingerprinter(self.classifier, repo_path=self.repo_path).get_dirty_paths(list(paths.values()), pathspecs)
+            trees = ChangeDetector(self.classifier, self.repo_path).list_trees("HEAD", pathspecs)
+        except (OSError, subprocess.CalledProcessError) as e:
+            logging.debug(f"SuiteIndex - git unavailable, the manifest is only validated by mtimes: {e}")
+            return {}
+        return dict((module, trees.get(path, "-")) for module, path in paths.items() if path not in dirty_paths)
+
+    def get_mtime_key(self, module_directory):
+        """
+        The mtime of a module's directory (changes when tests/ is added or removed) and of its tests directory (changes when a
+        suite is added or removed)
+        """
+        mtimes = []
+        for directory in (module_directory, os.path.join(module_directory, self.tests_directory)):
+            try:
+                mtimes.append(str(os.stat(directory).st_mtime_ns))
+            except OSError:
+                mtimes.append("-")
+        return ":".join(mtimes)
+
+    def is_suite_directory(self, entry):
+        return entry.is_dir() and not entry.name.startswith((".", "_")) and entry.name not in self.non_suite_directories
+
+    def scan_module(self, module_directory):
+        """
+        List the suites of a module with a single os.scandir of its tests directory
+        :return: A list of suite names, or None if the module has no tests directory
+        """
+        try:
+            with os.scandir(os.path.join(module_directory, self.tests_directory)) as entries:
+                suites = [entry.name for entry in entries if self.is_suite_directory(entry)]
+        except OSError:
+            return None
+        return self.sort_suites(suites)
+
+    def sort_suites(self, suites):
+        preferred = [suite for suite in self.preferred_order if suite in suites]
+        return preferred + sorted(suite for suite in suites if suite not in self.preferred_order)
+
+    def load(self):
+        """
+        Read the cached manifest (once)
+        """
+        if self.manifest is None:
+            self.manifest = {}
+            if self.cache_path and os.path.isfile(self.cache_path):
+                try:
+                    with open(self.cache_path) as fh:
+                        data = json.load(fh)
+                    if data.get("version") == self.cache_format_version:
+                        self.manifest = data.get("modules", {})
+                except (OSError, ValueError) as e:
+                    logging.debug(f"SuiteIndex - unable to read {self.cache_path}, starting with an empty manifest: {e}")
+        return self.manifest
+
+    def get_suites(self, module):
+        """
+        Get the test suites of a module, using the cached manifest if its mtimes, or else its tests tree hash, still match
+        Call prepare first with every module that will be asked about, so the tree hashes are looked up from git in one go
+        :return: A list of suite names, or None if the module has no tests directory
+        """
+        manifest = self.load()
+        module_directory = self.get_module_directory(module)
+        mtime_key = self.mtime_keys.get(module) or self.get_mtime_key(module_directory)
+        tree_key = self.tree_keys.get(module)
+        entry = manifest.get(module)
+        if entry is not None and entry["mtime"] == mtime_key:
+            return entry["suites"]
+        if entry is not None and tree_key is not None and entry["tree"] == tree_key:
+            # e.g, a fresh checkout of the same tests, where every mtime is new. Its mtimes are kept so the next run needs no git
+            entry["mtime"] = mtime_key
+        else:
+            entry = {"mtime": mtime_key, "tree": tree_key, "suites": self.scan_module(module_directory)}
+            manifest[module] = entry
+        self.changed = True
+        return entry["suites"]
+
+    def build_manifest(self):
+        """
+        Walk every module once and build the full module -> suites manifest
+        :return: A dictionary of module name to a list of suites (only modules with a tests directory are included)
+        """
+        self.classifier.compile()
+        self.prepare(list(self.classifier.modules))
+        manifest = {}
+        for module in self.classifier.modules:
+            suites = self.get_suites(module)
+            if suites is not None:
+                manifest[module] = suites
+        return manifest
+
+    def save(self):
+        """
+        Write the manifest back to disk if anything changed
+        """
+        if not self.cache_path or not self.changed:
+            return
+        write_json_atomic(self.cache_path, {"version": self.cache_format_version, "modules": self.manifest}, separators=(",", ":"))
+        self.changed = False
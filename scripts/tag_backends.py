@@ -0,0 +1,468 @@
+"""
+Tag backends used by ModulesConfig to find the existing semver tags of each module
+    LocalGitTagBackend  - reads the tags straight from the local git refs store (.git/packed-refs and .git/refs/tags). No network or GH_TOKEN needed
+    GithubApiTagBackend - asks the Github API for the tags. Used as the fallback when there is no usable local clone (e.g, a shallow checkout)
+
+Each backend returns the same structure: a dictionary of module name -> list of semver strings (module prefix removed)
+select_tag_backend picks one of them for a repository (used by ModulesConfig and batch_mode.py)
+"""
+
+import logging
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from scripts.file_utils import get_repo_file
+from scripts.tag_cache import TagCache
+
+
+class TagBackend:
+    """
+    Shared behaviour for all tag backends
+    """
+
+    name = "base"
+    tag_pattern = re.compile(r"^(?P<module>.+?)-(?P<version>\d+\.\d+\.\d+.*)$")    # splits a tag name such as module1-0.0.2 into the module prefix and semver
+
+    def is_available(self):
+        """
+        Whether this backend can be used in the current environment
+        """
+        return True
+
+    def get_tags(self, references):
+        """
+        Get the semver tags for many modules at once
+        :param references: A list of module names to check for tags
+        :return: A dictionary of module name to a list of semver strings. Modules without tags have an empty list
+        """
+        raise NotImplementedError
+
+    def get_module_tags(self, reference):
+        """
+        Get the semver tags for a single module
+        :param reference: The module name to check for tags
+        :return: A list of semver strings
+        """
+        return self.get_tags([reference])[reference]
+
+    def get_tags_concurrently(self, references, max_workers=8):
+        """
+        Get the semver tags for many modules with one lookup per module, sent through a bounded thread pool
+        For when a single batched listing isn't possible. Wall clock time then depends on the slowest lookup rather than the sum of all of them
+        :param references: A list of module names to check for tags
+        :param max_workers: The maximum number of lookups in flight at once
+        :return: A dictionary of module name to a list of semver strings
+        """
+        if not references:
+            return {}
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return dict(zip(references, executor.map(self.get_module_tags, references)))
+
+    def get_cache_stats(self):
+        """
+        :return: A dictionary with the cache hit and miss counts, or None if this backend doesn't use a cache
+        """
+        return None
+
+    def get_api_stats(self):
+        """
+        :return: A dictionary with the API requests made and the remaining rate limit, or None if this backend doesn't use an API
+        """
+        return None
+
+    def save(self):
+        """
+        Persist any state (e.g, a cache) once the lookups are done
+        """
+        return
+
+    def group_tags(self, tag_names, references):
+        """
+        Group tag names by their module prefix, only keeping the modules asked for
+        :param tag_names: An iterable of tag names without the refs/tags/ prefix, e.g, module1-0.0.2
+        :param references: A list of module names to keep tags for
+        :return: A dictionary of module name to a list of semver strings
+        """
+        found_tags = {reference: [] for reference in references}
+        for tag_name in tag_names:
+            match = self.tag_pattern.match(tag_name)
+            if match and match.group("module") in found_tags:
+                found_tags[match.group("module")].append(match.group("version"))
+        return found_tags
+
+
+class LocalGitTagBackend(TagBackend):
+    """
+    Reads tags from the local git refs store in a single scan
+    The workflows check out with fetch-depth: 0 so every tag is already on disk
+    """
+
+    name = "local"
+
+    def __init__(self, repo_path=None):
+        """
+        :param repo_path: Path to the repository working tree. Defaults to the current directory at the time of the lookup
+        """
+        self.repo_path = repo_path
+        self.tags_map = None    # module prefix -> list of semver strings, built once on first use
+
+    def get_git_dir(self):
+        """
+        Find the .git directory for the repository. Handles worktrees/submodules where .git is a file pointing elsewhere
+        :return: The path to the git directory or None if this isn't a git checkout
+        """
+        git_dir = os.path.join(self.repo_path or os.getcwd(), ".git")
+        if os.path.isfile(git_dir):
+            with open(git_dir) as fh:
+                content = fh.read().strip()
+            if content.startswith("gitdir:"):
+                git_dir = os.path.normpath(os.path.join(os.path.dirname(git_dir), content.removeprefix("gitdir:").strip()))
+        if os.path.isdir(git_dir):
+            return git_dir
+        return None
+
+    def is_available(self):
+        """
+        Only usable in a full (non-shallow) clone, otherwise some tags may be missing locally
+        """
+        git_dir = self.get_git_dir()
+        return git_dir is not None and not os.path.exists(os.path.join(git_dir, "shallow"))
+
+    def read_tag_names(self):
+        """
+        Read every tag name from packed-refs and the loose refs/tags directory
+        Loose refs take precedence over packed ones, so a set is used to avoid duplicates
+        :return: A set of tag names without the refs/tags/ prefix
+        """
+        git_dir = self.get_git_dir()
+        tag_names = set()
+
+        packed_refs = os.path.join(git_dir, "packed-refs")
+        if os.path.isfile(packed_refs):
+            with open(packed_refs) as fh:
+                for line in fh:
+                    # Skip the header comment and peeled (^sha) lines of annotated tags
+                    if line.startswith(("#", "^")):
+                        continue
+                    parts = line.split(maxsplit=1)
+                    if len(parts) == 2 and parts[1].startswith("refs/tags/"):
+                        tag_names.add(parts[1].rstrip("\n").removeprefix("refs/tags/"))
+
+        tags_dir = os.path.join(git_dir, "refs", "tags")
+        for dirpath, _dirnames, filenames in os.walk(tags_dir):
+            for filename in filenames:
+                tag_path = os.path.join(dirpath, filename)
+                tag_names.add(os.path.relpath(tag_path, tags_dir).replace(os.path.sep, "/"))
+        return tag_names
+
+    def load(self):
+        """
+        Build the module prefix -> versions map from one scan of the refs store
+        """
+        if self.tags_map is None:
+            self.tags_map = {}
+            for tag_name in self.read_tag_names():
+                match = self.tag_pattern.match(tag_name)
+                if match:
+                    self.tags_map.setdefault(match.group("module"), []).append(match.group("version"))
+            logging.debug(f"LocalGitTagBackend - found tags for {len(self.tags_map)} module prefix(es)")
+        return self.tags_map
+
+    def get_tags(self, references):
+        tags_map = self.load()
+        return {reference: list(tags_map.get(reference, [])) for reference in references}
+
+
+class GithubApiTagBackend(TagBackend):
+    """
+    Gets tags using the Github API (PyGitHub). Needs GH_TOKEN set in the environment
+    """
+
+    name = "api"
+    default_repository = "T1ckL35/DetectChanges"
+    max_retries = 5         # number of times a rate limited request is retried
+    max_backoff = 300       # upper limit in seconds for a single backoff wait
+    per_page = 100          # the API maximum, so listing all tags takes as few paginated calls as possible
+    seconds_between_requests = 0.0    # PyGitHub waits 0.25s between requests by default, which would make concurrent lookups run one after another
+    throttle_env_var = "MODULES_CONFIG_API_THROTTLE"    # seconds to wait between requests instead, e.g, to go easy on a small Github Enterprise server
+
+    def __init__(self, repository=None, base_url=None, cache=None, pool_size=None, github_client=None):
+        """
+        :param repository: owner/name of the repository. Defaults to GITHUB_REPOSITORY (set by Github Actions) or this repository
+        :param base_url: Optional API url for Github Enterprise, e.g, https://{hostname}/api/v3
+        :param cache: Optional TagCache. If supplied, lookups are sent as conditional requests and the results stored in the cache
+        :param pool_size: Optional size of the HTTP connection pool. Should match the number of concurrent lookups
+        :param github_client: Optional Github client to use rather than building one, e.g, one shared by every repository on the same host (see batch_mode.py)
+        """
+        self.repository = repository or os.environ.get("GITHUB_REPOSITORY") or self.default_repository
+        self.base_url = base_url
+        self.cache = cache
+        self.pool_size = pool_size
+        self.github_client = github_client    # Github client and repository handle, created once on first use and shared by all tag lookups
+        self.github_repo = None
+        self.api_calls = 0           # requests made, including the 304s which don't count against the rate limit
+        self.api_not_modified = 0
+        self.api_rate_limited = 0    # requests refused by a rate limit and retried after a backoff
+        self.api_lock = threading.Lock()    # lookups may be made from several threads at once
+        self.repo_lock = threading.Lock()   # so the client and repository handle are only set up once when the first lookups run concurrently
+
+    def is_available(self):
+        return "GH_TOKEN" in os.environ
+
+    def get_github_repo(self):
+        """
+        Get the Github repository handle, building the authenticated client on first use
+        The client and repository handle are kept on the instance so every tag lookup shares the same connection
+        :return: The PyGitHub Repository object
+        """
+        if self.github_repo is None:
+            with self.repo_lock:
+                # checked again, another thread may have set it up while this one waited
+                if self.github_repo is None:
+                    if self.github_client is None:
+                        self.github_client = self.build_github_client(self.base_url, self.pool_size)
+                    self.github_repo = self.call_with_backoff(self.github_client.get_repo, self.repository)
+                    self.count_api_calls(1)
+        return self.github_repo
+
+    @classmethod
+    def build_github_client(cls, base_url=None, pool_size=None):
+        """
+        Build an authenticated Github client. Its HTTP connections are kept alive and reused by every request made through it
+        :param base_url: Optional API url for Github Enterprise
+        :param pool_size: Optional size of the HTTP connection pool
+        :return: The PyGitHub Github object
+        """
+        # Make sure requirements.txt has an entry for the PyGitHub module
+        from github import Github, Auth
+
+        # Set in the GHA Workflow
+        auth = Auth.Token(os.environ['GH_TOKEN'])
+        throttle = os.environ.get(cls.throttle_env_var)
+        options = {
+            "auth": auth,
+            "per_page": cls.per_page,
+            "seconds_between_requests": float(throttle) if throttle else cls.seconds_between_requests,
+        }
+        if pool_size:
+            options["pool_size"] = pool_size
+        if base_url:
+            # Github Enterprise with custom hostname
+            options["base_url"] = base_url
+        # Public Web Github unless a base_url is set
+        return Github(**options)
+
+    def count_api_calls(self, calls, not_modified=0, rate_limited=0):
+        with self.api_lock:
+            self.api_calls += calls
+            self.api_not_modified += not_modified
+            self.api_rate_limited += rate_limited
+
+    def count_listing_calls(self, tag_names):
+        """
+        Count the requests taken by a paginated listing, one per page of per_page tags
+        """
+        self.count_api_calls(max(1, -(-len(tag_names) // self.per_page)))
+        return tag_names
+
+    def get_api_stats(self):
+        """
+        The remaining rate limit is read from the headers of the last response, so it doesn't cost a request
+        """
+        remaining, limit = self.github_repo._requester.rate_limiting if self.github_repo is not None else (-1, -1)
+        return {
+            "calls": self.api_calls,
+            "not_modified": self.api_not_modified,
+            "rate_limited": self.api_rate_limited,
+            "rate_limit_remaining": remaining if remaining >= 0 else None,
+            "rate_limit": limit if limit >= 0 else None,
+        }
+
+    def get_backoff_delay(self, exception, attempt):
+        """
+        Work out how long to wait before retrying a rate limited request
+        Uses the retry-after header if present, then the x-ratelimit-reset time once the primary limit is used up, otherwise an exponential backoff
+        :param exception: The GithubException raised for the request
+        :param attempt: The number of retries already made
+        :return: Seconds to wait, or None if the error isn't a rate limit (e.g, a 403 for missing permissions)
+        """
+        headers = {key.lower(): value for key, value in (exception.headers or {}).items()}
+        if "retry-after" in headers:
+            delay = int(headers["retry-after"])
+        elif headers.get("x-ratelimit-remaining") == "0" and "x-ratelimit-reset" in headers:
+            delay = int(headers["x-ratelimit-reset"]) - time.time() + 1
+        elif exception.status == 429 or "rate limit" in str(exception.data).lower():
+            # Secondary rate limits don't always say when to come back
+            delay = 2 ** attempt
+        else:
+            return None
+        return min(max(delay, 1), self.max_backoff)
+
+    def call_with_backoff(self, func, *args, **kwargs):
+        """
+        Call a PyGitHub function, waiting and retrying when Github responds with a 403/429 rate limit error
+        """
+        from github import GithubException
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                return func(*args, **kwargs)
+            except GithubException as e:
+                if e.status not in (403, 429) or attempt == self.max_retries:
+                    raise
+                delay = self.get_backoff_delay(e, attempt)
+                if delay is None:
+                    raise
+                self.count_api_calls(1, rate_limited=1)
+                logging.warning(f"GithubApiTagBackend - rate limited ({e.status}), retrying in {delay:.0f}s (attempt {attempt + 1} of {self.max_retries})")
+                time.sleep(delay)
+
+    def get_cache_stats(self):
+        return self.cache.get_stats() if self.cache is not None else None
+
+    def save(self):
+        if self.cache is not None:
+            self.cache.save()
+
+    def get_cached_tag_names(self, scope):
+        """
+        List the tag names matching a ref prefix using conditional requests against the cached ETags
+        Each page of the matching-refs listing is requested with If-None-Match. A 304 reuses the cached page and doesn't count against the rate limit
+        :param scope: The matching-refs prefix, e.g, tags/ for every tag or tags/module1- for a single module
+        :return: A list of tag names without the refs/tags/ prefix
+        """
+        from github import GithubException
+
+        repo = self.get_github_repo()
+        url = f"{repo.url}/git/matching-refs/{scope}"
+        entry = self.cache.get(scope)
+        cached_pages = entry["pages"] if entry else []
+
+        pages = []
+        not_modified = True
+        page_number = 1
+        while True:
+            cached_page = cached_pages[page_number - 1] if page_number <= len(cached_pages) else None
+            headers = {"If-None-Match": cached_page["etag"]} if cached_page and cached_page.get("etag") else {}
+            try:
+                response_headers, data = self.call_with_backoff(
+                    repo._requester.requestJsonAndCheck, "GET", url, parameters={"per_page": self.per_page, "page": page_number}, headers=headers
+                )
+                self.count_api_calls(1, int(data is None))
+            except GithubException as e:
+                self.count_api_calls(1)
+                if e.status == 404:
+                    logging.debug("Unable to find any GitHub Tags matching %s - 404 error", scope)
+                    data, response_headers = [], {}
+                else:
+                    logging.debug(f"Retrieving GitHub Tags has failed with the following status code: {e.status}")
+                    raise Exception(
+                        f"Retrieving GitHub Tags has failed with the following status code: {e.status}"
+                    )
+            if data is None and cached_page:
+                # 304 Not Modified - the cached page is still current
+                page = dict(cached_page)
+            else:
+                not_modified = False
+                page = {
+                    "etag": response_headers.get("etag"),
+                    "tags": [object["ref"].removeprefix("refs/tags/") for object in data or []],
+                    "has_next": 'rel="next"' in response_headers.get("link", ""),
+                }
+            pages.append(page)
+            if not page["has_next"]:
+                break
+            page_number += 1
+
+        self.cache.put(scope, pages, not_modified)
+        logging.debug("GithubApiTagBackend - %s %s", scope, "not modified (cache hit)" if not_modified else "fetched (cache miss)")
+        return [tag_name for page in pages for tag_name in page["tags"]]
+
+    def get_module_tags(self, reference):
+        """
+        Get the semver tags for a single module using a prefix ref lookup
+        """
+        from github import GithubException
+
+        if self.cache is not None:
+            return self.group_tags(self.get_cached_tag_names(f"tags/{reference}-"), [reference])[reference]
+
+        repo = self.get_github_repo()
+        try:
+            logging.debug("Checking GitHub Tags with reference tags/%s-*...", reference)
+            # matching-refs lists every ref starting with the prefix (an empty list if there are none)
+            tag_names = self.count_listing_calls(self.call_with_backoff(
+                lambda: [tag.ref.removeprefix("refs/tags/") for tag in repo.get_git_matching_refs(f"tags/{reference}-")]
+            ))
+            return self.group_tags(tag_names, [reference])[reference]
+        except GithubException as e:
+            self.count_api_calls(1)
+            if e.status == 404:
+                logging.debug("Unable to find GitHub Tag with reference tags/%s-* - 404 error", reference)
+            else:
+                logging.debug(f"Retrieving GitHub Tag has failed with the following status code: {e.status}")
+                raise Exception(
+                    f"Retrieving GitHub Tag has failed with the following status code: {e.status}"
+                )
+        return []
+
+    def get_tags(self, references):
+        """
+        Rather than one lookup per module, every tag ref in the repository is listed once (paginated) and grouped by module prefix
+        """
+        from github import GithubException
+
+        if not references:
+            return {}
+        if self.cache is not None:
+            return self.group_tags(self.get_cached_tag_names("tags/"), references)
+
+        repo = self.get_github_repo()
+        try:
+            logging.debug(f"Listing all GitHub Tags to resolve {len(references)} module(s)...")
+            tag_names = self.count_listing_calls(self.call_with_backoff(
+                lambda: [tag.ref.removeprefix("refs/tags/") for tag in repo.get_git_matching_refs("tags/")]
+            ))
+            return self.group_tags(tag_names, references)
+        except GithubException as e:
+            self.count_api_calls(1)
+            if e.status == 404:
+                # No tags at all in the repository
+                logging.debug("Unable to find any GitHub Tags - 404 error")
+            else:
+                logging.debug(f"Retrieving GitHub Tags has failed with the following status code: {e.status}")
+                raise Exception(
+                    f"Retrieving GitHub Tags has failed with the following status code: {e.status}"
+                )
+        return {reference: [] for reference in references}
+
+
+backend_env_var = "MODULES_CONFIG_TAG_BACKEND"    # "local", "api" or "auto" (default). Auto reads the local git refs and falls back to the Github API
+cache_env_var = "MODULES_CONFIG_TAG_CACHE"        # path of the on-disk cache of Github API tag lookups. Set to an empty string to disable the cache
+
+
+def select_tag_backend(repo_path=None, mode=None, repository=None, base_url=None, pool_size=None):
+    """
+    Pick the tag backend of a repository
+    By default the local git refs store is used (no network or GH_TOKEN needed) with the Github API as the fallback
+    API lookups are cached on disk (restored between runs with actions/cache) and revalidated with conditional requests
+    :param repo_path: Optional root of the repository. Defaults to the current directory
+    :param mode: "local", "api" or "auto". Defaults to MODULES_CONFIG_TAG_BACKEND, otherwise "auto"
+    :param repository: Optional owner/name of the repository for API lookups (see GithubApiTagBackend)
+    :param base_url: Optional API url for Github Enterprise
+    :param pool_size: Optional size of the HTTP connection pool of API lookups
+    :return: A LocalGitTagBackend or GithubApiTagBackend object
+    """
+    mode = mode or os.environ.get(backend_env_var) or "auto"
+    local_backend = LocalGitTagBackend(repo_path=repo_path)
+    if mode == "api" or (mode == "auto" and not local_backend.is_available()):
+        cache_path = get_repo_file(repo_path, os.environ.get(cache_env_var, TagCache.default_path))
+        return GithubApiTagBackend(
+            repository=repository,
+            base_url=base_url,
+            cache=TagCache(cache_path) if cache_path else None,
+            pool_size=pool_size,
+        )
+    return local_backend
@@ -0,0 +1,114 @@
+"""
+Persistent on-disk cache of tag lookups made against the Github API
+Stores the tag names and ETag of every page of each lookup so the next run can send conditional (If-None-Match) requests.
+A 304 Not Modified response doesn't count against the API rate limit and the cached tags are reused.
+The file is intended to be restored/saved between workflow runs with actions/cache.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from scripts.file_utils import write_json_atomic
+
+
+class TagCache:
+
+    default_path = os.path.join(".tag_cache", "tags.json")
+    cache_format_version = 1
+
+    def __init__(self, path=None, ttl=7 * 24 * 60 * 60, max_entries=500):
+        """
+        :param path: File to store the cache in. Defaults to .tag_cache/tags.json in the current directory
+        :param ttl: Seconds an entry is kept after it was last fetched before it is evicted
+        :param max_entries: Maximum number of entries to keep. The least recently used are evicted first
+        """
+        self.path = path or self.default_path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = None    # scope -> {"pages": [{"etag", "tags", "has_next"}], "fetched": timestamp, "used": timestamp}
+        self.hits = 0          # lookups answered with 304 Not Modified for every page
+        self.misses = 0        # lookups that needed at least one full response
+        self.changed = False
+        self.lock = threading.Lock()    # lookups may be made from several threads at once
+
+    def load(self):
+        """
+        Read the cache file (once), dropping any expired entries
+        """
+        with self.lock:
+            if self.entries is None:
+                self.entries = {}
+                if os.path.isfile(self.path):
+                    try:
+                        with open(self.path) as fh:
+                            data = json.load(fh)
+                        if data.get("version") == self.cache_format_version:
+                            self.entries = data.get("entries", {})
+                    except (OSError, ValueError) as e:
+                        logging.debug(f"TagCache - unable to read {self.path}, starting with an empty cache: {e}")
+                self.evict()
+        return self.entries
+
+    def evict(self, now=None):
+        """
+        Evict entries older than the TTL and then the least recently used entries over the size limit
+        """
+        now = now or time.time()
+        expired = [scope for scope, entry in self.entries.items() if now - entry.get("fetched", 0) > self.ttl]
+        for scope in expired:
+            del self.entries[scope]
+        over_limit = []
+        if len(self.entries) > self.max_entries:
+            by_last_used = sorted(self.entries, key=lambda scope: self.entries[scope].get("used", 0))
+            over_limit = by_last_used[:len(self.entries) - self.max_entries]
+            for scope in over_limit:
+                del self.entries[scope]
+        if expired or over_limit:
+            logging.debug(f"TagCache - evicted {len(expired)} expired and {len(over_limit)} least recently used entries")
+            self.changed = True
+
+    def get(self, scope):
+        """
+        :param scope: The lookup the entry is for, e.g, tags/module1-
+        :return: The cached entry or None
+        """
+        entry = self.load().get(scope)
+        if entry is not None:
+            entry["used"] = time.time()
+            self.changed = True
+        return entry
+
+    def put(self, scope, pages, not_modified):
+        """
+        Store the pages of a lookup and record whether it was a hit (every page not modified) or a miss
+        :param scope: The lookup the entry is for
+        :param pages: A list of {"etag", "tags", "has_next"} dictionaries
+        :param not_modified: True if every page came back as 304 Not Modified
+        """
+        now = time.time()
+        entries = self.load()
+        with self.lock:
+            entries[scope] = {"pages": pages, "fetched": now, "used": now}
+            self.changed = True
+            if not_modified:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def get_stats(self):
+        """
+        :return: A dictionary with the hit and miss counts of this run
+        """
+        return {"hits": self.hits, "misses": self.misses}
+
+    def save(self):
+        """
+        Write the cache back to disk if anything changed. Written to a temporary file first so a failed run never leaves a corrupt cache
+        """
+        if not self.changed or self.entries is None:
+            return
+        self.evict()
+        write_json_atomic(self.path, {"version": self.cache_format_version, "entries": self.entries}, separators=(",", ":"))
+        self.changed = False
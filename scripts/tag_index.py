@@ -0,0 +1,104 @@
+"""
+Semver ordered index of module tags
+Each tag is parsed once into a semver.Version and kept in sorted order per module prefix so that
+"latest", "latest stable" and "latest below X" queries don't need to re-sort the tag lists
+semver is only imported once tags are actually parsed, so importing this module stays cheap for the matrix only path
+"""
+
+import bisect
+import logging
+
+
+class TagIndex:
+
+    def __init__(self):
+        self.versions = {}           # module prefix -> sorted list of every semver.Version
+        self.stable_versions = {}    # module prefix -> sorted list of semver.Version without a prerelease part
+
+    @classmethod
+    def from_tags(cls, found_tags):
+        """
+        Build an index from the output of a tag backend
+        :param found_tags: A dictionary of module name to a list of semver strings
+        :return: A TagIndex object
+        """
+        index = cls()
+        for module, tags in found_tags.items():
+            index.add_module(module, tags)
+        return index
+
+    def add_module(self, module, tags):
+        """
+        Parse and store all the tags for a module. Sorted once rather than on every query
+        Tags that are not valid semver are skipped
+        :param module: The module prefix
+        :param tags: A list of semver strings
+        """
+        # Make sure requirements.txt has an entry for the semver module
+        import semver
+
+        versions = []
+        for tag in tags:
+            try:
+                versions.append(semver.Version.parse(tag))
+            except ValueError:
+                logging.debug("TagIndex - skipping tag %s-%s as it is not a valid semver", module, tag)
+        versions.sort()
+        self.versions[module] = versions
+        self.stable_versions[module] = [version for version in versions if not version.prerelease]
+
+    def add(self, module, tag):
+        """
+        Add a single tag to the index, keeping the order
+        :param module: The module prefix
+        :param tag: A semver string or semver.Version
+        """
+        import semver
+
+        version = tag if isinstance(tag, semver.Version) else semver.Version.parse(tag)
+        bisect.insort(self.versions.setdefault(module, []), version)
+        if not version.prerelease:
+            bisect.insort(self.stable_versions.setdefault(module, []), version)
+
+    def get_versions(self, module, stable=False):
+        """
+        :return: The sorted list of versions for a module (empty if none)
+        """
+        return (self.stable_versions if stable else self.versions).get(module, [])
+
+    def latest(self, module):
+        """
+        :return: The highest version of a module (prereleases included) or None
+        """
+        versions = self.get_versions(module)
+        return versions[-1] if versions else None
+
+    def latest_stable(self, module):
+        """
+        :return: The highest version of a module without a prerelease part or None
+        """
+        versions = self.get_versions(module, stable=True)
+        return versions[-1] if versions else None
+
+    def latest_below(self, module, upper, stable=False):
+        """
+        Find the highest version strictly lower than the supplied version
+        :param module: The module prefix
+        :param upper: A semver string or semver.Version to search below
+        :param stable: Only consider versions without a prerelease part
+        :return: A semver.Version or None
+        """
+        import semver
+
+        upper = upper if isinstance(upper, semver.Version) else semver.Version.parse(upper)
+        versions = self.get_versions(module, stable)
+        position = bisect.bisect_left(versions, upper)
+        return versions[position - 1] if position else None
+
+    def current(self, module):
+        """
+        The version to treat as the module's current release
+        The latest stable version is preferred, falling back to the latest prerelease if that is all there is
+        :return: A semver.Version or None if the module has no tags
+        """
+        return self.latest_stable(module) or self.latest(module)
@@ -1,6 +1,7 @@
 """
 Todo...
-    python3 .github/scripts/test.py -f "modules/module1/main.tf modules/module2/main.tf"
+    python3 -m scripts.test -f "modules/module1/main.tf modules/module2/main.tf"
+    git diff --name-only -z HEAD^1 HEAD | python3 -m scripts.test --files-from - -z
 """
 
 import argparse
@@ -8,6 +9,8 @@ import logging
 import os
 import sys
 import json
+from scripts.module_classifier import ModuleClassifier
+from scripts import changed_files
 
 class PackageModule:
 
@@ -28,6 +31,8 @@ class PackageModule:
         parser = argparse.ArgumentParser()
         # required = parser.add_argument_group('required arguments')
         parser.add_argument("-f", "--files", help="string of space separated file paths that have been updated.")
+        parser.add_argument("--files-from", help="read the updated file paths from a file, or from stdin if '-'. One path per line unless -z is used.")
+        parser.add_argument("-z", "--null", action="store_true", help="the paths read with --files-from are NUL separated, e.g, the output of git diff --name-only -z")
         # optional to control the output type
         parser.add_argument("-o", "--output", nargs='?', default="PYTHON_OUTPUT", help="output type. If used then pushes the output from this script into the environment variable GITHUB_OUTPUT. Intended to be used in a Github Actions workflow.")
         self.args = parser.parse_args()
@@ -49,25 +54,25 @@ class PackageModule:
         logging.info('PackageModule running...')
         #print(os.getcwd())
         self.configure()
-        files_string = self.args.files
-        files_list = files_string.split()
-        # go through each filepath and get the module name
-        modules_list = []
+        if self.args.files_from:
+            # streamed so memory use stays flat however many files have changed
+            files_list = changed_files.iter_source(self.args.files_from, self.args.null)
+        else:
+            files_list = changed_files.iter_files_string(self.args.files or "")
+        # go through each filepath and get the (deduplicated) module name that owns it
+        classifier = ModuleClassifier()
         modules_tojson = []
-        for file in files_list:
-            path_parts = file.split(os.path.sep)
-            if path_parts[0] == "modules":
-                if path_parts[1] not in modules_list:
-                    # add the module name to a dictionary object
-                    module_info = {
-                        "module_name": path_parts[1],
-                    }
-                    # check for tests folders. If present add a 'tests' key to the dictionary with a list of tests to run
-                    tests_path = os.path.join(path_parts[0], path_parts[1], "tests")
-                    if os.path.isdir(tests_path):
-                        module_info['tests'] = self.get_tests_list(os.path.join(tests_path))
-
-                    modules_tojson.append(module_info)
+        for module_name in classifier.classify_many(files_list):
+            # add the module name to a dictionary object
+            module_info = {
+                "module_name": module_name,
+            }
+            # check for tests folders. If present add a 'tests' key to the dictionary with a list of tests to run
+            tests_path = os.path.join(classifier.get_module_path(module_name), "tests")
+            if os.path.isdir(tests_path):
+                module_info['tests'] = self.get_tests_list(os.path.join(tests_path))
+
+            modules_tojson.append(module_info)
 
         #print(json.dumps(modules_tojson, indent=2))
 
@@ -0,0 +1,144 @@
+"""
+Append-only store of module test suite timings
+    python3 -m scripts.timing_store record <module> <suite> <seconds> [--status passed|failed] [--path PATH]
+    python3 -m scripts.timing_store stats [--path PATH]
+
+Each result is one tab separated line: module, suite, duration in milliseconds, P (passed) or F (failed) and the unix time.
+Appending never rewrites earlier results, so log files from several jobs can simply be concatenated, and the file is
+compacted to the most recent results of each module/suite once it grows past max_lines.
+"""
+
+import argparse
+import json
+import logging
+import os
+import time
+from collections import deque
+from scripts.file_utils import open_atomic
+
+
+class TimingStore:
+
+    default_path = os.path.join(".modules_cache", "timings.log")
+    window = 20            # number of most recent results per module/suite the statistics are taken over
+    max_lines = 10000      # compact the file once it holds more lines than this
+
+    def __init__(self, path=None, window=None):
+        """
+        :param path: File holding the timings. Set to an empty string to keep them in memory only
+        :param window: Optional number of recent results per module/suite to keep statistics over
+        """
+        self.path = self.default_path if path is None else path
+        if window is not None:
+            self.window = window
+        self.results = None    # (module, suite) -> deque of (duration seconds, passed, timestamp)
+        self.lines = 0
+
+    def load(self):
+        """
+        Read the timings file (once)
+        """
+        if self.results is None:
+            self.results = {}
+            if self.path and os.path.isfile(self.path):
+                with open(self.path, encoding="utf-8", errors="replace") as fh:
+                    for line in fh:
+                        self.lines += 1
+                        fields = line.rstrip("\n").split("\t")
+                        try:
+                            module, suite, duration_ms, status, timestamp = fields
+                            self.add(module, suite, int(duration_ms) / 1000, status == "P", int(timestamp))
+                        except ValueError:
+                            # A partly written line from a job that was cancelled mid write
+                            logging.debug(f"TimingStore - skipping malformed line {self.lines} of {self.path}")
+        return self.results
+
+    def add(self, module, suite, duration, passed, timestamp):
+        key = (module, suite)
+        if key not in self.results:
+            self.results[key] = deque(maxlen=self.window)
+        self.results[key].append((duration, passed, timestamp))
+
+    def format_line(self, module, suite, duration, passed, timestamp):
+        return f"{module}\t{suite}\t{round(duration * 1000)}\t{'P' if passed else 'F'}\t{timestamp}\n"
+
+    def record(self, module, suite, duration, passed=True, timestamp=None):
+        """
+        Append the result of a test suite run
+        :param duration: Run time in seconds
+        :param passed: True if the suite passed
+        """
+        self.load()
+        timestamp = int(time.time()) if timestamp is None else timestamp
+        self.add(module, suite, duration, passed, timestamp)
+        if not self.path:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as fh:
+            fh.write(self.format_line(module, suite, duration, passed, timestamp))
+        self.lines += 1
+        if self.lines > self.max_lines:
+            self.compact()
+
+    def compact(self):
+        """
+        Rewrite the file with only the results the statistics are taken over
+        """
+        with open_atomic(self.path, encoding="utf-8") as fh:
+            for (module, suite), results in self.results.items():
+                for duration, passed, timestamp in results:
+                    fh.write(self.format_line(module, suite, duration, passed, timestamp))
+        self.lines = sum(len(results) for results in self.results.values())
+        logging.debug(f"TimingStore - compacted {self.path} to {self.lines} line(s)")
+
+    def percentile(self, sorted_values, percent):
+        """
+        Nearest rank percentile of an already sorted list
+        """
+        rank = max(1, -(-len(sorted_values) * percent // 100))
+        return sorted_values[int(rank) - 1]
+
+    def get_stats(self, module, suite):
+        """
+        :return: A dictionary of the rolling statistics of a module's suite, or None if it has never been recorded
+        """
+        results = self.load().get((module, suite))
+        if not results:
+            return None
+        durations = sorted(duration for duration, _passed, _timestamp in results)
+        passes = sum(1 for _duration, passed, _timestamp in results if passed)
+        return {
+            "runs": len(results),
+            "median": self.percentile(durations, 50),
+            "p90": self.percentile(durations, 90),
+            "pass_rate": passes / len(results),
+            "last_passed": results[-1][1],
+        }
+
+    def estimate(self, module, suite):
+        """
+        :return: The expected duration in seconds of a module's suite (the rolling median), or None if it has never been recorded
+        """
+        stats = self.get_stats(module, suite)
+        return stats["median"] if stats else None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--path", default=None, help="timings file, defaults to .modules_cache/timings.log")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    record_parser = subparsers.add_parser("record", help="append the result of a test suite run")
+    record_parser.add_argument("module")
+    record_parser.add_argument("suite")
+    record_parser.add_argument("duration", type=float, help="run time in seconds")
+    record_parser.add_argument("--status", default="passed", help="passed, or anything else for a failure (e.g, the Github job.status)")
+    subparsers.add_parser("stats", help="print the statistics of every recorded module/suite as json")
+    args = parser.parse_args()
+
+    store = TimingStore(args.path)
+    if args.command == "record":
+        store.record(args.module, args.suite, args.duration, args.status in ("passed", "success"))
+    else:
+        print(json.dumps({f"{module}/{suite}": store.get_stats(module, suite) for module, suite in sorted(store.load())}, indent=4))
@@ -0,0 +1,148 @@
+"""
+Works out the next version of each module from its commit messages (Conventional Commits), replacing a GitVersion run per module
+The history since the oldest module tag is walked once with a single git log, each commit is attributed to the modules
+whose files it changed, and every module's bump level is taken from its commits since its own last tag:
+    BREAKING CHANGE: in the body, or a ! before the colon (feat!: ..., fix(api)!: ...)  -> major
+    feat: ...                                                                       -> minor
+    anything else (fix:, chore:, ... or not conventional at all)                    -> patch
+GitVersion's "+semver: major|minor|patch|none" (or "skip") message markers are honoured as well.
+"""
+
+import logging
+import re
+import subprocess
+from scripts.module_classifier import ModuleClassifier
+
+
+class VersionEngine:
+
+    bump_levels = ["none", "patch", "minor", "major"]    # lowest to highest
+    default_bump = "patch"    # used for a module with no commits since its tag (e.g, one triggered through a dependency)
+    conventional_pattern = re.compile(r"^(?P<type>[A-Za-z]+)(\([^)]*\))?(?P<breaking>!)?:\s")
+    breaking_pattern = re.compile(r"^BREAKING[ -]CHANGE:", re.MULTILINE)
+    semver_marker_pattern = re.compile(r"\+semver:\s*(?P<level>major|breaking|minor|feature|patch|fix|none|skip)", re.IGNORECASE)
+    semver_marker_levels = {"breaking": "major", "feature": "minor", "fix": "patch", "skip": "none"}
+
+    def __init__(self, classifier=None, repo_path=None):
+        """
+        :param classifier: ModuleClassifier used to attribute each changed file to a module
+        :param repo_path: Path to the repository. Defaults to the current directory
+        """
+        self.classifier = classifier or ModuleClassifier(repo_path=repo_path)
+        self.repo_path = repo_path
+
+    def run_git(self, *args, input=None):
+        result = subprocess.run(["git", *args], cwd=self.repo_path, input=input, capture_output=True, check=True)
+        return result.stdout
+
+    def classify_message(self, message):
+        """
+        Get the bump level of a single commit message
+        :return: "major", "minor", "patch" or "none"
+        """
+        marker = self.semver_marker_pattern.search(message)
+        if marker:
+            level = marker.group("level").lower()
+            return self.semver_marker_levels.get(level, level)
+        match = self.conventional_pattern.match(message)
+        if (match and match.group("breaking")) or self.breaking_pattern.search(message):
+            return "major"
+        if match and match.group("type").lower() == "feat":
+            return "minor"
+        return "patch"
+
+    def resolve_commits(self, tag_names):
+        """
+        Resolve many tag names to the commits they point at with a single git cat-file call
+        :return: A dictionary of tag name to commit hash. Tags that don't exist locally are left out
+        """
+        if not tag_names:
+            return {}
+        output = self.run_git("cat-file", "--batch-check", input="".join(f"refs/tags/{tag_name}^{{commit}}\n" for tag_name in tag_names).encode())
+        commits = {}
+        for tag_name, line in zip(tag_names, output.decode().splitlines()):
+            parts = line.split()
+            if len(parts) == 3 and parts[1] == "commit":
+                commits[tag_name] = parts[0]
+        return commits
+
+    def walk_history(self, head, boundaries):
+        """
+        Walk the history once from head, stopping at commits that every boundary commit already contains
+        :param boundaries: A list of commit hashes (the module tags). An empty list walks the whole history
+        :return: A list of (commit, parents, message, files) tuples, newest first
+        """
+        args = ["log", "--topo-order", "-z", "--name-only", "--no-renames", "--format=%x1e%H %P%x00%B", head]
+        if boundaries:
+            # Commits reachable from every tag can't be new to any module
+            base = self.run_git("merge-base", "--octopus", *boundaries).decode().strip()
+            if base:
+                args.append(f"^{base}")
+        output = self.run_git(*args, "--").decode("utf-8", "surrogateescape")
+        commits = []
+        for record in output.split("\x1e")[1:]:
+            header, _separator, rest = record.partition("\0")
+            message, _separator, files = rest.partition("\0")
+            commit, *parents = header.split(" ")
+            commits.append((commit, [parent for parent in parents if parent], message, [path for path in files.lstrip("\n").split("\0") if path]))
+        return commits
+
+    def get_ancestors(self, commit, parents):
+        """
+        Find the ancestors of a commit (itself included) within the walked history
+        """
+        ancestors = set()
+        queue = [commit]
+        while queue:
+            current = queue.pop()
+            if current in ancestors or current not in parents:
+                continue
+            ancestors.add(current)
+            queue.extend(parents[current])
+        return ancestors
+
+    def get_bump_levels(self, tags, head="HEAD"):
+        """
+        Work out the bump level of many modules from one walk of the history
+        :param tags: A dictionary of module name to its last tag name (or None if the module has never been tagged)
+        :param head: The commit to version
+        :return: A dictionary of module name to "major", "minor", "patch" or "none"
+        """
+        tag_commits = self.resolve_commits(sorted(set(tag for tag in tags.values() if tag)))
+        # A module whose tag isn't available locally is treated as untagged, so the walk covers the whole history
+        boundaries = [] if any(tag not in tag_commits for tag in tags.values()) else sorted(set(tag_commits.values()))
+        history = self.walk_history(head, boundaries)
+        parents = dict((commit, commit_parents) for commit, commit_parents, _message, _files in history)
+        logging.debug(f"VersionEngine - walked {len(history)} commit(s) for {len(tags)} module(s)")
+
+        released = {}    # tag commit -> the commits the tag already contains, shared by modules tagged at the same commit
+        levels = dict((module, None) for module in tags)
+        for commit, _parents, message, files in history:
+            commit_level = None
+            for module in self.classifier.classify_many(files):
+                if module not in levels:
+                    continue
+                tag_commit = tag_commits.get(tags[module])
+                if tag_commit is not None:
+                    if tag_commit not in released:
+                        released[tag_commit] = self.get_ancestors(tag_commit, parents)
+                    if commit in released[tag_commit]:
+                        continue
+                if commit_level is None:
+                    commit_level = self.classify_message(message)
+                if levels[module] is None or self.bump_levels.index(commit_level) > self.bump_levels.index(levels[module]):
+                    levels[module] = commit_level
+        return dict((module, level or self.default_bump) for module, level in levels.items())
+
+    def bump(self, version, level):
+        """
+        :param version: A semver.Version
+        :return: The next semver.Version for the bump level
+        """
+        if level == "major":
+            return version.bump_major()
+        if level == "minor":
+            return version.bump_minor()
+        if level == "patch":
+            return version.bump_patch()
+        return version
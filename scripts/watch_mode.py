@@ -0,0 +1,315 @@
+"""
+Keeps the changed modules, their tests and the tests matrix for the working tree up to date while you work
+    python -m scripts watch [--base HEAD] [--interval 1]    # runs until interrupted
+    python -m scripts query matrix                          # what would CI run right now?
+The module directories and the git index are polled. Each module's files are stat'ed into a signature, and only the modules
+whose signature changed are compared with git again. The whole working tree is only compared again when the index or HEAD
+moves (a stage, commit or checkout), or when modules are added or removed or a rule file changes. The configuration and matrix are
+then rebuilt from the cached suite manifest and dependency graph, so an update costs a few milliseconds.
+The latest state is written to a json file and served over a unix socket. A query is one line naming what to return,
+    state | modules | config | matrix | ping | refresh
+and the reply is one line of json.
+"""
+
+import json
+import logging
+import os
+import socket
+import socketserver
+import threading
+import time
+from scripts.change_detector import ChangeDetector
+from scripts.config_store import ModulesConfigStore
+from scripts.tag_backends import LocalGitTagBackend
+from scripts.file_utils import write_json_atomic
+
+
+class WatchRequestHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        request = self.rfile.readline().decode().strip() or "state"
+        try:
+            reply = self.server.watcher.answer(request)
+        except ValueError as e:
+            reply = {"error": str(e)}
+        self.wfile.write(json.dumps(reply).encode() + b"\n")
+
+
+class ModulesWatcher:
+
+    default_state_path = os.path.join(".modules_cache", "watch_state.json")
+    default_socket_path = os.path.join(".modules_cache", "watch.sock")
+    queries = ("state", "modules", "config", "matrix", "ping", "refresh")
+
+    def __init__(self, app_factory, base="HEAD", interval=1.0, state_path=None, socket_path=None):
+        """
+        :param app_factory: Function returning a new ModulesConfig for the repository. Called again when modules are added or removed
+        :param base: The commit the working tree is compared with
+        :param interval: Seconds between polls
+        :param state_path: File the state is written to. Set to an empty string to not write one
+        :param socket_path: Unix socket the state is served on. Set to an empty string to not serve one
+        """
+        self.app_factory = app_factory
+        self.base = base
+        self.interval = interval
+        self.app = None
+        self.state_path = self.default_state_path if state_path is None else state_path
+        self.socket_path = self.default_socket_path if socket_path is None else socket_path
+        self.server = None
+        self.lock = threading.Lock()    # guards the state, read by the socket server threads
+        self.refresh_requested = threading.Event()
+        self.full_refresh = threading.Event()     # set by a refresh query, the next poll then forgets the signatures and git key
+        self.stopped = threading.Event()
+        self.layout_key = None      # mtimes of the root and group directories and the rule files
+        self.git_key = None         # mtimes of the git index and HEAD refs
+        self.signatures = {}        # module -> signature of its files
+        self.changed_files = {}     # module -> its files that differ from the base
+        self.state = {"base": base, "polls": 0, "updates": 0}
+
+    def get_repo_path(self):
+        return self.app.repo_path or os.getcwd()
+
+    def get_git_key(self):
+        """
+        :return: The mtimes of the files that change when something is staged, committed or checked out
+        """
+        git_dir = LocalGitTagBackend(self.get_repo_path()).get_git_dir()
+        if git_dir is None:
+            return None
+        paths = ["index", "HEAD", "packed-refs"]
+        try:
+            with open(os.path.join(git_dir, "HEAD")) as fh:
+                head = fh.read().strip()
+            if head.startswith("ref:"):
+                paths.append(head.removeprefix("ref:").strip())
+        except OSError:
+            pass
+        return [self.get_mtime(os.path.join(git_dir, path)) for path in paths]
+
+    def get_layout_key(self):
+        """
+        :return: The mtimes of the directories holding modules (they change when a module is added or removed) and of the rule files
+        """
+        repo_path = self.get_repo_path()
+        directories = set(self.app.classifier.roots)
+        for module_path in self.app.classifier.modules.values():
+            directories.add(os.path.dirname(module_path))
+        paths = sorted(os.path.join(repo_path, directory) for directory in directories)
+        paths.extend(
+            os.path.join(repo_path, module_path, self.app.path_rules.module_rules_file)
+            for module_path in sorted(self.app.classifier.modules.values())
+        )
+        paths.append(os.path.join(repo_path, self.app.path_rules.rules_path))
+        return [(path, self.get_mtime(path)) for path in paths]
+
+    def get_mtime(self, path):
+        try:
+            stat = os.stat(path)
+            return stat.st_mtime_ns, stat.st_size
+        except OSError:
+            return None
+
+    def get_signature(self, directory):
+        """
+        A signature of every file under a directory (names, mtimes and sizes), found with os.scandir rather than reading any file
+        """
+        entries = []
+        pending = [directory]
+        while pending:
+            current = pending.pop()
+            try:
+                with os.scandir(current) as scan:
+                    for entry in scan:
+                        if entry.is_dir(follow_symlinks=False):
+                            pending.append(entry.path)
+                        else:
+                            stat = entry.stat(follow_symlinks=False)
+                            entries.append((entry.path, stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                continue
+        return hash(tuple(sorted(entries)))
+
+    def get_signatures(self):
+        repo_path = self.get_repo_path()
+        return dict(
+            (module, self.get_signature(os.path.join(repo_path, module_path)))
+            for module, module_path in self.app.classifier.modules.items()
+        )
+
+    def read_changed_files(self, module_paths=None):
+        """
+        Compare the working tree (or just some module directories of it) with the base
+        :return: A dictionary of module to its changed files
+        """
+        detector = ChangeDetector(self.app.classifier, repo_path=self.app.repo_path)
+        changed_files = {}
+        for path in detector.iter_working_tree_files(self.base, module_paths):
+            module = self.app.classifier.classify(path)
+            if module is not None:
+                changed_files.setdefault(module, []).append(path)
+        return changed_files
+
+    def poll(self):
+        """
+        Check for changes and bring the state up to date
+        :return: True if the state was updated
+        """
+        with self.lock:
+            self.state["polls"] += 1
+        if self.full_refresh.is_set():
+            # compare every module, and the whole working tree, with git again rather than trusting the stat signatures
+            self.full_refresh.clear()
+            self.signatures = {}
+            self.git_key = None
+        if self.app is None or self.get_layout_key() != self.layout_key:
+            # modules or rule files added or removed: start over with a freshly scanned repository
+            self.app = self.app_factory()
+            self.app.classifier.compile()
+            self.layout_key = self.get_layout_key()
+            self.signatures = self.get_signatures()
+            self.changed_files = self.read_changed_files()
+            updated = True
+        else:
+            signatures = self.get_signatures()
+            modified = [module for module, signature in signatures.items() if self.signatures.get(module) != signature]
+            git_moved = self.get_git_key() != self.git_key
+            if git_moved:
+                # staged, committed or checked out: the whole working tree is compared again (still a single git diff)
+                self.changed_files = self.read_changed_files()
+            elif modified:
+                module_paths = [self.app.classifier.get_module_path(module) for module in modified]
+                changed_files = dict(self.changed_files)
+                changed_files.update(dict.fromkeys(modified))
+                changed_files.update(self.read_changed_files(module_paths))
+                self.changed_files = dict((module, paths) for module, paths in changed_files.items() if paths)
+            # rebuilt even when the changed files are as they were, e.g, a module that already differed from the base edited
+            # again has a new fingerprint, so suites that passed for its previous content are no longer skipped
+            updated = git_moved or bool(modified)
+            self.signatures = signatures
+        if updated:
+            self.rebuild()
+        # taken after git has run, as git diff and git status (see module_fingerprint.py) refresh the stat information in the index
+        self.git_key = self.get_git_key()
+        return updated
+
+    def rebuild(self):
+        """
+        Rebuild the configuration and matrix for the current changed files
+        """
+        app = self.app
+        start = time.perf_counter()
+        # the fingerprints and dependencies of the previous build may be out of date. They are looked up again, the dependency
+        # graph from its cache (only modules whose .tf files changed are parsed again)
+        app.fingerprinter.tree_hashes = {}
+        app.fingerprinter.fingerprints = {}
+        app.dependency_graph.dependents = None
+        app.modules_config = ModulesConfigStore()
+        app.buffer_outputs()
+        modules_list, bump_only = app.path_rules.classify_many(path for paths in self.changed_files.values() for path in paths)
+        app.build_modules_config_for_modules(modules_list, versions=False, bump_only=bump_only)
+        app.build_tests_matrix_config()
+        outputs = dict(app.output_buffer)
+        app.output_buffer = None
+        with self.lock:
+            self.state.update({
+                "updated": time.time(),
+                "changed_modules": modules_list,
+                "config": app.modules_config.to_list(),
+                "matrix": json.loads(outputs["TESTS_MATRIX_OUTPUT"]) if "TESTS_MATRIX_OUTPUT" in outputs else None,
+                "updates": self.state["updates"] + 1,
+                "rebuild_seconds": round(time.perf_counter() - start, 4),
+            })
+            state = dict(self.state)
+        logging.info("ModulesWatcher - %d changed module(s), rebuilt in %.3fs", len(modules_list), state["rebuild_seconds"])
+        self.write_state(state)
+
+    def write_state(self, state):
+        if not self.state_path:
+            return
+        write_json_atomic(self.state_path, state)
+
+    def answer(self, request):
+        """
+        :param request: One of the queries. refresh makes the next poll, started straight away, compare the whole working tree with
+            git again (e.g, after an edit that kept a file's size and mtime)
+        :return: The reply
+        """
+        if request not in self.queries:
+            raise ValueError(f"Unknown query {request}, use one of {', '.join(self.queries)}")
+        if request == "ping":
+            return "pong"
+        if request == "refresh":
+            self.full_refresh.set()
+            self.refresh_requested.set()
+            return "ok"
+        with self.lock:
+            if request == "state":
+                return dict(self.state)
+            return self.state.get({"modules": "changed_modules"}.get(request, request))
+
+    def start_server(self):
+        """
+        Serve queries on the unix socket from a background thread (where unix sockets are supported)
+        """
+        if not self.socket_path or not hasattr(socket, "AF_UNIX"):
+            return
+        directory = os.path.dirname(self.socket_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if os.path.exists(self.socket_path):
+            # left behind by a watcher that didn't shut down cleanly
+            os.remove(self.socket_path)
+        self.server = socketserver.ThreadingUnixStreamServer(self.socket_path, WatchRequestHandler)
+        self.server.daemon_threads = True
+        self.server.watcher = self
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        logging.info("ModulesWatcher - answering queries on %s", self.socket_path)
+
+    def stop(self):
+        self.stopped.set()
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+
+    def run(self, polls=None):
+        """
+        Poll until stopped (or interrupted)
+        :param polls: Optional number of polls to make before returning
+        """
+        self.start_server()
+        try:
+            while not self.stopped.is_set() and (polls is None or self.state["polls"] < polls):
+                self.poll()
+                self.refresh_requested.wait(self.interval)
+                self.refresh_requested.clear()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+
+
+def query(request="state", socket_path=None, state_path=None):
+    """
+    Ask a running watcher, or read its state file if no watcher is answering
+    :return: The reply
+    """
+    socket_path = ModulesWatcher.default_socket_path if socket_path is None else socket_path
+    if socket_path and hasattr(socket, "AF_UNIX") and os.path.exists(socket_path):
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+                client.connect(socket_path)
+                client.sendall(f"{request}\n".encode())
+                with client.makefile("rb") as fh:
+                    return json.loads(fh.readline())
+        except OSError as e:
+            logging.debug("ModulesWatcher - no watcher answering on %s, reading the state file: %s", socket_path, e)
+    with open(state_path or ModulesWatcher.default_state_path) as fh:
+        state = json.load(fh)
+    if request == "state":
+        return state
+    if request in ("modules", "config", "matrix"):
+        return state.get({"modules": "changed_modules"}.get(request, request))
+    raise ValueError(f"The state file can't answer {request}")
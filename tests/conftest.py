@@ -0,0 +1,59 @@
+import os
+import subprocess
+
+import pytest
+
+
+class GitRepo:
+    """
+    A throwaway git repository to build commits in
+    """
+
+    def __init__(self, path):
+        self.path = str(path)
+        os.makedirs(self.path, exist_ok=True)
+        self.run_git("init", "-q", "-b", "main")
+        self.run_git("config", "user.email", "tests@example.com")
+        self.run_git("config", "user.name", "tests")
+        self.run_git("config", "commit.gpgsign", "false")
+
+    def run_git(self, *args):
+        result = subprocess.run(["git", *args], cwd=self.path, capture_output=True, text=True, check=True)
+        return result.stdout.strip()
+
+    def write(self, relative_path, content=""):
+        path = os.path.join(self.path, relative_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as fh:
+            fh.write(content)
+        return path
+
+    def remove(self, relative_path):
+        os.remove(os.path.join(self.path, relative_path))
+
+    def commit(self, message="change", tag=None):
+        """
+        :return: The sha of the new commit
+        """
+        self.run_git("add", "-A")
+        self.run_git("commit", "-q", "--allow-empty", "-m", message)
+        if tag:
+            self.run_git("tag", tag)
+        return self.run_git("rev-parse", "HEAD")
+
+
+@pytest.fixture(autouse=True)
+def clean_environment(monkeypatch, tmp_path):
+    """
+    Keep the tests away from any configuration, output files or caches set up in the environment running them
+    """
+    for name in list(os.environ):
+        if name.startswith("MODULES_CONFIG") or name in ("GITHUB_OUTPUT", "GITHUB_STEP_SUMMARY", "GH_TOKEN"):
+            monkeypatch.delenv(name)
+    monkeypatch.setenv("MODULES_CONFIG_METRICS", "")
+    monkeypatch.chdir(tmp_path)
+
+
+@pytest.fixture
+def repo(tmp_path):
+    return GitRepo(tmp_path / "repo")
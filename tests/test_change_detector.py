@@ -0,0 +1,97 @@
+import json
+import subprocess
+import sys
+
+from scripts.change_detector import ChangeDetector
+from scripts.module_classifier import ModuleClassifier
+
+
+def make_detector(repo, roots=None):
+    return ChangeDetector(ModuleClassifier(roots=roots, repo_path=repo.path), repo_path=repo.path)
+
+
+def build_modules(repo):
+    for name in ("module1", "module2", "module3"):
+        repo.write(f"modules/{name}/main.tf", f"# {name}\n")
+        repo.write(f"modules/{name}/tests/unit/test.py")
+    repo.write("modules/networking/vpc/main.tf")
+    repo.write("modules/networking/dns/main.tf")
+    repo.write("README.md")
+    return repo.commit("base")
+
+
+def test_changed_modules_between_commits(repo):
+    base = build_modules(repo)
+    repo.write("modules/module1/main.tf", "# changed\n")
+    repo.write("modules/module2/tests/unit/test.py", "assert True\n")
+    repo.write("README.md", "changed\n")
+    head = repo.commit("head")
+
+    assert sorted(make_detector(repo).get_changed_modules(base, head)) == ["module1", "module2"]
+
+
+def test_nested_group_directories_are_descended_into(repo):
+    base = build_modules(repo)
+    repo.write("modules/networking/dns/main.tf", "# changed\n")
+    head = repo.commit("head")
+
+    assert make_detector(repo).get_changed_modules(base, head) == ["networking/dns"]
+
+
+def test_added_and_deleted_modules_are_changed(repo):
+    base = build_modules(repo)
+    repo.remove("modules/module3/main.tf")
+    repo.remove("modules/module3/tests/unit/test.py")
+    repo.write("modules/module4/main.tf")
+    head = repo.commit("head")
+
+    assert sorted(make_detector(repo).get_changed_modules(base, head)) == ["module3", "module4"]
+
+
+def test_zero_base_counts_every_module_as_changed(repo):
+    head = build_modules(repo)
+    changed = make_detector(repo).get_changed_modules("0" * 40, head)
+
+    assert sorted(changed) == ["module1", "module2", "module3", "networking/dns", "networking/vpc"]
+
+
+def test_empty_head_is_head(repo):
+    base = build_modules(repo)
+    repo.write("modules/module1/main.tf", "# changed\n")
+    repo.commit("head")
+    detector = make_detector(repo)
+
+    assert detector.get_changed_modules(base, "") == ["module1"]
+    assert detector.get_changed_modules(base, None) == ["module1"]
+    assert list(detector.iter_changed_files(base, "")) == ["modules/module1/main.tf"]
+
+
+def test_changed_files_between_commits(repo):
+    base = build_modules(repo)
+    repo.write("modules/module1/main.tf", "# changed\n")
+    repo.write("README.md", "changed\n")
+    head = repo.commit("head")
+
+    assert sorted(make_detector(repo).iter_changed_files(base, head)) == ["README.md", "modules/module1/main.tf"]
+
+
+def test_working_tree_files(repo):
+    build_modules(repo)
+    repo.write("modules/module1/main.tf", "# edited\n")
+    repo.write("modules/module2/new.tf")
+    detector = make_detector(repo)
+
+    assert sorted(detector.iter_working_tree_files("HEAD")) == ["modules/module1/main.tf", "modules/module2/new.tf"]
+    assert list(detector.iter_working_tree_files("HEAD", ["modules/module2"])) == ["modules/module2/new.tf"]
+
+
+def test_command_line_treats_an_empty_head_as_head(repo, monkeypatch):
+    base = build_modules(repo)
+    repo.write("modules/module2/main.tf", "# changed\n")
+    repo.commit("head")
+    monkeypatch.chdir(repo.path)
+    script = [sys.executable, "-m", "scripts.change_detector"]
+    env_path = {"PYTHONPATH": ":".join(sys.path)}
+
+    result = subprocess.run([*script, base, ""], capture_output=True, text=True, check=True, env=env_path)
+    assert json.loads(result.stdout) == ["module2"]
@@ -0,0 +1,107 @@
+import json
+
+import pytest
+
+from scripts.config_payload import ConfigPayload
+from scripts.config_snapshot import ConfigSnapshot
+
+
+MODULES = [
+    {"module": "module1", "tests": ["unit", "bdd"], "versions": {"current": None, "next": "0.0.1"}, "priority": 0, "required": True, "owner": "team"},
+    {"module": "module10", "tests": ["unit", "bdd"], "versions": {"current": None, "next": "0.0.1"}, "priority": 1, "required": False, "weight": 0.5},
+    {"module": "module2", "tests": [], "notes": None},
+    {"module": "module3"},
+]
+
+
+def round_trip(payload, value):
+    return payload.decode(json.loads(json.dumps(value, separators=payload.separators)))
+
+
+def test_compact_encoding_round_trips():
+    payload = ConfigPayload()
+    compact = payload.encode_compact(MODULES)
+
+    assert compact["format"] == "compact"
+    assert round_trip(payload, compact) == MODULES
+
+
+def test_compact_encoding_stores_repeated_values_once():
+    compact = ConfigPayload().encode_compact(MODULES)
+
+    assert compact["values"].count(["unit", "bdd"]) == 1
+    assert compact["values"].count({"current": None, "next": "0.0.1"}) == 1
+
+
+def test_plain_list_decodes_to_itself():
+    payload = ConfigPayload()
+
+    assert round_trip(payload, MODULES) == MODULES
+
+
+def test_spill_file_round_trips(tmp_path):
+    payload = ConfigPayload(spill_path=str(tmp_path / "spill" / "modules_config.jsonl"))
+    reference = round_trip(payload, payload.spill(MODULES))
+
+    assert payload.is_spilled(reference)
+    assert reference["modules"] == len(MODULES)
+    assert payload.load_spilled(reference) == MODULES
+    # module1 is a prefix of module10, so only a whole name may match
+    assert payload.find_spilled(reference, "module1") == MODULES[0]
+    assert payload.find_spilled(reference, "module10") == MODULES[1]
+    assert payload.find_spilled(reference, "module4") is None
+
+
+def test_snapshot_reference_is_read_like_a_spill_file(tmp_path):
+    path = str(tmp_path / "modules_config.snap")
+    ConfigSnapshot(path).write(MODULES)
+    payload = ConfigPayload()
+    reference = {"format": "snapshot", "path": path}
+
+    assert payload.is_spilled(reference)
+    assert payload.load_spilled(reference) == MODULES
+    assert payload.find_spilled(reference, "module10") == MODULES[1]
+    assert payload.find_spilled(reference, "module4") is None
+
+
+def test_fit_keeps_the_plain_format_up_to_the_budget(tmp_path):
+    size = len(json.dumps(MODULES).encode("utf-8"))
+    payload = ConfigPayload(budget=size, spill_path=str(tmp_path / "modules_config.jsonl"))
+    output, serialised = payload.fit(MODULES)
+
+    assert output == MODULES
+    assert serialised == json.dumps(MODULES)
+    assert not (tmp_path / "modules_config.jsonl").exists()
+
+
+def test_fit_compacts_one_byte_over_the_budget(tmp_path):
+    size = len(json.dumps(MODULES).encode("utf-8"))
+    payload = ConfigPayload(budget=size - 1, spill_path=str(tmp_path / "modules_config.jsonl"))
+    output, serialised = payload.fit(MODULES)
+
+    assert output["format"] == "compact"
+    assert len(serialised.encode("utf-8")) <= size - 1
+    assert round_trip(payload, output) == MODULES
+
+
+def test_fit_spills_when_the_compact_encoding_is_over_the_budget(tmp_path):
+    spill_path = str(tmp_path / "modules_config.jsonl")
+    payload = ConfigPayload(budget=10, spill_path=spill_path)
+    output, serialised = payload.fit(MODULES)
+
+    assert output == {"format": "spill", "path": spill_path, "modules": len(MODULES)}
+    assert json.loads(serialised) == output
+    assert payload.load_spilled(output) == MODULES
+
+
+@pytest.mark.parametrize("budget", ["", "0"])
+def test_budget_defaults_when_the_environment_variable_is_empty(monkeypatch, budget):
+    monkeypatch.setenv(ConfigPayload.budget_env_var, budget)
+
+    assert ConfigPayload().budget == ConfigPayload.budget
+
+
+def test_budget_is_read_from_the_environment(monkeypatch):
+    monkeypatch.setenv(ConfigPayload.budget_env_var, "1000")
+
+    assert ConfigPayload().budget == 1000
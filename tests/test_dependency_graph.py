@@ -0,0 +1,79 @@
+import os
+import shutil
+import subprocess
+
+from scripts.dependency_graph import DependencyGraph
+from scripts.module_classifier import ModuleClassifier
+
+
+def fail(*args):
+    raise AssertionError(f"unexpected call with {args}")
+
+
+def make_graph(path):
+    return DependencyGraph(ModuleClassifier(repo_path=path), cache_path=os.path.join(path, ".modules_cache", "dependencies.json"), repo_path=path)
+
+
+def build_modules(repo):
+    repo.write("modules/network/main.tf")
+    repo.write("modules/database/main.tf", 'module "network" {\n  source = "../network"\n}\n')
+    repo.write("modules/app/main.tf", '# module "old" {\n#   source = "../old"\n# }\n')
+    repo.write("modules/app/uses.tf", 'module "db" {\n  source  = "../database"\n  version = "1.0"\n}\nmodule "vpc" {\n  source = "terraform-aws-modules/vpc/aws"\n}\n')
+    repo.commit("base")
+
+
+def test_dependencies_and_affected_modules(repo):
+    build_modules(repo)
+    graph = make_graph(repo.path)
+
+    assert graph.get_dependencies("app") == ["database"]
+    assert graph.get_dependencies("database") == ["network"]
+    assert graph.get_affected(["network"]) == {"database": ["network"], "app": ["database"]}
+    assert graph.get_affected(["network", "database"]) == {"app": ["database"]}
+
+
+def test_unchanged_mtimes_need_no_git(repo, monkeypatch):
+    build_modules(repo)
+    graph = make_graph(repo.path)
+    graph.build()
+    graph.save()
+
+    graph = make_graph(repo.path)
+    monkeypatch.setattr(graph, "get_blob_keys", fail)
+    monkeypatch.setattr(graph, "parse_module", fail)
+    assert graph.get_dependencies("app") == ["database"]
+
+
+def test_restored_cache_matches_a_fresh_checkout(repo, tmp_path, monkeypatch):
+    build_modules(repo)
+    graph = make_graph(repo.path)
+    graph.build()
+    graph.save()
+
+    clone = str(tmp_path / "clone")
+    subprocess.run(["git", "clone", "-q", repo.path, clone], check=True)
+    shutil.copytree(os.path.join(repo.path, ".modules_cache"), os.path.join(clone, ".modules_cache"))
+    clone_graph = make_graph(clone)
+    monkeypatch.setattr(clone_graph, "parse_module", fail)
+
+    assert clone_graph.get_affected(["network"]) == {"database": ["network"], "app": ["database"]}
+    clone_graph.save()
+    # the new mtimes are stored, so the next run doesn't ask git
+    next_graph = make_graph(clone)
+    monkeypatch.setattr(next_graph, "get_blob_keys", fail)
+    next_graph.build()
+
+
+def test_changed_tf_file_is_parsed_again(repo):
+    build_modules(repo)
+    graph = make_graph(repo.path)
+    graph.build()
+    graph.save()
+    repo.write("modules/network/main.tf", 'module "app" {\n  source = "../app"\n}\n')
+
+    graph = make_graph(repo.path)
+    # forget the mtimes, as a fresh checkout would, so only git can validate the entries
+    for entry in graph.load().values():
+        entry["mtime"] = []
+    assert graph.get_dependencies("network") == ["app"]
+    assert graph.get_dependencies("app") == ["database"]
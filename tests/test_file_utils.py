@@ -0,0 +1,48 @@
+import json
+import os
+
+import pytest
+
+from scripts.file_utils import get_repo_file, open_atomic, write_json_atomic
+from scripts.modules_config import ModulesConfig
+
+
+def test_repo_files_are_relative_to_the_repository(tmp_path):
+    assert get_repo_file("repo", "cache/file.json") == os.path.join("repo", "cache/file.json")
+    assert get_repo_file(None, "cache/file.json") == "cache/file.json"
+    assert get_repo_file("repo", str(tmp_path)) == str(tmp_path)
+    assert get_repo_file("repo", "") == ""
+
+
+def test_write_json_atomic_creates_the_directory(tmp_path):
+    path = str(tmp_path / "cache" / "file.json")
+    write_json_atomic(path, {"a": [1, 2]}, separators=(",", ":"))
+
+    with open(path) as fh:
+        assert fh.read() == '{"a":[1,2]}'
+    assert os.listdir(tmp_path / "cache") == ["file.json"]
+
+
+def test_failed_write_keeps_the_previous_file(tmp_path):
+    path = str(tmp_path / "file.json")
+    write_json_atomic(path, {"a": 1})
+
+    with pytest.raises(TypeError):
+        write_json_atomic(path, {"a": object()})
+    with pytest.raises(RuntimeError):
+        with open_atomic(path) as fh:
+            fh.write("partial")
+            raise RuntimeError("interrupted")
+
+    with open(path) as fh:
+        assert json.load(fh) == {"a": 1}
+    assert os.listdir(tmp_path) == ["file.json"]
+
+
+def test_modules_config_builds_its_subsystems_on_first_use(repo):
+    app = ModulesConfig(repo_path=repo.path)
+
+    assert not set(vars(app)) & {"path_rules", "suite_index", "dependency_graph", "version_engine", "fingerprinter", "result_cache"}
+    assert app.fingerprinter is app.fingerprinter
+    assert app.result_cache.path == os.path.join(repo.path, ".modules_cache", "results.log")
+    assert "suite_index" not in vars(app)
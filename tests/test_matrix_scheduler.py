@@ -0,0 +1,87 @@
+import json
+
+from scripts.matrix_scheduler import MatrixScheduler
+from scripts.modules_config import ModulesConfig
+
+
+def make_entries(count, test="unit"):
+    return [{"module": f"module{index:04d}", "test": test} for index in range(count)]
+
+
+def test_estimates_fall_back_to_the_suite_type_defaults():
+    durations = {("module1", "unit"): 5}
+    scheduler = MatrixScheduler(lambda module, test: durations.get((module, test)))
+
+    assert scheduler.estimate("module1", "unit") == 5
+    assert scheduler.estimate("module2", "unit") == MatrixScheduler.default_durations["unit"]
+    assert scheduler.estimate("module2", "e2e") == MatrixScheduler.default_duration
+
+
+def test_order_is_longest_first_and_stable():
+    durations = {"a": 10, "b": 30, "c": 10, "d": 20}
+    scheduler = MatrixScheduler(lambda module, test: durations[module])
+    entries = [{"module": module, "test": "unit"} for module in "abcd"]
+
+    assert [entry["module"] for entry in scheduler.order(entries)] == ["b", "d", "a", "c"]
+
+
+def test_shards_are_capped_at_the_matrix_job_limit():
+    entries = make_entries(1000)
+    shards = MatrixScheduler().shard(entries, 5000)
+
+    assert len(shards) == MatrixScheduler.max_jobs
+    assert [shard["shard"] for shard in shards] == list(range(1, MatrixScheduler.max_jobs + 1))
+
+
+def test_shards_are_capped_at_the_number_of_entries():
+    assert len(MatrixScheduler().shard(make_entries(3), 10)) == 3
+    assert len(MatrixScheduler().shard(make_entries(3), 0)) == 1
+
+
+def test_every_entry_is_placed_once():
+    entries = make_entries(300) + make_entries(300, "bdd")
+    shards = MatrixScheduler().shard(entries, 7)
+    placed = [job for shard in shards for job in shard["jobs"]]
+
+    assert sorted(placed, key=json.dumps) == sorted(entries, key=json.dumps)
+    assert sum(shard["expected_duration"] for shard in shards) == 300 * 60 + 300 * 300
+
+
+def test_shards_are_balanced_by_expected_duration():
+    durations = {"m1": 100, "m2": 70, "m3": 60, "m4": 40, "m5": 30}
+    scheduler = MatrixScheduler(lambda module, test: durations[module])
+    shards = scheduler.shard([{"module": module, "test": "unit"} for module in durations], 2)
+
+    # longest first onto the least loaded shard gives m1, m4 (140) and m2, m3, m5 (160)
+    assert sorted(shard["expected_duration"] for shard in shards) == [140, 160]
+    assert scheduler.critical_path(shards) == 160
+
+
+def test_critical_path_of_unsharded_includes():
+    durations = {"m1": 100, "m2": 70}
+    scheduler = MatrixScheduler(lambda module, test: durations[module])
+
+    assert scheduler.critical_path([{"module": "m1", "test": "unit"}, {"module": "m2", "test": "unit"}]) == 100
+    assert scheduler.critical_path([]) == 0
+
+
+def test_a_matrix_over_the_job_limit_is_sharded(monkeypatch):
+    monkeypatch.setenv("MODULES_CONFIG_RESULT_CACHE", "")
+    modules = [{"module": f"module{index:04d}", "tests": ["unit", "bdd"]} for index in range(200)]
+    app = ModulesConfig(json.dumps(modules))
+    includes = app.build_matrix_includes(app.get_modules_config(), {})
+
+    assert len(includes) == MatrixScheduler.max_jobs
+    assert sum(len(include["jobs"]) for include in includes) == 400
+
+
+def test_a_matrix_within_the_job_limit_is_one_job_per_suite(monkeypatch):
+    monkeypatch.setenv("MODULES_CONFIG_RESULT_CACHE", "")
+    modules = [{"module": "module1", "tests": ["unit", "bdd"]}, {"module": "module2", "tests": ["unit"]}]
+    app = ModulesConfig(json.dumps(modules))
+    includes = app.build_matrix_includes(app.get_modules_config(), {})
+
+    assert includes[0] == {"module": "module1", "test": "bdd"}
+    assert sorted(includes, key=json.dumps) == sorted(
+        [{"module": "module1", "test": "unit"}, {"module": "module1", "test": "bdd"}, {"module": "module2", "test": "unit"}], key=json.dumps,
+    )
@@ -0,0 +1,107 @@
+import json
+import os
+import shutil
+import subprocess
+
+import pytest
+
+from scripts.module_classifier import ModuleClassifier
+from scripts.path_rules import PathRules
+
+
+def fail(*args):
+    raise AssertionError(f"unexpected call with {args}")
+
+
+def make_rules(path):
+    return PathRules(ModuleClassifier(repo_path=path), cache_path=os.path.join(path, ".modules_cache", "rules.json"), repo_path=path)
+
+
+def write_rules(repo, relative_path, rules):
+    repo.write(relative_path, json.dumps({"rules": rules}))
+
+
+def build_modules(repo):
+    repo.write("modules/module1/main.tf")
+    repo.write("modules/module2/main.tf")
+    write_rules(repo, ".modules_rules.json", [
+        {"paths": ["*.md"], "action": "ignore"},
+        {"paths": ["docs/"], "exclude": ["docs/examples/**"], "action": "skip_tests"},
+    ])
+    write_rules(repo, "modules/module2/.module_rules.json", [
+        {"paths": ["README.md"], "action": "trigger"},
+        {"paths": ["/variables.tf", "examples/**/*.tf"], "action": "bump_only"},
+    ])
+    repo.commit("base")
+
+
+@pytest.mark.parametrize("path, action", [
+    ("modules/module1/main.tf", "trigger"),
+    ("modules/module1/README.md", "ignore"),
+    ("modules/module1/sub/dir/NOTES.md", "ignore"),
+    ("modules/module1/docs/usage.txt", "bump_only"),
+    ("docs/usage.txt", "bump_only"),
+    ("docs/deep/usage.txt", "bump_only"),
+    ("docs/examples/main.tf", "trigger"),
+    ("modules/module1/docs/examples/main.tf", "bump_only"),
+    # module rules are checked before the global ones
+    ("modules/module2/README.md", "trigger"),
+    ("modules/module2/CHANGELOG.md", "ignore"),
+    ("modules/module2/variables.tf", "bump_only"),
+    ("modules/module2/sub/variables.tf", "trigger"),
+    ("modules/module2/examples/main.tf", "bump_only"),
+    ("modules/module2/examples/a/b/main.tf", "bump_only"),
+    ("modules/module1/variables.tf", "trigger"),
+])
+def test_actions(repo, path, action):
+    build_modules(repo)
+
+    assert make_rules(repo.path).match(path) == action
+
+
+def test_classify_many(repo):
+    build_modules(repo)
+    paths = ["modules/module1/README.md", "modules/module2/variables.tf", "modules/module3/main.tf", "modules/module2/examples/main.tf"]
+
+    assert make_rules(repo.path).classify_many(paths) == (["module2", "module3"], {"module2"})
+
+
+def test_a_path_triggering_tests_wins_over_bump_only(repo):
+    build_modules(repo)
+    paths = ["modules/module2/variables.tf", "modules/module2/main.tf"]
+
+    assert make_rules(repo.path).classify_many(paths) == (["module2"], set())
+
+
+def test_no_rule_files_means_no_rules_and_no_cache(repo):
+    repo.write("modules/module1/main.tf")
+    rules = make_rules(repo.path)
+
+    assert not rules.has_rules()
+    assert rules.match("modules/module1/README.md") == "trigger"
+    assert not os.path.exists(rules.cache_path)
+
+
+def test_restored_cache_matches_a_fresh_checkout(repo, tmp_path, monkeypatch):
+    build_modules(repo)
+    rules = make_rules(repo.path)
+    rules.load()
+    assert os.path.isfile(rules.cache_path)
+
+    clone = str(tmp_path / "clone")
+    subprocess.run(["git", "clone", "-q", repo.path, clone], check=True)
+    shutil.copytree(os.path.join(repo.path, ".modules_cache"), os.path.join(clone, ".modules_cache"))
+    clone_rules = make_rules(clone)
+    monkeypatch.setattr(clone_rules, "parse", fail)
+
+    assert clone_rules.match("modules/module2/variables.tf") == "bump_only"
+
+
+def test_edited_rule_file_is_parsed_again(repo):
+    build_modules(repo)
+    make_rules(repo.path).load()
+    write_rules(repo, ".modules_rules.json", [{"paths": ["*.txt"], "action": "ignore"}])
+
+    rules = make_rules(repo.path)
+    assert rules.match("modules/module1/README.md") == "trigger"
+    assert rules.match("docs/usage.txt") == "ignore"
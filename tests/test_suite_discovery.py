@@ -0,0 +1,86 @@
+import os
+import shutil
+import subprocess
+
+from scripts.module_classifier import ModuleClassifier
+from scripts.suite_discovery import SuiteIndex
+
+
+def fail(*args):
+    raise AssertionError(f"unexpected call with {args}")
+
+
+def make_index(repo):
+    classifier = ModuleClassifier(repo_path=repo.path)
+    return SuiteIndex(classifier, cache_path=os.path.join(repo.path, ".modules_cache", "suites.json"), repo_path=repo.path)
+
+
+def build_modules(repo):
+    repo.write("modules/module1/main.tf")
+    repo.write("modules/module1/tests/unit/test.py")
+    repo.write("modules/module1/tests/bdd/test.py")
+    repo.write("modules/module1/tests/smoke/test.py")
+    repo.write("modules/module1/tests/fixtures/data.json")
+    repo.write("modules/module1/tests/_private/test.py")
+    repo.write("modules/module2/main.tf")
+    repo.commit("base")
+
+
+def test_suites_are_ordered_and_shared_directories_skipped(repo):
+    build_modules(repo)
+
+    assert make_index(repo).build_manifest() == {"module1": ["unit", "bdd", "smoke"]}
+
+
+def test_unchanged_mtimes_need_no_git(repo, monkeypatch):
+    build_modules(repo)
+    index = make_index(repo)
+    index.build_manifest()
+    index.save()
+
+    index = make_index(repo)
+    monkeypatch.setattr(index, "get_tree_keys", fail)
+    assert index.build_manifest() == {"module1": ["unit", "bdd", "smoke"]}
+
+
+def test_restored_cache_matches_a_fresh_checkout(repo, tmp_path, monkeypatch):
+    build_modules(repo)
+    index = make_index(repo)
+    index.build_manifest()
+    index.save()
+
+    clone = str(tmp_path / "clone")
+    subprocess.run(["git", "clone", "-q", repo.path, clone], check=True)
+    shutil.copytree(os.path.join(repo.path, ".modules_cache"), os.path.join(clone, ".modules_cache"))
+    clone_index = SuiteIndex(ModuleClassifier(repo_path=clone), cache_path=os.path.join(clone, ".modules_cache", "suites.json"), repo_path=clone)
+    monkeypatch.setattr(clone_index, "scan_module", fail)
+
+    assert clone_index.build_manifest() == {"module1": ["unit", "bdd", "smoke"]}
+    # the new mtimes are stored, so the next run doesn't ask git
+    assert clone_index.manifest["module1"]["mtime"] == clone_index.get_mtime_key(clone_index.get_module_directory("module1"))
+
+
+def test_suite_added_locally_is_found(repo):
+    build_modules(repo)
+    index = make_index(repo)
+    index.build_manifest()
+    index.save()
+    repo.write("modules/module1/tests/integration/test.py")
+    # a new suite changes the tests directory's mtime, unless it lands within the filesystem's mtime granularity
+    tests_directory = os.path.join(repo.path, "modules/module1/tests")
+    os.utime(tests_directory, ns=(0, os.stat(tests_directory).st_mtime_ns + 1_000_000_000))
+
+    assert make_index(repo).build_manifest() == {"module1": ["unit", "bdd", "integration", "smoke"]}
+
+
+def test_uncommitted_suite_isnt_matched_by_the_committed_tree(repo):
+    build_modules(repo)
+    index = make_index(repo)
+    index.build_manifest()
+    index.save()
+    repo.write("modules/module1/tests/integration/test.py")
+    index = make_index(repo)
+    # forget the mtimes, as a fresh checkout would, so only git can validate the entry
+    index.load()["module1"]["mtime"] = "-"
+
+    assert index.build_manifest() == {"module1": ["unit", "bdd", "integration", "smoke"]}
@@ -0,0 +1,50 @@
+import os
+
+from scripts.batch_mode import BatchRunner
+from scripts.tag_backends import GithubApiTagBackend, LocalGitTagBackend, select_tag_backend
+from scripts.tag_cache import TagCache
+
+
+def test_auto_uses_the_local_refs_of_a_full_clone(repo):
+    repo.commit("base", tag="module1-0.1.0")
+    backend = select_tag_backend(repo_path=repo.path)
+
+    assert isinstance(backend, LocalGitTagBackend)
+    assert backend.get_tags(["module1"]) == {"module1": ["0.1.0"]}
+
+
+def test_auto_falls_back_to_the_api_without_a_clone(tmp_path):
+    backend = select_tag_backend(repo_path=str(tmp_path), repository="org/repo", base_url="https://github.example.com/api/v3")
+
+    assert isinstance(backend, GithubApiTagBackend)
+    assert backend.repository == "org/repo"
+    assert backend.base_url == "https://github.example.com/api/v3"
+    assert backend.cache.path == os.path.join(str(tmp_path), TagCache.default_path)
+
+
+def test_mode_is_read_from_the_environment(repo, monkeypatch):
+    monkeypatch.setenv("MODULES_CONFIG_TAG_BACKEND", "api")
+
+    assert isinstance(select_tag_backend(repo_path=repo.path), GithubApiTagBackend)
+    assert isinstance(select_tag_backend(repo_path=repo.path, mode="local"), LocalGitTagBackend)
+
+
+def test_api_cache_path_is_relative_to_the_repository_or_disabled(repo, monkeypatch):
+    monkeypatch.setenv("MODULES_CONFIG_TAG_CACHE", "cache/tags.json")
+    assert select_tag_backend(repo_path=repo.path, mode="api").cache.path == os.path.join(repo.path, "cache", "tags.json")
+
+    monkeypatch.setenv("MODULES_CONFIG_TAG_CACHE", "")
+    assert select_tag_backend(repo_path=repo.path, mode="api").cache is None
+
+
+def test_batch_targets_share_a_client_per_host(repo, tmp_path, monkeypatch):
+    clients = []
+    monkeypatch.setattr(GithubApiTagBackend, "build_github_client", classmethod(lambda cls, base_url, pool_size: clients.append(base_url) or object()))
+    runner = BatchRunner([])
+    targets = [{"repository": f"org/repo{index}", "path": str(tmp_path / f"repo{index}"), "tag_backend": "api"} for index in range(3)]
+
+    backends = [runner.get_tag_backend(target) for target in targets]
+    assert clients == [None]
+    assert len(set(id(backend.github_client) for backend in backends)) == 1
+    assert isinstance(runner.get_tag_backend({"repository": "org/repo", "path": repo.path}), LocalGitTagBackend)
+    assert clients == [None]
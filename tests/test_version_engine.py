@@ -0,0 +1,113 @@
+import json
+
+import pytest
+
+from scripts.module_classifier import ModuleClassifier
+from scripts.modules_config import ModulesConfig
+from scripts.tag_backends import LocalGitTagBackend
+from scripts.version_engine import VersionEngine
+
+
+@pytest.mark.parametrize("message, level", [
+    ("feat: add an output", "minor"),
+    ("feat(network): add an output", "minor"),
+    ("Feat: add an output", "minor"),
+    ("fix: correct a default", "patch"),
+    ("chore: tidy up", "patch"),
+    ("not a conventional commit", "patch"),
+    ("feat!: drop a variable", "major"),
+    ("fix(api)!: rename an output", "major"),
+    ("fix: rename an output\n\nBREAKING CHANGE: the output is renamed", "major"),
+    ("fix: rename an output\n\nBREAKING-CHANGE: the output is renamed", "major"),
+    ("feat: mention BREAKING CHANGE: in the subject only", "minor"),
+    ("feat: add an output +semver: patch", "patch"),
+    ("fix: correct a default\n\n+semver: major", "major"),
+    ("fix: correct a default +semver: breaking", "major"),
+    ("fix: correct a default +semver: feature", "minor"),
+    ("docs: readme +semver: none", "none"),
+    ("docs: readme +semver: skip", "none"),
+])
+def test_commit_message_bump_levels(message, level):
+    assert VersionEngine().classify_message(message) == level
+
+
+def make_engine(repo):
+    return VersionEngine(ModuleClassifier(repo_path=repo.path), repo_path=repo.path)
+
+
+def build_history(repo):
+    repo.write("modules/module1/main.tf", "# 1\n")
+    repo.write("modules/module2/main.tf", "# 1\n")
+    repo.write("modules/module3/main.tf", "# 1\n")
+    repo.commit("feat!: first release")
+    repo.run_git("tag", "module1-1.0.0")
+    repo.run_git("tag", "module2-0.1.0")
+
+
+def test_bump_levels_since_each_modules_tag(repo):
+    build_history(repo)
+    repo.write("modules/module1/main.tf", "# 2\n")
+    repo.commit("fix: module1 default")
+    repo.write("modules/module1/main.tf", "# 3\n")
+    repo.write("modules/module2/main.tf", "# 2\n")
+    repo.commit("feat: module1 and module2 output")
+    repo.write("modules/module3/main.tf", "# 2\n")
+    repo.commit("docs: module3 readme")
+
+    levels = make_engine(repo).get_bump_levels({"module1": "module1-1.0.0", "module2": "module2-0.1.0", "module3": None})
+    # module3 was never tagged, so its whole history counts, including the breaking first commit
+    assert levels == {"module1": "minor", "module2": "minor", "module3": "major"}
+
+
+def test_commits_before_a_later_tag_are_released(repo):
+    build_history(repo)
+    repo.write("modules/module1/main.tf", "# 2\n")
+    repo.commit("feat!: module1 breaking change")
+    repo.run_git("tag", "module1-2.0.0")
+    repo.write("modules/module1/main.tf", "# 3\n")
+    repo.commit("fix: module1 default")
+
+    assert make_engine(repo).get_bump_levels({"module1": "module1-2.0.0"}) == {"module1": "patch"}
+
+
+def test_module_without_commits_since_its_tag_gets_the_default_bump(repo):
+    build_history(repo)
+    repo.write("modules/module2/main.tf", "# 2\n")
+    repo.commit("feat!: module2 only")
+
+    assert make_engine(repo).get_bump_levels({"module1": "module1-1.0.0"}) == {"module1": VersionEngine.default_bump}
+
+
+def test_tag_missing_locally_walks_the_whole_history(repo):
+    build_history(repo)
+    repo.write("modules/module1/main.tf", "# 2\n")
+    repo.commit("fix: module1 default")
+
+    assert make_engine(repo).get_bump_levels({"module1": "module1-9.9.9"}) == {"module1": "major"}
+
+
+def test_bump_levels_up_to_a_given_head(repo):
+    build_history(repo)
+    repo.write("modules/module1/main.tf", "# 2\n")
+    head = repo.commit("fix: module1 default")
+    repo.write("modules/module1/main.tf", "# 3\n")
+    repo.commit("feat: module1 output")
+
+    assert make_engine(repo).get_bump_levels({"module1": "module1-1.0.0"}, head) == {"module1": "patch"}
+
+
+def test_next_versions_from_the_local_tags(repo, monkeypatch):
+    build_history(repo)
+    repo.write("modules/module1/main.tf", "# 2\n")
+    repo.write("modules/module3/main.tf", "# 2\n")
+    repo.commit("feat: module1 and module3 output")
+    monkeypatch.setenv("MODULES_CONFIG_RESULT_CACHE", "")
+    monkeypatch.chdir(repo.path)
+    app = ModulesConfig(tag_backend=LocalGitTagBackend(repo.path), repo_path=repo.path)
+
+    modules = json.loads(app.build_modules_config("modules/module1/main.tf modules/module3/main.tf", "MODULES_CONFIG"))
+    versions = dict((module["module"], module["versions"]) for module in modules)
+    assert versions["module1"]["current"] == "1.0.0"
+    assert versions["module1"]["next"] == "1.1.0"
+    assert versions["module3"]["current"] == "0.0.0"
+    assert versions["module3"]["next"] == "1.0.0"
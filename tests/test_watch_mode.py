@@ -0,0 +1,87 @@
+from scripts.instrumentation import Metrics
+from scripts.modules_config import ModulesConfig
+from scripts.watch_mode import ModulesWatcher
+
+
+def build_modules(repo):
+    repo.write("modules/module1/main.tf", "# 1\n")
+    repo.write("modules/module1/tests/unit/test.py")
+    repo.write("modules/module2/main.tf", "# 1\n")
+    repo.write("modules/module2/tests/unit/test.py")
+    repo.commit("base")
+
+
+def make_watcher(repo):
+    return ModulesWatcher(lambda: ModulesConfig([], metrics=Metrics(path=""), repo_path=repo.path), state_path="", socket_path="")
+
+
+def get_jobs(watcher):
+    matrix = watcher.answer("matrix")
+    return sorted((include["module"], include["test"]) for include in matrix["include"]) if matrix else []
+
+
+def record_passes(watcher):
+    """
+    Record every suite of the current matrix as passed, as the matrix jobs would
+    """
+    app = watcher.app
+    fingerprints = app.get_fingerprints(watcher.answer("modules"))
+    for module, test in get_jobs(watcher):
+        app.result_cache.record(fingerprints[module], module, test)
+
+
+def test_changed_modules_and_matrix(repo):
+    build_modules(repo)
+    watcher = make_watcher(repo)
+
+    assert watcher.poll()
+    assert watcher.answer("modules") == []
+    repo.write("modules/module1/main.tf", "# 2\n")
+    assert watcher.poll()
+    assert watcher.answer("modules") == ["module1"]
+    assert get_jobs(watcher) == [("module1", "unit")]
+    assert not watcher.poll()
+
+
+def test_edit_after_the_suites_passed_runs_them_again(repo):
+    build_modules(repo)
+    repo.write("modules/module1/main.tf", "# 2\n")
+    watcher = make_watcher(repo)
+    watcher.poll()
+    record_passes(watcher)
+    watcher.answer("refresh")
+    assert watcher.poll()
+    assert get_jobs(watcher) == []
+
+    # module1 already differs from the base, so its changed files stay the same, but not its content
+    repo.write("modules/module1/main.tf", "# 3 with a different size\n")
+    assert watcher.poll()
+    assert watcher.answer("modules") == ["module1"]
+    assert get_jobs(watcher) == [("module1", "unit")]
+
+
+def test_edit_back_to_a_passed_content_skips_the_suites_again(repo):
+    build_modules(repo)
+    repo.write("modules/module1/main.tf", "# 2\n")
+    watcher = make_watcher(repo)
+    watcher.poll()
+    record_passes(watcher)
+    repo.write("modules/module1/main.tf", "# 3 with a different size\n")
+    assert watcher.poll()
+    assert get_jobs(watcher) == [("module1", "unit")]
+
+    repo.write("modules/module1/main.tf", "# 2\n")
+    assert watcher.poll()
+    assert get_jobs(watcher) == []
+
+
+def test_commit_is_seen(repo):
+    build_modules(repo)
+    repo.write("modules/module2/main.tf", "# 2\n")
+    watcher = make_watcher(repo)
+    watcher.poll()
+    assert watcher.answer("modules") == ["module2"]
+
+    repo.commit("module2")
+    assert watcher.poll()
+    assert watcher.answer("modules") == []